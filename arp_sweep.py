@@ -0,0 +1,216 @@
+"""
+ARP sweep backend.
+
+On a directly attached IPv4 network every host has to answer ARP, even
+when it drops ICMP. This backend broadcasts one ARP request per address
+from an AF_PACKET socket and reads the replies off the same socket, so a
+single pass gives both the live addresses and their MAC addresses.
+Linux only, and it needs root (CAP_NET_RAW).
+"""
+
+#for raw packet sockets
+import socket
+#for packing frames
+import struct
+#for waiting on replies
+import select
+#for send pacing and reply timeouts
+import time
+#for address arithmetic
+import ipaddress
+#for telling a full transmit queue from real send errors
+import errno
+
+from ratelimit import TokenBucket
+from interfaces import inventory
+
+ETH_P_ARP = 0x0806
+ETH_P_IP = 0x0800
+ARP_REQUEST = 1
+ARP_REPLY = 2
+BROADCAST_MAC = b"\xff" * 6
+
+# Seconds to keep listening after the last request of a pass
+ARP_TIMEOUT = 1.0
+# Requests per second; a whole-segment broadcast storm is unkind to switches
+ARP_RATE = 5000
+# Extra passes over addresses that haven't answered yet
+ARP_RETRIES = 1
+# Requests sent between reads of the socket
+SEND_BURST = 64
+
+
+def find_interface(network):
+    """
+    Returns (interface name, local ipv4 interface, mac bytes) for the
+    interface the network is directly attached to, or None.
+    """
+    if network.version != 4:
+        return None
+    address = inventory.attached(network)
+    if address is None or not address.mac:
+        return None
+    return address.name, address.interface, bytes.fromhex(address.mac.replace(":", ""))
+
+
+def format_mac(raw):
+    """MAC bytes in the upper-case, colon separated form the neighbor table uses"""
+    return ":".join(f"{octet:02X}" for octet in raw)
+
+
+def build_arp_request(src_mac, src_ip):
+    """
+    Returns the request frame up to the target address; append the
+    target's 4 address bytes (and padding) to get a full frame.
+    """
+    ethernet = BROADCAST_MAC + src_mac + struct.pack("!H", ETH_P_ARP)
+    arp = struct.pack("!HHBBH", 1, ETH_P_IP, 6, 4, ARP_REQUEST) + src_mac + socket.inet_aton(src_ip) + b"\x00" * 6
+    return ethernet + arp
+
+
+# Ethernet frames are at least 60 bytes before the checksum
+FRAME_PADDING = b"\x00" * 18
+
+
+def parse_arp_reply(frame):
+    """
+    Returns (sender ip, sender mac) from an ARP reply frame, or None for
+    anything else.
+    """
+    if len(frame) < 42 or frame[12:14] != b"\x08\x06":
+        return None
+    if struct.unpack("!H", frame[20:22])[0] != ARP_REPLY:
+        return None
+    return socket.inet_ntoa(frame[28:32]), format_mac(frame[22:28])
+
+
+class ArpSweeper:
+    """
+    Sends ARP requests for many addresses and collects the replies.
+    """
+
+    def __init__(self, interface, local, mac, timeout=ARP_TIMEOUT, rate=ARP_RATE):
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ARP))
+        self.sock.bind((interface, ETH_P_ARP))
+        self.sock.setblocking(False)
+        self.local = local
+        self.timeout = timeout
+        self.rate = rate
+        self.mac = format_mac(mac)
+        self.prefix = build_arp_request(mac, str(local.ip))
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def receive(self, wait, wanted, answered):
+        """
+        Reads replies for up to `wait` seconds (or until none are queued,
+        for 0) and returns the new (ip, mac) pairs among `wanted`.
+        """
+        found = []
+        readable, _, _ = select.select([self.sock], [], [], wait)
+        while readable:
+            try:
+                frame = self.sock.recv(128)
+            except BlockingIOError:
+                break
+            reply = parse_arp_reply(frame)
+            if reply and reply[0] not in answered:
+                value = int(ipaddress.IPv4Address(reply[0]))
+                if value in wanted:
+                    answered[reply[0]] = reply[1]
+                    found.append(reply)
+        return found
+
+    def iter_sweep(self, addresses, retries=ARP_RETRIES, cancel=None):
+        """
+        Sweeps the addresses and yields (requests sent, [(ip, mac), ...])
+        as the pass goes. Each address counts as sent once, however many
+        passes it took. Addresses are retried `retries` times if they
+        haven't answered.
+        """
+        wanted = {int(ipaddress.IPv4Address(ip)) for ip in addresses}
+        answered = {}
+        # This machine doesn't answer its own requests; report it directly
+        if int(self.local.ip) in wanted:
+            wanted.discard(int(self.local.ip))
+            answered[str(self.local.ip)] = self.mac
+            yield 1, [(str(self.local.ip), self.mac)]
+        bucket = TokenBucket(self.rate) if self.rate else None
+        targets = sorted(wanted)
+        for attempt in range(retries + 1):
+            first_pass = attempt == 0
+            index = 0
+            while index < len(targets):
+                if cancel and cancel.is_set():
+                    return
+                sent = 0
+                wait = 0
+                while sent < SEND_BURST and index < len(targets):
+                    if bucket:
+                        wait = bucket.try_take()
+                        if wait:
+                            break
+                    frame = self.prefix + targets[index].to_bytes(4, "big") + FRAME_PADDING
+                    try:
+                        self.sock.send(frame)
+                    except OSError as e:
+                        if not isinstance(e, BlockingIOError) and e.errno != errno.ENOBUFS:
+                            raise
+                        # Transmit queue full; back off and retry the same address
+                        wait = 0.001
+                        break
+                    index += 1
+                    sent += 1
+                found = self.receive(wait, wanted, answered)
+                if (sent and first_pass) or found:
+                    yield (sent if first_pass else 0), found
+            # Listen for stragglers, then retry whoever hasn't answered
+            deadline = time.monotonic() + self.timeout
+            while True:
+                if cancel and cancel.is_set():
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                found = self.receive(min(remaining, 0.2), wanted, answered)
+                if found:
+                    yield 0, found
+            answered_values = {int(ipaddress.IPv4Address(ip)) for ip in answered}
+            targets = [value for value in targets if value not in answered_values]
+            if not targets:
+                return
+
+
+def open_arp_sweeper(network, timeout=ARP_TIMEOUT, rate=ARP_RATE):
+    """
+    Returns an ArpSweeper on the interface the network is attached to.
+    Raises ValueError if it isn't directly attached, and OSError (usually
+    PermissionError) if the packet socket can't be opened.
+    """
+    found = find_interface(network)
+    if found is None:
+        raise ValueError(f"{network} is not on a directly attached network; ARP sweep needs a local segment")
+    return ArpSweeper(*found, timeout=timeout, rate=rate)
+
+
+def iter_arp_sweep(network, timeout=ARP_TIMEOUT, rate=ARP_RATE, retries=ARP_RETRIES, cancel=None):
+    """
+    ARP sweeps the hosts of a network and yields
+    (addresses done, [(ip, mac), ...]) as replies come in.
+    """
+    with open_arp_sweeper(network, timeout, rate) as sweeper:
+        yield from sweeper.iter_sweep(network.hosts(), retries, cancel)
+
+
+def arp_sweep(network, timeout=ARP_TIMEOUT, rate=ARP_RATE):
+    """
+    ARP sweeps the network and returns {ip: mac} for every host that answered.
+    """
+    return {ip: mac for _, found in iter_arp_sweep(network, timeout, rate) for ip, mac in found}
@@ -0,0 +1,251 @@
+"""
+Scan throughput benchmark.
+
+Runs each scan engine against a simulated network, so the numbers are
+repeatable and need no network access or privileges. The simulated
+network decides, from a seed, which addresses are alive, how long each
+takes to answer and which replies get lost.
+
+Usage: python bench.py [--prefix 16] [--density 0.05] [--rtt-ms 5]
+                       [--jitter 0.5] [--loss 0.01] [--timeout 1.0]
+                       [--engines async,sharded] [--workers 4] [--seed 1]
+
+Engines:
+  async    probe_hosts: one asyncio event loop (the default scan path)
+  sharded  iter_scan_sharded: the network split over --workers processes
+  threads  blocking probes on a thread pool, like the original scanner
+           (slow on big networks; try --prefix 20)
+"""
+
+#for command-line options
+import argparse
+#for the simulated replies
+import asyncio
+import random
+import math
+#for addresses
+import ipaddress
+#for timing
+import time
+#for the thread pool engine and the resource sampler
+import threading
+import concurrent.futures
+#for isolating each engine in its own process
+import multiprocessing
+#for a prober factory the shard workers can unpickle
+import functools
+#for peak memory
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import netscan
+
+# Simulated networks live here; nothing is ever sent to them
+BENCH_NETWORK = "10.0.0.0"
+# Thread pool size of the threads engine
+BENCH_THREADS = 100
+# Seconds between thread count samples
+SAMPLE_INTERVAL = 0.01
+
+
+class SimulatedNetwork:
+    """
+    Seeded model of a network. Every address gets a fixed fate: alive or
+    not, its round-trip time (log-normal around rtt with `jitter` spread),
+    and whether its reply is lost.
+    """
+
+    def __init__(self, density=0.05, rtt=0.005, jitter=0.5, loss=0.01, seed=1):
+        self.density = density
+        self.rtt = rtt
+        self.jitter = jitter
+        self.loss = loss
+        self.seed = seed
+
+    def host(self, ip):
+        """Returns the reply delay in seconds for ip, or None if it never answers"""
+        rng = random.Random(self.seed * 4294967311 + int(ipaddress.ip_address(ip)))
+        if rng.random() >= self.density or rng.random() < self.loss:
+            return None
+        return self.rtt * math.exp(self.jitter * rng.gauss(0, 1))
+
+    def expected(self, network, timeout):
+        """How many hosts a perfect scan with this timeout would find"""
+        return sum(1 for ip in network.hosts() if (delay := self.host(ip)) is not None and delay < timeout)
+
+
+class SimulatedProber:
+    """Probe backend that answers from a SimulatedNetwork instead of the wire"""
+
+    def __init__(self, network, timeout):
+        self.network = network
+        self.timeout = timeout
+
+    async def probe(self, ip, timeout=None):
+        timeout = timeout or self.timeout
+        delay = self.network.host(ip)
+        if delay is None or delay >= timeout:
+            await asyncio.sleep(timeout)
+            return False
+        await asyncio.sleep(delay)
+        return True
+
+    def probe_blocking(self, ip):
+        delay = self.network.host(ip)
+        time.sleep(self.timeout if delay is None or delay >= self.timeout else delay)
+        return ip if delay is not None and delay < self.timeout else None
+
+    def close(self):
+        pass
+
+
+def simulated_prober(network, timeout, scan_timeout):
+    """register_prober factory; module level so sharded scans can send it to their workers"""
+    return SimulatedProber(network, timeout)
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def peak_rss_mb(who):
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / 1024 / (1024 if peak > 1 << 32 else 1), 1)
+
+
+def thread_count():
+    """Threads of this process as the OS sees them (incl. event loop and pool threads)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("Threads:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return threading.active_count()
+
+
+def iter_engine(engine, network, options):
+    """Yields the online hosts one engine finds, as it finds them"""
+    if engine == "async":
+        return netscan.iter_scan(network, "simulated")
+    if engine == "sharded":
+        return netscan.iter_scan_sharded(network, options.workers, "simulated")
+    if engine == "threads":
+        return iter_threads(network, options)
+    raise ValueError(f"Unknown engine: {engine}")
+
+
+def iter_threads(network, options):
+    prober = SimulatedProber(simulated_network(options), options.timeout)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=BENCH_THREADS) as executor:
+        futures = [executor.submit(prober.probe_blocking, ip) for ip in network.hosts()]
+        for future in concurrent.futures.as_completed(futures):
+            if future.result():
+                yield future.result()
+
+
+def simulated_network(options):
+    return SimulatedNetwork(options.density, options.rtt_ms / 1000, options.jitter, options.loss, options.seed)
+
+
+def run_engine(engine, options, results):
+    """Runs one engine in this (fresh) process and puts its measurements on `results`"""
+    network = ipaddress.ip_network(f"{BENCH_NETWORK}/{options.prefix}")
+    model = simulated_network(options)
+    netscan.register_prober("simulated", functools.partial(simulated_prober, model, options.timeout))
+    # Spawned workers are this process's own children, so RUSAGE_CHILDREN sees their memory
+    # (a forkserver's workers are its children, not ours)
+    netscan.WORKER_START_METHOD = "spawn"
+
+    peak_threads = thread_count()
+    sampling = threading.Event()
+
+    def sample():
+        nonlocal peak_threads
+        while not sampling.wait(SAMPLE_INTERVAL):
+            peak_threads = max(peak_threads, thread_count() - 1)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    arrivals = []
+    start = time.perf_counter()
+    for _ in iter_engine(engine, network, options):
+        arrivals.append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - start
+    sampling.set()
+    sampler.join()
+
+    addresses = network.num_addresses - 2
+    results.put({
+        "engine": engine,
+        "seconds": round(elapsed, 2),
+        "hosts_per_sec": round(addresses / elapsed),
+        "found": len(arrivals),
+        "first": round(arrivals[0], 3) if arrivals else None,
+        "p50": round(percentile(arrivals, 50), 3) if arrivals else None,
+        "p99": round(percentile(arrivals, 99), 3) if arrivals else None,
+        "peak_rss_mb": peak_rss_mb(resource.RUSAGE_SELF) if resource else None,
+        "worker_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN) if resource and engine == "sharded" else None,
+        "peak_threads": peak_threads,
+    })
+
+
+def benchmark(options):
+    """Runs every requested engine in its own process and returns their measurements"""
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+    measurements = []
+    for engine in options.engines:
+        results = context.Queue()
+        process = context.Process(target=run_engine, args=(engine, options, results))
+        process.start()
+        measurements.append(results.get())
+        process.join()
+    return measurements
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark the scan engines against a simulated network.")
+    parser.add_argument("--prefix", type=int, default=16, help="size of the simulated network (default /16)")
+    parser.add_argument("--density", type=float, default=0.05, help="fraction of addresses that are alive")
+    parser.add_argument("--rtt-ms", type=float, default=5.0, help="median round-trip time in milliseconds")
+    parser.add_argument("--jitter", type=float, default=0.5, help="log-normal spread of round-trip times")
+    parser.add_argument("--loss", type=float, default=0.01, help="fraction of live hosts whose reply is lost")
+    parser.add_argument("--timeout", type=float, default=netscan.DEFAULT_TIMEOUT, help="probe timeout in seconds")
+    parser.add_argument("--engines", default="async,sharded", help="comma-separated: async, sharded, threads")
+    parser.add_argument("--workers", type=int, default=4, help="processes for the sharded engine")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the simulated network")
+    options = parser.parse_args(args)
+    options.engines = [engine.strip() for engine in options.engines.split(",") if engine.strip()]
+    for engine in options.engines:
+        if engine not in ("async", "sharded", "threads"):
+            parser.error(f"unknown engine: {engine}")
+    return options
+
+
+def main(args=None):
+    options = parse_args(args)
+    network = ipaddress.ip_network(f"{BENCH_NETWORK}/{options.prefix}")
+    expected = simulated_network(options).expected(network, options.timeout)
+    print(f"Simulated {network}: {network.num_addresses - 2} addresses, {expected} answering, "
+          f"median RTT {options.rtt_ms}ms, loss {options.loss:.0%}, seed {options.seed}\n")
+    columns = ["engine", "seconds", "hosts_per_sec", "found", "recall", "first", "p50", "p99",
+               "peak_rss_mb", "worker_rss_mb", "peak_threads"]
+    print("  ".join(f"{column:>13}" for column in columns))
+    for measurement in benchmark(options):
+        measurement["recall"] = f"{measurement['found'] / expected:.1%}" if expected else None
+        print("  ".join(f"{'-' if measurement[c] is None else measurement[c]!s:>13}" for c in columns))
+    print("\nrecall: hosts found out of those answering within the timeout; adaptive timeouts must not lower it")
+    print("first/p50/p99: seconds from scan start until the first / median / 99th percentile host was reported")
+
+
+if __name__ == "__main__":
+    main()
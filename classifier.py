@@ -0,0 +1,250 @@
+"""
+Device type classifier.
+
+All classification rules live in one declarative table. The keywords of
+each field are compiled into a single trie-shaped regex, so a host is
+classified with one regex pass over its hostname and one over its vendor,
+however many rules there are, and fields whose rules can't beat a match
+already found aren't looked at.
+
+python classifier.py benchmarks it against the chained keyword checks it
+replaced.
+"""
+
+#for regular expressions
+import re
+
+# Rules in priority order: the first rule that matches wins.
+# Each rule matches on exactly one field:
+#   "ip":       set of last octets
+#   "vendor":   substrings of the lower-cased vendor name
+#   "hostname": substrings of the lower-cased hostname
+#   "ports":    set of open TCP ports (any one is enough)
+# "refine" rules are only tried once their parent rule has matched.
+RULES = [
+    {"ip": {1, 254}, "type": '🌐 Router/Gateway'},
+
+    {"vendor": ['cisco', 'netgear', 'tp-link', 'linksys', 'd-link', 'asus'], "type": '📡 Network Equipment'},
+    {"vendor": ['apple'], "type": '🍎 Apple Device', "refine": [
+        {"hostname": ['iphone', 'ipad', 'ipod'], "type": '📱 Mobile Device (iOS)'},
+        {"hostname": ['macbook', 'imac', 'mac'], "type": '💻 Computer (Mac)'},
+    ]},
+    {"vendor": ['raspberry'], "type": '🥧 Raspberry Pi'},
+    {"vendor": ['vmware', 'virtualbox', 'qemu', 'parallels', 'hyper-v'], "type": '🖥️ Virtual Machine'},
+    {"vendor": ['western digital', 'wd', 'synology', 'qnap'], "type": '💾 Network Storage'},
+
+    {"hostname": ['router', 'gateway', 'modem'], "type": '🌐 Router/Gateway'},
+    {"hostname": ['printer', 'print', 'hp-', 'canon-', 'epson-'], "type": '🖨️ Printer'},
+    {"hostname": ['camera', 'cam', 'security', 'nvr', 'dvr'], "type": '📹 Security Camera'},
+    {"hostname": ['tv', 'roku', 'chromecast', 'firestick', 'appletv'], "type": '📺 Smart TV/Streaming'},
+    {"hostname": ['phone', 'mobile', 'android', 'iphone', 'samsung'], "type": '📱 Mobile Device'},
+    {"hostname": ['laptop', 'desktop', 'pc', 'computer', 'workstation'], "type": '💻 Computer'},
+    {"hostname": ['server', 'srv', 'nas', 'storage'], "type": '🖥️ Server'},
+    {"hostname": ['switch', 'hub', 'access-point', 'ap-'], "type": '📡 Network Equipment'},
+    {"hostname": ['iot', 'smart', 'alexa', 'google-home', 'nest'], "type": '🏠 Smart Home Device'},
+    {"hostname": ['win', 'windows'], "type": '💻 Windows Computer'},
+    {"hostname": ['mac', 'apple'], "type": '💻 Mac Computer'},
+    {"hostname": ['ubuntu', 'linux'], "type": '💻 Linux Computer'},
+
+    {"ports": {9100, 515, 631}, "type": '🖨️ Printer'},
+    {"ports": {554, 8554}, "type": '📹 Security Camera'},
+    {"ports": {8008, 8009}, "type": '📺 Smart TV/Streaming'},
+    {"ports": {3389, 445, 139}, "type": '💻 Windows Computer'},
+    {"ports": {548, 62078}, "type": '🍎 Apple Device'},
+    {"ports": {161, 179}, "type": '📡 Network Equipment'},
+    {"ports": {22}, "type": '🖥️ Server'},
+]
+
+KEYWORD_FIELDS = ("hostname", "vendor")
+
+UNKNOWN_VALUES = ('Unknown', 'Unknown Vendor', None)
+
+
+def keyword_pattern(keywords):
+    """
+    A regex matching any of the keywords, built as a trie so common prefixes
+    are tested once: each position of the text costs about one character
+    test rather than one per keyword. Where one keyword is a prefix of
+    another, the longer one matches.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        pattern = "(?:" + "|".join(branches) + ")"
+        return pattern + "?" if "" in node else pattern
+
+    return build(trie)
+
+
+def compile_keywords(rules, field):
+    """
+    Compiles the keyword lists of every rule on `field` into one regex.
+    A match is the longest keyword starting at its position, so each keyword
+    maps to the best rule of any keyword it contains ('appletv' also
+    counts as 'apple').
+    Returns (pattern, {keyword: rule index}), or (None, {}) if no rule uses the field.
+    """
+    rule_of = {}
+    for index, rule in enumerate(rules):
+        for keyword in rule.get(field, ()):
+            rule_of.setdefault(keyword, index)
+    if not rule_of:
+        return None, {}
+    best = {keyword: min(index for other, index in rule_of.items() if other in keyword) for keyword in rule_of}
+    return re.compile(keyword_pattern(rule_of)), best
+
+
+class Classifier:
+    """
+    A rule table compiled for fast matching.
+    """
+
+    def __init__(self, rules=RULES, default=None):
+        self.rules = rules
+        self.default = default or default_by_octet
+        self.patterns = {field: compile_keywords(rules, field) for field in KEYWORD_FIELDS}
+        self.ip_rules = [(i, r["ip"]) for i, r in enumerate(rules) if "ip" in r]
+        self.port_rules = [(i, r["ports"]) for i, r in enumerate(rules) if "ports" in r]
+        # The first rule index of each field, to skip fields that can't win
+        self.first_rule = {field: min((i for i, r in enumerate(rules) if field in r), default=len(rules))
+                           for field in KEYWORD_FIELDS + ("ip", "ports")}
+        self.refiners = {i: Classifier(r["refine"], default=lambda octet: None)
+                         for i, r in enumerate(rules) if "refine" in r}
+        # Vendor names come from the bounded OUI registry and repeat a lot
+        self.vendor_rules = {}
+
+    def _best_match(self, field, text, best):
+        """The lowest rule index below `best` whose keywords occur in text, else best"""
+        pattern, keywords = self.patterns[field]
+        if pattern is None or not text or self.first_rule[field] >= best:
+            return best
+        for m in pattern.finditer(text):
+            best = min(best, keywords[m.group()])
+            # Matches don't overlap, so look for keywords starting inside this one too;
+            # matches are rare, so this costs next to nothing
+            for start in range(m.start() + 1, m.end()):
+                inner = pattern.match(text, start)
+                if inner:
+                    best = min(best, keywords[inner.group()])
+        return best
+
+    def classify(self, ip, hostname='Unknown', vendor='Unknown', ports=()):
+        """
+        Returns the device type for one host.
+        """
+        hostname = '' if hostname in UNKNOWN_VALUES else hostname.lower()
+        vendor = '' if vendor in UNKNOWN_VALUES else vendor.lower()
+        octet = last_octet(ip)
+        return self._classify(octet, hostname, vendor, frozenset(ports or ()))
+
+    def _classify(self, octet, hostname, vendor, ports):
+        best = len(self.rules)
+        for index, octets in self.ip_rules:
+            if index < best and octet in octets:
+                best = index
+        if vendor and self.first_rule["vendor"] < best:
+            rule = self.vendor_rules.get(vendor)
+            if rule is None:
+                rule = self.vendor_rules[vendor] = self._best_match("vendor", vendor, len(self.rules))
+            best = min(best, rule)
+        best = self._best_match("hostname", hostname, best)
+        if ports and self.first_rule["ports"] < best:
+            for index, rule_ports in self.port_rules:
+                if index < best and not ports.isdisjoint(rule_ports):
+                    best = index
+        if best == len(self.rules):
+            return self.default(octet)
+        refiner = self.refiners.get(best)
+        if refiner:
+            refined = refiner._classify(octet, hostname, vendor, ports)
+            if refined:
+                return refined
+        return self.rules[best]["type"]
+
+    def classify_hosts(self, hosts):
+        """
+        Sets 'device_type' on every host dict in the list and returns the list.
+        Hosts with the same hostname, vendor, last octet and ports are only
+        classified once.
+        """
+        seen = {}
+        for host in hosts:
+            ports = host.get('open_ports')
+            key = (host['ip'].rpartition('.')[2], host.get('hostname'), host.get('vendor'),
+                   tuple(ports) if ports else None)
+            device_type = seen.get(key)
+            if device_type is None:
+                device_type = seen[key] = self.classify(host['ip'], key[1], key[2], ports)
+            host['device_type'] = device_type
+        return hosts
+
+
+def last_octet(ip):
+    """Last octet of a dotted IPv4 address, or 0 if there isn't one"""
+    tail = ip.rpartition('.')[2]
+    return int(tail) if tail.isdigit() else 0
+
+
+def default_by_octet(octet):
+    """Fallback guess based on common IP ranges"""
+    if octet < 50:
+        return '🌐 Network Infrastructure'
+    elif octet > 200:
+        return '📱 Mobile/Temporary Device'
+    else:
+        return '💻 Computer/Device'
+
+
+default_classifier = Classifier()
+classify = default_classifier.classify
+classify_hosts = default_classifier.classify_hosts
+
+
+def benchmark(count=100000):
+    """Times classify() and classify_hosts() on synthetic hosts against the old chained checks"""
+    import random
+    import time
+
+    def chained(ip, hostname, vendor):
+        # The per-category keyword scans the rule table replaced
+        hostname = hostname.lower() if hostname != 'Unknown' else ''
+        vendor = vendor.lower() if vendor != 'Unknown Vendor' else ''
+        octet = last_octet(ip)
+        if octet in (1, 254):
+            return RULES[0]["type"]
+        for rule in RULES:
+            for field, text in (("vendor", vendor), ("hostname", hostname)):
+                if field in rule and any(keyword in text for keyword in rule[field]):
+                    for refine in rule.get("refine", ()):
+                        if any(keyword in text for keyword in refine.get("hostname", ())):
+                            return refine["type"]
+                    return rule["type"]
+        return default_by_octet(octet)
+
+    rng = random.Random(1)
+    vendors = ['Unknown Vendor', 'Intel Corporate', 'Apple, Inc.', 'Cisco Systems, Inc', 'Dell Inc.',
+               'Samsung Electronics Co.,Ltd', 'Raspberry Pi Trading Ltd', 'Hewlett Packard', 'VMware, Inc.']
+    words = ['host', 'node', 'dev', 'printer', 'office', 'lab', 'iphone', 'desktop', 'kitchen', 'nest', 'web']
+    hosts = [{"ip": f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}", "vendor": rng.choice(vendors),
+              "hostname": 'Unknown' if rng.random() < 0.4 else
+              f"{rng.choice(words)}-{rng.randrange(10000)}.corp.example.com"} for i in range(count)]
+
+    for name, run in (("chained keyword checks", lambda: [chained(h['ip'], h['hostname'], h['vendor'])
+                                                          for h in hosts]),
+                      ("classify", lambda: [classify(h['ip'], h['hostname'], h['vendor']) for h in hosts]),
+                      ("classify_hosts", lambda: classify_hosts(hosts))):
+        start = time.perf_counter()
+        run()
+        print(f"{name:>24}: {time.perf_counter() - start:.3f}s for {count} hosts")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,105 @@
+"""
+Push channel for live scan updates.
+
+run_scan publishes each host as it is found; every connected dashboard
+gets a Server-Sent Events stream that coalesces those into one message
+per interval, together with a progress snapshot.
+"""
+
+#for per-subscriber event queues
+import queue
+#for guarding the subscriber set
+import threading
+#for flush intervals
+import time
+#for encoding event payloads
+import json
+#for timing the encoding
+import metrics
+
+# How often buffered updates are flushed to a client, in seconds
+FLUSH_INTERVAL = 0.5
+
+JSON_SECONDS = metrics.stage_seconds("json")
+
+
+class EventHub:
+    """
+    Fans published events out to every subscriber's queue.
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self.lock = threading.Lock()
+
+    def subscribe(self):
+        subscriber = queue.SimpleQueue()
+        with self.lock:
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, kind, data=None):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.put((kind, data))
+
+
+def format_sse(event, data):
+    """Encodes one Server-Sent Events message"""
+    with JSON_SECONDS.time():
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def coalesced_stream(hub, snapshot, interval=FLUSH_INTERVAL):
+    """
+    Yields SSE messages for one client until the running scan finishes.
+    Hosts published during an interval go out together in one "hosts"
+    message, followed by one "progress" message built from snapshot(),
+    so a big scan sends a few messages a second rather than one per host.
+    The progress message also keeps idle connections alive.
+    """
+    subscriber = hub.subscribe()
+    try:
+        yield format_sse("progress", snapshot())
+        if not snapshot().get("running"):
+            yield format_sse("done", None)
+            return
+        hosts = []
+        finished = False
+        while not finished:
+            deadline = time.monotonic() + interval
+            while not finished:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    kind, data = subscriber.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if kind == "host":
+                    hosts.append(data)
+                elif kind == "done":
+                    finished = True
+            status = snapshot()
+            if not finished and not status.get("running"):
+                # The scan ended; pick up whatever is still queued
+                while True:
+                    try:
+                        kind, data = subscriber.get_nowait()
+                    except queue.Empty:
+                        break
+                    if kind == "host":
+                        hosts.append(data)
+                finished = True
+            if hosts:
+                yield format_sse("hosts", hosts)
+                hosts = []
+            yield format_sse("progress", status)
+        yield format_sse("done", None)
+    finally:
+        hub.unsubscribe(subscriber)
@@ -0,0 +1,79 @@
+"""
+Streamed scan exports.
+
+Each exporter is a generator of text chunks that reads the scan's hosts
+from the store a chunk at a time, so a Flask response can send a scan of
+any size without building the whole document in memory.
+"""
+
+#for the json and ndjson formats
+import json
+#for the csv format
+import csv
+import io
+
+CSV_COLUMNS = ["ip", "hostname", "mac_address", "vendor", "device_type", "open_ports", "liveness"]
+
+# Hosts per chunk of output
+EXPORT_CHUNK = 1000
+
+FORMATS = {
+    "json": ("application/json", "json"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+}
+
+
+def iter_chunks(hosts, size=EXPORT_CHUNK):
+    chunk = []
+    for host in hosts:
+        chunk.append(host)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def export_json(scan, hosts):
+    """
+    The same document as /api/results/<id>: the scan with its hosts
+    (none for scans that failed, which have hosts=None)
+    """
+    header = json.dumps(scan, indent=2)
+    if hosts is None:
+        yield header + "\n"
+        return
+    # Reopen the scan object to append the host list one chunk at a time
+    yield header[:-2] + ',\n  "hosts": ['
+    separator = "\n    "
+    for chunk in iter_chunks(hosts):
+        yield separator + ",\n    ".join(json.dumps(host) for host in chunk)
+        separator = ",\n    "
+    yield "\n  ]\n}\n"
+
+
+def export_ndjson(scan, hosts):
+    """The scan on the first line, then one host per line"""
+    yield json.dumps(scan) + "\n"
+    for chunk in iter_chunks(hosts or ()):
+        yield "".join(json.dumps(host) + "\n" for host in chunk)
+
+
+def export_csv(scan, hosts):
+    """One row per host; open ports are space separated"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for chunk in iter_chunks(hosts or ()):
+        for host in chunk:
+            row = dict(host, open_ports=" ".join(map(str, host.get("open_ports") or [])))
+            writer.writerow([row.get(column, "") for column in CSV_COLUMNS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+EXPORTERS = {"json": export_json, "ndjson": export_ndjson, "csv": export_csv}
@@ -0,0 +1,219 @@
+"""
+Columnar host records.
+
+A big scan's hosts as a handful of flat columns instead of one dict per
+host: addresses are integers in an array, and every text field is
+dictionary-encoded (each distinct value stored once, rows hold a 4-byte
+code), so the 'Unknown' that fills most rows costs nothing. Rows are
+read through small HostRecord views that behave like the host dicts the
+rest of the code passes around, and dicts are only built when a caller
+asks for them (for JSON, say).
+"""
+
+#for the integer columns
+from array import array
+#for lookups and range queries on sorted addresses
+import bisect
+#for converting addresses
+import ipaddress
+
+
+# Set on the row keys of IPv6 addresses, so a table can hold both versions
+# and every IPv4 address sorts before every IPv6 one
+V6_FLAG = 1 << 128
+
+
+def address_value(ip):
+    """The row key of an address given as a string or (IPv4) integer"""
+    if isinstance(ip, int):
+        return ip
+    address = ipaddress.ip_address(ip)
+    return int(address) if address.version == 4 else V6_FLAG | int(address)
+
+
+def key_address(key):
+    """The address a row key stands for"""
+    if key & V6_FLAG:
+        return ipaddress.IPv6Address(key ^ V6_FLAG)
+    return ipaddress.IPv4Address(key)
+
+
+class DictionaryColumn:
+    """One column of values stored as codes into a list of distinct values"""
+
+    __slots__ = ("values", "index", "codes")
+
+    def __init__(self):
+        self.values = []
+        self.index = {}
+        self.codes = array("I")
+
+    def encode(self, value):
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def append(self, value):
+        self.codes.append(self.encode(value))
+
+    def __getitem__(self, row):
+        return self.values[self.codes[row]]
+
+    def __setitem__(self, row, value):
+        self.codes[row] = self.encode(value)
+
+    def reorder(self, order):
+        self.codes = array("I", (self.codes[row] for row in order))
+
+
+class HostRecord:
+    """
+    View of one row of a HostTable. Supports record['ip'], record.get()
+    and assignment like a host dict, plus to_dict() for serialising.
+    """
+
+    __slots__ = ("table", "row")
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    @property
+    def ip_int(self):
+        return self.table.ips[self.row] & ~V6_FLAG
+
+    @property
+    def ip(self):
+        return str(key_address(self.table.ips[self.row]))
+
+    def __getitem__(self, field):
+        if field == "ip":
+            return self.ip
+        if field not in self.table.columns:
+            raise KeyError(field)
+        value = self.table.columns[field][self.row]
+        return list(value) if field == "open_ports" and value is not None else value
+
+    def get(self, field, default=None):
+        try:
+            value = self[field]
+        except KeyError:
+            return default
+        return default if value is None else value
+
+    def __setitem__(self, field, value):
+        if field == "open_ports" and value is not None:
+            value = tuple(value)
+        self.table.columns[field][self.row] = value
+
+    def to_dict(self):
+        """The host as the dict store.get_hosts returns"""
+        host = {"ip": self.ip}
+        for field in HostTable.FIELDS:
+            value = self[field]
+            if value is not None or field not in HostTable.OPTIONAL:
+                host[field] = value
+        return host
+
+    def __repr__(self):
+        return f"HostRecord({self.to_dict()!r})"
+
+
+class HostTable:
+    """
+    Columnar list of host records from one scan. Addresses are kept as row
+    keys (see address_value) in a 4-byte array until the first IPv6
+    address arrives. Rows are kept in the order they were added until
+    sort() puts them in address order (IPv4 first), which find() and
+    between() need.
+    """
+
+    FIELDS = ("hostname", "mac_address", "device_type", "vendor", "open_ports", "liveness")
+    # Left out of to_dict() when unset, like the store does
+    OPTIONAL = ("open_ports", "liveness")
+
+    def __init__(self, hosts=()):
+        self.ips = array("I")
+        self.columns = {field: DictionaryColumn() for field in self.FIELDS}
+        self.is_sorted = True
+        self.extend(hosts)
+
+    def __len__(self):
+        return len(self.ips)
+
+    def __getitem__(self, row):
+        if not -len(self) <= row < len(self):
+            raise IndexError(row)
+        return HostRecord(self, row % len(self))
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield HostRecord(self, row)
+
+    def add(self, ip_int, version=4, **fields):
+        """
+        Appends a host given its address as an integer. Fields left out are
+        None; open_ports is any iterable of ports.
+        """
+        if version == 6:
+            ip_int |= V6_FLAG
+            if isinstance(self.ips, array):
+                # 128-bit addresses don't fit an array; a list of ints still beats a list of strings
+                self.ips = list(self.ips)
+        if self.is_sorted and self.ips and ip_int < self.ips[-1]:
+            self.is_sorted = False
+        self.ips.append(ip_int)
+        ports = fields.get("open_ports")
+        fields["open_ports"] = tuple(ports) if ports is not None else None
+        for field, column in self.columns.items():
+            column.append(fields.get(field))
+
+    def append(self, host):
+        """Appends a host dict (or HostRecord)"""
+        address = ipaddress.ip_address(host["ip"])
+        self.add(int(address), address.version, **{field: host.get(field) for field in self.FIELDS})
+
+    def extend(self, hosts):
+        for host in hosts:
+            self.append(host)
+
+    def sort(self):
+        """Puts the rows in address order"""
+        if self.is_sorted:
+            return
+        order = sorted(range(len(self)), key=self.ips.__getitem__)
+        reordered = [self.ips[row] for row in order]
+        self.ips = array("I", reordered) if isinstance(self.ips, array) else reordered
+        for column in self.columns.values():
+            column.reorder(order)
+        self.is_sorted = True
+
+    def find(self, ip):
+        """The record for an address (string or integer), or None"""
+        value = address_value(ip)
+        self.sort()
+        row = bisect.bisect_left(self.ips, value)
+        if row < len(self) and self.ips[row] == value:
+            return HostRecord(self, row)
+        return None
+
+    def between(self, first, last):
+        """Records with addresses from first to last inclusive, in address order"""
+        self.sort()
+        start = bisect.bisect_left(self.ips, address_value(first))
+        end = bisect.bisect_right(self.ips, address_value(last))
+        return [HostRecord(self, row) for row in range(start, end)]
+
+    def addresses(self):
+        """The rows' addresses as ipaddress objects, in row order"""
+        return (key_address(key) for key in self.ips)
+
+    def ip_strings(self):
+        return [str(address) for address in self.addresses()]
+
+    def to_dicts(self):
+        """Yields every host as a dict; build the JSON from these only when it is needed"""
+        for record in self:
+            yield record.to_dict()
@@ -0,0 +1,186 @@
+"""
+Native ICMP echo sweep engine.
+
+Sends echo requests for a whole batch of addresses from one socket and
+matches the replies by identifier/sequence on the asyncio event loop,
+instead of forking a `ping` process for every host.
+"""
+
+#for networking and raw sockets
+import socket
+#for the event-loop driven prober
+import asyncio
+#for packing and unpacking icmp headers
+import struct
+#for the process id used in the echo identifier
+import os
+#for retrying sends when the kernel buffer is full
+import errno
+#for unique identifiers per prober in the same process
+import itertools
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+ICMP_HEADER = struct.Struct("!BBHHH")
+PAYLOAD = b"netscan-sweep"
+
+# Room for a burst of replies while the caller is busy sending
+RECEIVE_BUFFER = 4 * 1024 * 1024
+# Tries, and seconds between them, to send while the kernel buffer is full
+SEND_RETRIES = 50
+SEND_RETRY_WAIT = 0.01
+
+_ident_counter = itertools.count()
+
+
+def checksum(data):
+    """
+    Computes the RFC 1071 internet checksum of a byte string.
+    """
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def build_echo_request(ident, seq, payload=PAYLOAD):
+    """
+    Builds an ICMP echo request packet with a valid checksum.
+    """
+    header = ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    csum = checksum(header + payload)
+    return ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, csum, ident, seq) + payload
+
+
+def parse_echo_reply(packet, raw):
+    """
+    Parses a received packet and returns (identifier, sequence) for echo
+    replies, or None for anything else.
+    Raw sockets deliver the IP header too, datagram sockets do not.
+    """
+    if raw:
+        if len(packet) < 20:
+            return None
+        packet = packet[(packet[0] & 0x0F) * 4:]
+    if len(packet) < ICMP_HEADER.size:
+        return None
+    icmp_type, _code, _csum, ident, seq = ICMP_HEADER.unpack_from(packet)
+    if icmp_type != ICMP_ECHO_REPLY:
+        return None
+    return ident, seq
+
+
+def open_icmp_socket():
+    """
+    Opens an ICMP socket.
+    Tries the unprivileged datagram socket first (Linux/macOS when allowed by
+    net.ipv4.ping_group_range), then a raw socket (needs root/admin).
+    Returns (socket, is_raw). Raises OSError if neither can be opened.
+    """
+    try:
+        return socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP), False
+    except OSError:
+        pass
+    return socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP), True
+
+
+class AsyncIcmpProber:
+    """
+    Sends echo requests for many addresses from a single socket: each probe
+    is a coroutine that waits on a future, and one reader callback on the
+    event loop resolves them all.
+    """
+
+    def __init__(self, timeout=1.0):
+        self.timeout = timeout
+        self.sock, self.raw = open_icmp_socket()
+        self.sock.setblocking(False)
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+        except OSError:
+            pass
+        if self.raw:
+            self.ident = (os.getpid() + next(_ident_counter)) & 0xFFFF
+        else:
+            # The kernel rewrites the identifier to the socket's local port
+            self.sock.bind(("", 0))
+            self.ident = self.sock.getsockname()[1]
+        self.seq = 0
+        self.loop = asyncio.get_running_loop()
+        self.waiters = {}  # sequence -> (ip, future)
+        self.loop.add_reader(self.sock.fileno(), self._on_readable)
+
+    def close(self):
+        self.loop.remove_reader(self.sock.fileno())
+        self.sock.close()
+
+    async def send(self, ip):
+        """
+        Sends one echo request to ip and returns its sequence number,
+        or None if the packet could not be sent.
+        """
+        self.seq = seq = (self.seq + 1) & 0xFFFF
+        packet = build_echo_request(self.ident, seq)
+        for _ in range(SEND_RETRIES):
+            try:
+                self.sock.sendto(packet, (ip, 0))
+                return seq
+            except OSError as e:
+                if e.errno not in (errno.ENOBUFS, errno.EAGAIN, errno.EWOULDBLOCK):
+                    return None
+            # Kernel send buffer is full: let it drain while other probes and replies go on
+            await asyncio.sleep(SEND_RETRY_WAIT)
+        return None
+
+    def receive(self):
+        """
+        Reads every reply currently queued on the socket.
+        Returns a list of (source_ip, sequence) for our echo replies.
+        """
+        replies = []
+        while True:
+            try:
+                packet, addr = self.sock.recvfrom(1024)
+            except OSError:  # Includes BlockingIOError once the queue is empty
+                break
+            parsed = parse_echo_reply(packet, self.raw)
+            if parsed and parsed[0] == self.ident:
+                replies.append((addr[0], parsed[1]))
+        return replies
+
+    def _on_readable(self):
+        for source, seq in self.receive():
+            entry = self.waiters.get(seq)
+            if entry and entry[0] == source and not entry[1].done():
+                entry[1].set_result(True)
+
+    async def probe(self, ip, timeout=None):
+        """
+        Sends one echo request and returns True if the reply arrives before
+        the timeout (the prober's own unless one is given).
+        """
+        ip = str(ip)
+        seq = await self.send(ip)
+        if seq is None:
+            return False
+        future = self.loop.create_future()
+        self.waiters[seq] = (ip, future)
+        try:
+            return await asyncio.wait_for(future, timeout or self.timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiters.pop(seq, None)
+
+
+def open_async_prober(timeout=1.0):
+    """
+    Returns an AsyncIcmpProber bound to the running loop, or None if no
+    ICMP socket can be opened.
+    """
+    try:
+        return AsyncIcmpProber(timeout=timeout)
+    except OSError:
+        return None
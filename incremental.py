@@ -0,0 +1,157 @@
+"""
+Incremental rescans.
+
+Uses what earlier scans of the same network learned: hosts that were up
+last time are probed first with a short timeout, and addresses that have
+stayed dead for several runs are only probed every so often, on a growing
+backoff. The outcome is reported as a diff against the previous scan.
+"""
+
+#for address arithmetic
+import ipaddress
+#for joining the two probe passes
+import itertools
+
+from netscan import probe_hosts, host_range, DEFAULT_TIMEOUT, DEFAULT_CONCURRENCY
+from hosttable import HostTable
+
+# Timeout for hosts that answered last time; they are re-probed with the
+# normal timeout if they miss it
+SHORT_TIMEOUT = 0.3
+# Runs an address must stay dead before it starts being skipped
+DEAD_THRESHOLD = 3
+# Longest gap, in runs, between probes of a long-dead address
+MAX_SKIP = 32
+
+
+def backoff(dead_runs, threshold=DEAD_THRESHOLD, max_skip=MAX_SKIP):
+    """
+    Number of runs to skip an address after `dead_runs` misses in a row:
+    0 until the threshold, then 1, 2, 4, ... up to max_skip.
+    """
+    if dead_runs < threshold:
+        return 0
+    return min(2 ** (dead_runs - threshold), max_skip)
+
+
+def known(value):
+    return value not in (None, 'Unknown', 'Unknown Vendor')
+
+
+def diff_hosts(previous, current):
+    """
+    Compares two scans' hosts (HostTables or lists of host dicts) and returns
+    {"new": [...], "gone": [...], "changed": [...]}, each in IP order.
+    A MAC or hostname only counts as changed when both scans know it.
+    """
+    before = previous if isinstance(previous, HostTable) else HostTable(previous)
+    after = current if isinstance(current, HostTable) else HostTable(current)
+    before.sort()
+    after.sort()
+    new, gone, changed = [], [], []
+    # Walk both address columns in step, like a merge
+    i = j = 0
+    while i < len(before) or j < len(after):
+        if j == len(after) or (i < len(before) and before.ips[i] < after.ips[j]):
+            gone.append(before[i].ip)
+            i += 1
+        elif i == len(before) or after.ips[j] < before.ips[i]:
+            new.append(after[j].ip)
+            j += 1
+        else:
+            old_host, new_host = before[i], after[j]
+            changes = {}
+            for field in ('mac_address', 'hostname'):
+                old, new_value = old_host.get(field), new_host.get(field)
+                if known(old) and known(new_value) and old != new_value:
+                    changes[field] = {"from": old, "to": new_value}
+            if changes:
+                changed.append({"ip": new_host.ip, **changes})
+            i += 1
+            j += 1
+    return {"new": new, "gone": gone, "changed": changed}
+
+
+class IncrementalScan:
+    """
+    One incremental run over a network, backed by the scan store.
+    Call probe() to run the sweep, then commit() to save what was learned.
+    """
+
+    def __init__(self, store, network, threshold=DEAD_THRESHOLD, max_skip=MAX_SKIP):
+        self.store = store
+        self.network = network
+        self.key = str(network)
+        self.threshold = threshold
+        self.max_skip = max_skip
+        self.previous_scan = store.latest_scan(self.key)
+        self.previous_hosts = store.get_host_table(self.previous_scan['id']) if self.previous_scan else HostTable()
+        self.state = store.get_address_state(self.key)
+        self.run = store.next_run(self.key)
+        self.recent = [int(address) for address in self.previous_hosts.addresses()]  # In address order
+        self.alive = []
+        self.dead = []
+        self.skipped = 0
+
+    def due_addresses(self):
+        """Addresses that weren't up last time and aren't backed off this run"""
+        recent = set(self.recent)
+        first, last = host_range(self.network)
+        for value in range(first, last + 1):
+            if value in recent:
+                continue
+            entry = self.state.get(value)
+            if entry and entry[1] >= self.run:
+                self.skipped += 1
+                continue
+            yield value
+
+    def planned(self):
+        """Number of addresses this run will probe"""
+        first, last = host_range(self.network)
+        backed_off = sum(1 for value, (_, skip_until) in self.state.items()
+                         if skip_until >= self.run and first <= value <= last)
+        return last - first + 1 - backed_off
+
+    def probe(self, backend="auto", timeout=DEFAULT_TIMEOUT, short_timeout=SHORT_TIMEOUT,
+              concurrency=DEFAULT_CONCURRENCY, cancel=None, rate=None, budget=None):
+        """
+        Yields (ip, online) for every address probed this run.
+        Stops early once the optional cancel Event is set; rate caps the
+        probes sent per second and budget is an optional shared ProbeBudget.
+        """
+        address_class = ipaddress.IPv4Address if self.network.version == 4 else ipaddress.IPv6Address
+        missed = []
+        # Hosts that were up last time, with a short timeout
+        for ip, is_online in probe_hosts((address_class(v) for v in self.recent), backend, concurrency,
+                                          short_timeout, cancel, rate, budget=budget):
+            if is_online:
+                self._record(ip, True)
+                yield ip, True
+            else:
+                missed.append(ip)
+        # Everything else that is due, plus last run's hosts that missed the short timeout
+        addresses = (address_class(v) for v in self.due_addresses())
+        for ip, is_online in probe_hosts(itertools.chain(missed, addresses), backend, concurrency, timeout,
+                                         cancel, rate, budget=budget):
+            self._record(ip, is_online)
+            yield ip, is_online
+
+    def _record(self, ip, is_online):
+        value = int(ipaddress.ip_address(ip))
+        if is_online:
+            if value in self.state:
+                self.alive.append(value)
+            return
+        dead_runs = self.state.get(value, (0, 0))[0] + 1
+        self.dead.append((value, dead_runs, self.run + backoff(dead_runs, self.threshold, self.max_skip)))
+
+    def commit(self):
+        """Saves the liveness history for the next run"""
+        self.store.update_address_state(self.key, self.alive, self.dead, self.network.version)
+
+    def diff(self, current_hosts):
+        result = diff_hosts(self.previous_hosts, current_hosts)
+        result["previous_scan"] = self.previous_scan['id'] if self.previous_scan else None
+        result["skipped"] = self.skipped
+        return result
@@ -0,0 +1,274 @@
+"""
+Network interface inventory.
+
+Lists every interface with its addresses and prefixes without running
+any command: on Linux it asks the kernel over rtnetlink, and the result
+is cached until a netlink notification says an address or link changed.
+Other platforms fall back to the old ifconfig/ipconfig parsing, also
+cached.
+"""
+
+#for netlink and address conversion
+import socket
+#for parsing netlink messages
+import struct
+#for checking for change notifications without blocking
+import select
+#for address and prefix handling
+import ipaddress
+#for the interface picked by environment
+import os
+#for cache expiry where there are no change notifications
+import time
+#for the platform fallbacks
+import platform
+import subprocess
+import re
+#for sharing the cache between request threads
+import threading
+#for interface records
+from collections import namedtuple
+#for counting the fallback's subprocesses
+import metrics
+
+# rtnetlink constants from <linux/netlink.h> and <linux/rtnetlink.h>
+NETLINK_ROUTE = 0
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+RTM_NEWLINK = 16
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_GETADDR = 22
+IFLA_ADDRESS = 1
+IFLA_IFNAME = 3
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFF_UP = 0x1
+IFF_LOOPBACK = 0x8
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+
+# How long a cached inventory is trusted where change notifications aren't available
+FALLBACK_TTL = 30.0
+
+# One address on one interface; `interface` is an ipaddress IPv4Interface/IPv6Interface
+InterfaceAddress = namedtuple("InterfaceAddress", "name index mac up loopback interface")
+
+
+def netlink_dump(message_type, family=socket.AF_UNSPEC):
+    """
+    Sends one rtnetlink dump request and returns the (type, payload) of
+    every message in the answer.
+    """
+    with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE) as sock:
+        sock.bind((0, 0))
+        # nlmsghdr followed by a one-byte rtgenmsg (padded to 4)
+        request = struct.pack("=IHHII", 20, message_type, NLM_F_REQUEST | NLM_F_DUMP, 1, 0)
+        sock.send(request + struct.pack("Bxxx", family))
+        messages = []
+        while True:
+            data = sock.recv(65536)
+            offset = 0
+            while offset + 16 <= len(data):
+                length, kind, _, _, _ = struct.unpack_from("=IHHII", data, offset)
+                if kind == NLMSG_DONE:
+                    return messages
+                if kind == NLMSG_ERROR:
+                    raise OSError(-struct.unpack_from("=i", data, offset + 16)[0], "netlink dump failed")
+                messages.append((kind, data[offset + 16:offset + length]))
+                offset += (length + 3) & ~3
+
+
+def parse_attributes(payload, offset):
+    """Returns {type: bytes} for the rtattrs in a netlink payload"""
+    attributes = {}
+    while offset + 4 <= len(payload):
+        length, kind = struct.unpack_from("=HH", payload, offset)
+        if length < 4:
+            break
+        attributes[kind] = payload[offset + 4:offset + length]
+        offset += (length + 3) & ~3
+    return attributes
+
+
+def netlink_interfaces():
+    """Reads every interface address from the kernel"""
+    links = {}
+    for kind, payload in netlink_dump(RTM_GETLINK):
+        if kind != RTM_NEWLINK:
+            continue
+        _, _, index, flags, _ = struct.unpack_from("=BxHiII", payload)
+        attributes = parse_attributes(payload, 16)
+        name = attributes.get(IFLA_IFNAME, b"").rstrip(b"\0").decode()
+        raw_mac = attributes.get(IFLA_ADDRESS, b"")
+        mac = ":".join(f"{octet:02X}" for octet in raw_mac) if len(raw_mac) == 6 else None
+        links[index] = (name, mac, bool(flags & IFF_UP), bool(flags & IFF_LOOPBACK))
+    addresses = []
+    for kind, payload in netlink_dump(RTM_GETADDR):
+        if kind != RTM_NEWADDR:
+            continue
+        family, prefix, _, _, index = struct.unpack_from("=BBBBI", payload)
+        attributes = parse_attributes(payload, 8)
+        raw = attributes.get(IFA_LOCAL) or attributes.get(IFA_ADDRESS)
+        if raw is None or index not in links:
+            continue
+        address = socket.inet_ntop(family, raw)
+        name, mac, up, loopback = links[index]
+        addresses.append(InterfaceAddress(name, index, mac, up, loopback,
+                                          ipaddress.ip_interface(f"{address}/{prefix}")))
+    return addresses
+
+
+def legacy_interfaces():
+    """
+    Non-Linux fallback: the primary address parsed from ipconfig/ifconfig,
+    or the address of the default route with a /24 if that fails too.
+    """
+    address = mask = None
+    try:
+        if platform.system().lower() == 'windows':
+            metrics.subprocess_forks("ipconfig").inc()
+            output = subprocess.check_output(["ipconfig"], universal_newlines=True)
+            ip_match = re.search(r'IPv4 Address[. ]*: ([\d.]+)', output)
+            mask_match = re.search(r'Subnet Mask[. ]*: ([\d.]+)', output)
+            if ip_match and mask_match:
+                address, mask = ip_match.group(1), mask_match.group(1)
+        else:
+            metrics.subprocess_forks("ifconfig").inc()
+            output = subprocess.check_output(["ifconfig"], universal_newlines=True)
+            for ip, netmask in re.findall(r'inet ([\d.]+).*?netmask (0x[\da-f]+|[\d.]+)', output):
+                if not ip.startswith("127."):
+                    address = ip
+                    mask = socket.inet_ntoa(int(netmask, 16).to_bytes(4, "big")) if netmask.startswith("0x") else netmask
+                    break
+    except (OSError, subprocess.SubprocessError):
+        pass
+    if address is None:
+        # Connecting a UDP socket sends nothing; it only picks the outgoing address
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            try:
+                s.connect(('8.8.8.8', 80))
+                address = s.getsockname()[0]
+            except OSError:
+                address = '127.0.0.1'
+        mask = '255.255.255.0'
+    interface = ipaddress.ip_interface(f"{address}/{mask}")
+    return [InterfaceAddress("default", 0, None, True, interface.is_loopback, interface)]
+
+
+def default_route_interface(path="/proc/net/route"):
+    """Name of the interface holding the IPv4 default route, or None"""
+    try:
+        with open(path) as f:
+            next(f)
+            for line in f:
+                fields = line.split()
+                if len(fields) > 2 and fields[1] == "00000000":
+                    return fields[0]
+    except (OSError, StopIteration):
+        pass
+    return None
+
+
+class InterfaceInventory:
+    """
+    Cached list of interface addresses.
+    On Linux a netlink socket subscribed to address and link changes marks
+    the cache stale, so reads are free until something actually changes;
+    elsewhere the cache expires after FALLBACK_TTL seconds.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.addresses = None
+        self.loaded_at = 0
+        self.monitor = None
+        try:
+            self.monitor = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+            self.monitor.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+            self.monitor.setblocking(False)
+        except (AttributeError, OSError):
+            self.monitor = None
+
+    def changed(self):
+        """
+        Drains pending change notifications; True if there were any, or
+        if some may have been lost.
+        """
+        changed = False
+        while select.select([self.monitor], [], [], 0)[0]:
+            try:
+                self.monitor.recv(65536)
+            except BlockingIOError:
+                break
+            except OSError:
+                # ENOBUFS: the kernel dropped notifications that didn't fit the
+                # socket buffer, so anything may have changed
+                return True
+            changed = True
+        return changed
+
+    def stale(self):
+        if self.addresses is None:
+            return True
+        if self.monitor is not None:
+            return self.changed()
+        return self.clock() - self.loaded_at > FALLBACK_TTL
+
+    def load(self):
+        if self.monitor is not None:
+            try:
+                return netlink_interfaces()
+            except OSError:
+                pass
+        return legacy_interfaces()
+
+    def all(self):
+        """Every address on every interface, reloaded only when something changed"""
+        with self.lock:
+            if self.stale():
+                self.addresses = self.load()
+                self.loaded_at = self.clock()
+            return self.addresses
+
+    def ipv4(self, include_loopback=False):
+        return [a for a in self.all() if a.interface.version == 4 and (include_loopback or not a.loopback)]
+
+    def primary(self, name=None):
+        """
+        The IPv4 address scans default to: the named interface's (or
+        NETSCAN_INTERFACE's), else the default route's, else the first
+        non-loopback interface that is up, else loopback.
+        Raises ValueError for an unknown interface name.
+        """
+        name = name or os.environ.get("NETSCAN_INTERFACE")
+        candidates = self.ipv4(include_loopback=True)
+        if name:
+            for address in candidates:
+                if address.name == name:
+                    return address
+            raise ValueError(f"No IPv4 address on interface {name}")
+        route_name = default_route_interface()
+        for address in candidates:
+            if address.name == route_name:
+                return address
+        for address in candidates:
+            if address.up and not address.loopback:
+                return address
+        if candidates:
+            return candidates[0]
+        return legacy_interfaces()[0]
+
+    def attached(self, network):
+        """The non-loopback interface address whose subnet contains the network, or None"""
+        for address in self.ipv4():
+            if network.version == address.interface.version and network.subnet_of(address.interface.network):
+                return address
+        return None
+
+
+inventory = InterfaceInventory()
@@ -0,0 +1,182 @@
+"""
+Scan job scheduler.
+
+Lets several scans run at once. Each job has its own id, status and event
+stream; a fixed number of jobs run side by side, drawing from one global
+budget of probes in flight, and the rest wait in a priority queue.
+Cancelling a job stops its outstanding probes.
+"""
+
+#for the waiting queue
+import heapq
+#for job ids and submission order
+import itertools
+#for the job threads and cancellation flags
+import threading
+#for job timestamps
+from datetime import datetime
+
+from events import EventHub
+from progress import ScanProgress
+from ratelimit import ProbeBudget
+from netscan import worker_context
+
+# Probes in flight across every running job
+PROBE_BUDGET = 4000
+# Jobs that may run at the same time; the rest are queued
+MAX_RUNNING_JOBS = 4
+# Finished jobs kept in memory for status queries (results live in the store)
+FINISHED_JOBS_KEPT = 100
+
+QUEUED, RUNNING, COMPLETED, CANCELLED, FAILED = "queued", "running", "completed", "cancelled", "failed"
+
+
+class Job:
+    """
+    One requested scan.
+    `status` holds its state and details, `progress` its live counters.
+    While it runs, `budget` is the scheduler's shared ProbeBudget and
+    `concurrency` the most probes the job may have in flight itself.
+    """
+
+    def __init__(self, job_id, network, options=None, priority=0):
+        self.id = job_id
+        self.network = network
+        self.options = options or {}
+        self.priority = priority
+        self.cancel_event = threading.Event()
+        self.events = EventHub()
+        self.progress = ScanProgress()
+        self.concurrency = None
+        self.budget = None
+        self.created = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.status = {
+            "job_id": job_id,
+            "state": QUEUED,
+            "running": True,
+            "current_scan": str(network),
+            "scan_id": None,
+            "stage": None,
+            "priority": priority,
+            "created": self.created,
+            "error": None,
+        }
+
+    @property
+    def state(self):
+        return self.status["state"]
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def snapshot(self):
+        """The status and a progress snapshot, safe to serialize from another thread"""
+        status = dict(self.status)
+        status.update(self.progress.snapshot())
+        return status
+
+    def finish(self, state, error=None):
+        self.status["state"] = state
+        self.status["running"] = False
+        self.status["error"] = error
+        self.events.publish("done")
+
+
+class JobScheduler:
+    """
+    Runs jobs with `runner(job)` on their own threads, at most
+    `max_running` at a time, highest priority first and FIFO within a
+    priority. Every probe of every running job, in its own thread or its
+    shard worker processes, holds a slot of one ProbeBudget of
+    probe_budget slots, so together they never have more in flight. A job
+    on its own can use the whole budget; jobs running side by side take
+    slots as they free up.
+    """
+
+    def __init__(self, runner, probe_budget=PROBE_BUDGET, max_running=MAX_RUNNING_JOBS):
+        self.runner = runner
+        self.max_running = max_running
+        self.probe_budget = probe_budget
+        # Made when the first job starts: the forkserver and spawned workers
+        # import the web app too, and shouldn't each create a semaphore
+        self.budget = None
+        self.jobs = {}
+        self.waiting = []
+        self.running = set()
+        self.ids = itertools.count(1)
+        self.order = itertools.count()
+        self.lock = threading.Lock()
+
+    def submit(self, network, options=None, priority=0):
+        """Queue a scan and start it right away if a slot is free"""
+        with self.lock:
+            job = Job(next(self.ids), network, options, priority)
+            self.jobs[job.id] = job
+            heapq.heappush(self.waiting, (-priority, next(self.order), job))
+            self._start_waiting()
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def latest(self):
+        """The most recently submitted job, or None"""
+        with self.lock:
+            return self.jobs[max(self.jobs)] if self.jobs else None
+
+    def list(self):
+        with self.lock:
+            return [job.snapshot() for job in self.jobs.values()]
+
+    def cancel(self, job_id):
+        """
+        Cancel a queued or running job. Returns the job, or None if unknown.
+        A running job stops its probes at the next check, which happens
+        several times a second.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job.state == QUEUED:
+                self.waiting = [entry for entry in self.waiting if entry[2] is not job]
+                heapq.heapify(self.waiting)
+                job.cancel_event.set()
+                job.finish(CANCELLED)
+            elif job.state == RUNNING:
+                job.cancel_event.set()
+        return job
+
+    def _start_waiting(self):
+        # Caller holds self.lock
+        while self.waiting and len(self.running) < self.max_running:
+            if self.budget is None:
+                # Shard workers start from worker_context(), so the semaphore has to as well
+                self.budget = ProbeBudget(self.probe_budget, worker_context())
+            _, _, job = heapq.heappop(self.waiting)
+            job.concurrency = self.probe_budget
+            job.budget = self.budget
+            job.status["state"] = RUNNING
+            self.running.add(job)
+            threading.Thread(target=self._run, args=(job,), name=f"scan-job-{job.id}", daemon=True).start()
+
+    def _run(self, job):
+        try:
+            self.runner(job)
+            if job.cancelled:
+                job.finish(CANCELLED)
+            elif job.state == RUNNING:
+                job.finish(COMPLETED)
+        except Exception as e:
+            job.finish(FAILED, str(e))
+        finally:
+            with self.lock:
+                self.running.discard(job)
+                self._forget_old_jobs()
+                self._start_waiting()
+
+    def _forget_old_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.state in (COMPLETED, CANCELLED, FAILED)]
+        for job_id in finished[:-FINISHED_JOBS_KEPT]:
+            del self.jobs[job_id]
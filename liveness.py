@@ -0,0 +1,115 @@
+"""
+Multi-method liveness probing.
+
+Hosts that filter ICMP often still answer something else. MultiProber
+races several cheap probes per host under one shared timeout:
+ICMP echo, TCP connects to a few common ports, and a UDP datagram to a
+port that is almost never open. The first answer wins and the rest are
+cancelled.
+A TCP reset or an ICMP port unreachable counts as an answer too: the
+port is closed, but the host is up.
+"""
+
+#for racing the probes
+import asyncio
+#for the probe sockets
+import socket
+
+from portscan import socket_budget, RESET_ON_CLOSE
+
+# TCP ports tried on every host
+LIVENESS_TCP_PORTS = (80, 443, 22)
+# First traceroute port; practically never has a listener
+LIVENESS_UDP_PORT = 33434
+# Sockets one host's race can hold open (TCP ports plus UDP)
+SOCKETS_PER_PROBE = len(LIVENESS_TCP_PORTS) + 1
+
+
+def probe_socket(ip, kind):
+    sock = socket.socket(socket.AF_INET6 if ":" in ip else socket.AF_INET, kind)
+    sock.setblocking(False)
+    return sock
+
+
+async def tcp_alive(ip, port):
+    """True if ip accepts or refuses a TCP connection on port"""
+    loop = asyncio.get_running_loop()
+    sock = probe_socket(ip, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, RESET_ON_CLOSE)
+    try:
+        await loop.sock_connect(sock, (ip, port))
+        return True
+    except ConnectionRefusedError:
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+async def udp_alive(ip, port=LIVENESS_UDP_PORT):
+    """
+    True if ip answers a UDP datagram, or rejects it with ICMP port
+    unreachable (which a connected socket reports as ConnectionRefusedError).
+    """
+    loop = asyncio.get_running_loop()
+    sock = probe_socket(ip, socket.SOCK_DGRAM)
+    try:
+        sock.connect((ip, port))
+        sock.send(b"")
+        await loop.sock_recv(sock, 512)
+        return True
+    except ConnectionRefusedError:
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+class MultiProber:
+    """
+    Prober that races ICMP (when an ICMP prober is given), TCP and UDP.
+    probe() returns the name of the method that answered first
+    ("icmp", "tcp/443", "udp"), or False if none did before the timeout.
+    """
+
+    def __init__(self, timeout, icmp=None, tcp_ports=LIVENESS_TCP_PORTS, udp_port=LIVENESS_UDP_PORT):
+        self.timeout = timeout
+        self.icmp = icmp
+        self.tcp_ports = tcp_ports
+        self.udp_port = udp_port
+
+    def max_concurrency(self, concurrency):
+        """Caps concurrent races so their sockets fit the open-file limit"""
+        return max(1, socket_budget(concurrency * SOCKETS_PER_PROBE) // SOCKETS_PER_PROBE)
+
+    async def probe(self, ip, timeout=None):
+        ip = str(ip)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+        attempts = {}
+        if self.icmp:
+            attempts[asyncio.ensure_future(self.icmp.probe(ip, timeout or self.timeout))] = "icmp"
+        for port in self.tcp_ports:
+            attempts[asyncio.ensure_future(tcp_alive(ip, port))] = f"tcp/{port}"
+        attempts[asyncio.ensure_future(udp_alive(ip, self.udp_port))] = "udp"
+        pending = set(attempts)
+        try:
+            while pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.cancelled() and task.exception() is None and task.result():
+                        return attempts[task]
+            return False
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def close(self):
+        if self.icmp:
+            self.icmp.close()
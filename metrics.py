@@ -0,0 +1,246 @@
+"""
+Scan instrumentation.
+
+Counters and timing histograms for the hot paths: probes, ping
+subprocesses, reverse DNS, neighbour table lookups, scan stages and JSON
+encoding. Recording is an uncontended lock and an add, so it stays on in
+production. The web app serves everything at /metrics in the Prometheus
+text format; the CLI prints a summary with --stats.
+Metrics are per process: shard workers' probes are credited by the
+parent when their shard comes back.
+"""
+
+#for finding a histogram bucket
+import bisect
+#for updates from scan, lookup and request threads
+import threading
+#for timing
+import time
+#for timing whole functions
+import functools
+
+# Upper bounds, in seconds, of the timing histogram buckets
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+                60.0, 300.0)
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+class Counter:
+    """Monotonic count of events"""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self):
+        yield self.name + format_labels(self.labels), self.value
+
+
+class Gauge:
+    """Value read from a function whenever metrics are collected"""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, read, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.read = read
+
+    def samples(self):
+        yield self.name + format_labels(self.labels), self.read()
+
+
+class Timer:
+    """Context manager and decorator that observes elapsed seconds into a histogram"""
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+    def __call__(self, function):
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            with Timer(self.histogram):
+                return function(*args, **kwargs)
+        return timed
+
+
+class Histogram:
+    """
+    Distribution of observed values (seconds, for timings) over fixed
+    buckets, with their count, sum and maximum.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=TIME_BUCKETS, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def time(self):
+        """Times a block (`with h.time():`) or a function (`@h.time()`)"""
+        return Timer(self)
+
+    def quantile(self, q):
+        """
+        Estimates a quantile as the upper bound of the bucket it falls in
+        (the maximum for the overflow bucket). None before any observation.
+        """
+        with self.lock:
+            counts, count, peak = list(self.counts), self.count, self.max
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(bound, peak)
+        return peak
+
+    def samples(self):
+        with self.lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            yield self.name + "_bucket" + format_labels(self.labels, [("le", f"{bound:g}")]), cumulative
+        yield self.name + "_bucket" + format_labels(self.labels, [("le", "+Inf")]), count
+        yield self.name + "_sum" + format_labels(self.labels), total
+        yield self.name + "_count" + format_labels(self.labels), count
+
+
+class MetricsRegistry:
+    """
+    Every metric of the process, keyed by name and labels.
+    Asking for a metric that already exists returns the existing one, so
+    modules can look theirs up at import time and record without lookups.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def get(self, kind, name, help, labels, *args):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            metric = self.metrics.get(key)
+            if metric is None:
+                metric = self.metrics[key] = kind(name, help, *args, labels=key[1])
+            return metric
+
+    def counter(self, name, help, **labels):
+        return self.get(Counter, name, help, labels)
+
+    def histogram(self, name, help, buckets=TIME_BUCKETS, **labels):
+        return self.get(Histogram, name, help, labels, buckets)
+
+    def gauge(self, name, help, read, **labels):
+        return self.get(Gauge, name, help, labels, read)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda m: (m.name, m.labels))
+        lines = []
+        described = set()
+        for metric in metrics:
+            if metric.name not in described:
+                described.add(metric.name)
+                lines.append(f"# HELP {metric.name} {metric.help}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample, value in metric.samples():
+                lines.append(f"{sample} {value:g}" if isinstance(value, float) else f"{sample} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Human-readable table of stage timings and counters, for the CLI"""
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda m: (m.name, m.labels))
+        lines = [f"{'stage':<14}{'calls':>9}{'total':>11}{'mean':>11}{'p50':>11}{'p99':>11}{'max':>11}"]
+        for metric in metrics:
+            if isinstance(metric, Histogram) and metric.count:
+                name = dict(metric.labels).get("stage", metric.name)
+                timings = [metric.sum, metric.sum / metric.count, metric.quantile(0.5), metric.quantile(0.99),
+                           metric.max]
+                lines.append(f"{name:<14}{metric.count:>9}" + "".join(f"{format_seconds(t):>11}" for t in timings))
+        counters = [metric for metric in metrics if isinstance(metric, Counter) and metric.value]
+        if counters:
+            lines.append("")
+        for metric in counters:
+            label = " ".join(value for _, value in metric.labels)
+            name = metric.name.replace("netscan_", "").replace("_total", "").replace("_", " ")
+            lines.append(f"{(name + ' ' + label).strip():<40}{metric.value:>9}")
+        return "\n".join(lines)
+
+
+def format_seconds(seconds):
+    if seconds >= 1:
+        return f"{seconds:.2f}s"
+    return f"{seconds * 1000:.1f}ms"
+
+
+registry = MetricsRegistry()
+
+probes_sent = registry.counter("netscan_probes_sent_total", "Liveness probes sent")
+probe_replies = registry.counter("netscan_probe_replies_total", "Liveness probes that got an answer")
+probe_timeouts = registry.counter("netscan_probe_timeouts_total", "Liveness probes that got no answer in time")
+dns_cache_hits = registry.counter("netscan_dns_cache_hits_total", "Reverse DNS lookups answered from the cache")
+dns_cache_misses = registry.counter("netscan_dns_cache_misses_total", "Reverse DNS lookups that went to the resolver")
+arp_lookups = registry.counter("netscan_arp_lookups_total", "MAC address lookups in the neighbour table")
+arp_table_reads = registry.counter("netscan_arp_table_reads_total", "Reads of the whole neighbour table")
+
+
+def stage_seconds(stage):
+    """Timing histogram of one stage (probe, ping, dns, arp_table, discovery, ...)"""
+    return registry.histogram("netscan_stage_seconds", "Seconds spent per call of each scan stage", stage=stage)
+
+
+def subprocess_forks(command):
+    """Counter of subprocesses started for one command"""
+    return registry.counter("netscan_subprocess_forks_total", "Subprocesses started, by command", command=command)
+
+
+def scans_finished(outcome):
+    """Counter of scans that ended completed, cancelled or failed"""
+    return registry.counter("netscan_scans_total", "Scans finished, by outcome", outcome=outcome)
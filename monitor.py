@@ -0,0 +1,378 @@
+"""
+Continuous monitoring.
+
+`netscan monitor <networks> --interval N` sweeps the networks every N
+seconds from one long-running process and reports what changed: hosts
+coming up, going down, and MAC addresses changing. The probe socket,
+RTT estimates, neighbour table and interface inventory stay warm between
+sweeps, and every network shares one event loop and one probe budget, so
+hundreds of subnets cost one bounded sweep per interval rather than a
+process or thread each.
+
+Events go to one or more sinks: stdout or a file as JSON lines, or a
+webhook that gets each sweep's events as one JSON POST. Each sink has its
+own bounded queue and delivery task, so a slow webhook never holds up the
+sweeps or the other sinks.
+"""
+
+#for the sweep loop
+import asyncio
+#for addresses and networks
+import ipaddress
+#for mapping an address back to its network
+import bisect
+#for event payloads and json lines
+import json
+#for sweep timestamps
+from datetime import datetime, timezone
+#for sweep scheduling
+import time
+#for stopping cleanly on SIGTERM
+import signal
+#for the webhook sink
+import urllib.request
+import urllib.error
+#for the stdout sink
+import sys
+
+from netscan import async_probe_batches, open_prober, parse_network, DEFAULT_CONCURRENCY, DEFAULT_TIMEOUT
+from ratelimit import AdaptiveTimeout
+from targets import cidr_hosts
+from permute import permuted_hosts, new_seed
+from neighbors import NeighborCache
+import metrics
+
+# Seconds between the starts of two sweeps
+DEFAULT_INTERVAL = 60.0
+# Sweeps in a row a known host has to miss before it is reported down, so
+# one lost reply doesn't cause a down/up pair
+DOWN_AFTER = 2
+# Seconds to wait for a webhook to accept a batch
+WEBHOOK_TIMEOUT = 10.0
+# Sweeps' worth of events a sink can fall behind by; past that its oldest
+# undelivered batch is dropped
+MAX_PENDING = 16
+# Seconds to keep delivering queued events once the monitor stops
+FLUSH_TIMEOUT = WEBHOOK_TIMEOUT
+
+CYCLE_SECONDS = metrics.stage_seconds("monitor_sweep")
+
+
+class StreamSink:
+    """Writes each event as one JSON line to a text stream"""
+
+    def __init__(self, stream=sys.stdout):
+        self.stream = stream
+
+    def emit(self, events):
+        self.stream.write("".join(json.dumps(event) + "\n" for event in events))
+        self.stream.flush()
+
+    def close(self):
+        pass
+
+
+class JsonlSink(StreamSink):
+    """Appends events as JSON lines to a file"""
+
+    def __init__(self, path):
+        super().__init__(open(path, "a", encoding="utf-8"))
+
+    def close(self):
+        self.stream.close()
+
+
+class WebhookSink:
+    """POSTs each sweep's events to a URL as a JSON array"""
+
+    def __init__(self, url, timeout=WEBHOOK_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+
+    def emit(self, events):
+        request = urllib.request.Request(self.url, data=json.dumps(events).encode(), method="POST",
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+        except (urllib.error.URLError, OSError) as e:
+            # The monitor keeps going; the next sweep's changes are still delivered
+            print(f"Webhook {self.url} failed: {e}", file=sys.stderr)
+
+    def close(self):
+        pass
+
+
+def open_sink(spec):
+    """
+    Returns the sink for a --sink argument: "stdout" (or "-"), an http(s)
+    URL for a webhook, or a file path (optionally "jsonl:path") for JSON lines.
+    """
+    if spec in ("stdout", "-"):
+        return StreamSink()
+    if spec.startswith(("http://", "https://")):
+        return WebhookSink(spec)
+    if spec.startswith("jsonl:"):
+        spec = spec[len("jsonl:"):]
+    if not spec:
+        raise ValueError("--sink needs stdout, a URL or a file path")
+    return JsonlSink(spec)
+
+
+class NetworkMonitor:
+    """
+    Sweeps a set of networks over and over and turns the differences
+    between sweeps into events. The first sweep reports every host it
+    finds as "up" with "initial": true.
+    sinks are objects with emit(list of event dicts) and close().
+    """
+
+    def __init__(self, networks, sinks, interval=DEFAULT_INTERVAL, backend="auto", concurrency=DEFAULT_CONCURRENCY,
+                 timeout=DEFAULT_TIMEOUT, rate=None, down_after=DOWN_AFTER, neighbors=None, seed=None):
+        # Events name the networks as given; overlapping and adjacent ones are
+        # merged for probing so no address is probed twice a sweep
+        self.given = sorted(set(networks), key=lambda n: (n.version, int(n.network_address), n.prefixlen))
+        self.starts = [(n.version, int(n.network_address)) for n in self.given]
+        self.networks = list(ipaddress.collapse_addresses(n for n in self.given if n.version == 4)) + \
+            list(ipaddress.collapse_addresses(n for n in self.given if n.version == 6))
+        # Each sweep visits the addresses in the same seeded random order, so
+        # no subnet's router gets a burst of consecutive probes
+        self.ranges = [cidr_hosts(network) for network in self.networks]
+        self.seed = new_seed() if seed is None else seed
+        self.sinks = sinks
+        self.interval = interval
+        self.backend = backend
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.rate = rate
+        self.down_after = down_after
+        self.neighbors = neighbors or NeighborCache()
+        self.timeouts = AdaptiveTimeout(timeout)
+        # ip -> {"mac": ..., "misses": sweeps missed in a row} for every host known to be up
+        self.hosts = {}
+        self.sweeps = 0
+        # (sink, asyncio.Queue of event batches) while run() is going
+        self.queues = []
+
+    def network_of(self, ip):
+        """The narrowest given network holding ip"""
+        address = ipaddress.ip_address(ip)
+        index = bisect.bisect_right(self.starts, (address.version, int(address))) - 1
+        while index >= 0 and address not in self.given[index]:
+            index -= 1
+        return str(self.given[index])
+
+    def addresses(self):
+        return permuted_hosts(self.ranges, self.seed)
+
+    async def sweep(self, prober):
+        """Probes every address once and returns {ip: liveness method or True} for the ones that answered"""
+        online = {}
+        async for batch in async_probe_batches(self.addresses(), self.concurrency, self.backend, self.timeout,
+                                               self.rate, self.timeouts, prober):
+            online.update((ip, is_online) for ip, is_online in batch if is_online)
+        return online
+
+    def changes(self, online):
+        """Updates the known hosts from one sweep and returns the events"""
+        now = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        initial = self.sweeps == 0
+        self.neighbors.invalidate()
+        events = []
+
+        def event(kind, ip, **details):
+            events.append({"event": kind, "ip": ip, "network": self.network_of(ip), "time": now, **details})
+
+        for ip, is_online in online.items():
+            mac = self.neighbors.lookup(ip)
+            method = is_online if isinstance(is_online, str) else None
+            known = self.hosts.get(ip)
+            if known is None:
+                self.hosts[ip] = {"mac": mac, "misses": 0}
+                details = {"mac": mac, "liveness": method}
+                if initial:
+                    details["initial"] = True
+                event("up", ip, **{k: v for k, v in details.items() if v is not None})
+                continue
+            known["misses"] = 0
+            if mac and known["mac"] and mac != known["mac"]:
+                event("mac_changed", ip, mac=mac, previous_mac=known["mac"])
+            if mac:
+                known["mac"] = mac
+        for ip in [ip for ip in self.hosts if ip not in online]:
+            known = self.hosts[ip]
+            known["misses"] += 1
+            if known["misses"] >= self.down_after:
+                del self.hosts[ip]
+                event("down", ip, **({"mac": known["mac"]} if known["mac"] else {}))
+        self.sweeps += 1
+        return events
+
+    def emit(self, events):
+        """
+        Queues one sweep's events for every sink without waiting for them
+        to be delivered. A sink MAX_PENDING batches behind loses its oldest.
+        """
+        for sink, queue in self.queues:
+            if queue.full():
+                dropped = queue.get_nowait()
+                queue.task_done()
+                print(f"{type(sink).__name__} is {MAX_PENDING} sweeps behind, dropped {len(dropped)} events",
+                      file=sys.stderr)
+            queue.put_nowait(events)
+
+    async def deliver(self, sink, queue):
+        """Hands queued batches to one sink, in order, until cancelled"""
+        loop = asyncio.get_running_loop()
+        while True:
+            events = await queue.get()
+            try:
+                # Sinks may block (a slow webhook); keep them off the probing loop
+                await loop.run_in_executor(None, sink.emit, events)
+            except Exception as e:
+                print(f"{type(sink).__name__} failed: {e}", file=sys.stderr)
+            finally:
+                queue.task_done()
+
+    async def run(self, sweeps=None, stop=None):
+        """
+        Sweeps every `interval` seconds, measured from the start of one
+        sweep to the next, until `sweeps` sweeps are done or the stop
+        asyncio.Event is set. A sweep that takes longer than the interval
+        is followed straight away by the next one.
+        """
+        stop = stop or asyncio.Event()
+        self.queues = [(sink, asyncio.Queue(MAX_PENDING)) for sink in self.sinks]
+        deliveries = [asyncio.ensure_future(self.deliver(sink, queue)) for sink, queue in self.queues]
+        prober = open_prober(self.backend, self.timeout)
+        try:
+            while not stop.is_set() and (sweeps is None or self.sweeps < sweeps):
+                started = time.monotonic()
+                sweep = asyncio.ensure_future(self.sweep(prober))
+                stopping = asyncio.ensure_future(stop.wait())
+                await asyncio.wait([sweep, stopping], return_when=asyncio.FIRST_COMPLETED)
+                stopping.cancel()
+                if not sweep.done():
+                    sweep.cancel()
+                    await asyncio.gather(sweep, return_exceptions=True)
+                    break
+                events = self.changes(sweep.result())
+                elapsed = time.monotonic() - started
+                CYCLE_SECONDS.observe(elapsed)
+                if events:
+                    self.emit(events)
+                if sweeps is not None and self.sweeps >= sweeps:
+                    break
+                if elapsed > self.interval:
+                    print(f"Sweep took {elapsed:.1f}s, longer than the {self.interval:g}s interval",
+                          file=sys.stderr)
+                    continue
+                try:
+                    await asyncio.wait_for(stop.wait(), self.interval - elapsed)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            prober.close()
+            # Give the sinks a last chance to take what is still queued
+            flushed = asyncio.gather(*(queue.join() for _, queue in self.queues))
+            try:
+                await asyncio.wait_for(flushed, FLUSH_TIMEOUT)
+            except asyncio.TimeoutError:
+                print("Stopped with events still undelivered", file=sys.stderr)
+            for delivery in deliveries:
+                delivery.cancel()
+            await asyncio.gather(*deliveries, return_exceptions=True)
+            for sink in self.sinks:
+                sink.close()
+
+
+def parse_monitor_args(args):
+    """
+    Splits `netscan monitor` arguments into options.
+    Raises ValueError for unknown or malformed options.
+    """
+    options = {"networks": [], "interval": DEFAULT_INTERVAL, "sinks": [], "backend": "auto", "rate": None,
+               "down_after": DOWN_AFTER, "sweeps": None, "seed": None}
+    args = list(args)
+    numbers = {"--interval": ("interval", float), "--rate": ("rate", float), "--down-after": ("down_after", int),
+               "--count": ("sweeps", int)}
+    while args:
+        arg = args.pop(0)
+        if arg in numbers:
+            key, kind = numbers[arg]
+            try:
+                options[key] = kind(args.pop(0)) if args else 0
+            except ValueError:
+                options[key] = 0
+            if options[key] <= 0:
+                raise ValueError(f"{arg} needs a positive number")
+        elif arg == "--seed":
+            if not args or not args[0].isdigit():
+                raise ValueError("--seed needs a non-negative integer")
+            options["seed"] = int(args.pop(0))
+        elif arg == "--sink":
+            if not args:
+                raise ValueError("--sink needs stdout, a URL or a file path")
+            options["sinks"].append(args.pop(0))
+        elif arg == "--backend":
+            if not args or args[0] not in ("auto", "icmp", "ping", "multi"):
+                raise ValueError("--backend needs one of auto, icmp, ping, multi")
+            options["backend"] = args.pop(0)
+        elif arg.startswith("-"):
+            raise ValueError(f"Unknown option: {arg}")
+        else:
+            options["networks"].append(arg)
+    return options
+
+
+def show_monitor_help():
+    print(
+        "Usage: netscan monitor [options] [network ...]\n"
+        "Sweep networks continuously and report hosts going up or down and MAC changes.\n\n"
+        "Options:\n"
+        "  --interval S     Seconds between sweeps (default 60)\n"
+        "  --sink SINK      Where events go: stdout (default), an http(s) webhook URL,\n"
+        "                   or a file of JSON lines; repeat for several sinks\n"
+        "  --backend B      auto (default), icmp, ping or multi\n"
+        "  --rate N         Send at most N probes per second\n"
+        "  --down-after N   Sweeps a host must miss before it is reported down (default 2)\n"
+        "  --count N        Stop after N sweeps\n"
+        "  --seed N         Seed of the random probe order (default: a new one each run)\n"
+        "Examples:\n"
+        "  netscan monitor 192.168.1.0/24 --interval 30\n"
+        "  netscan monitor 10.0.0.0/16 10.1.0.0/16 --sink events.jsonl --sink http://localhost:9000/hook"
+    )
+
+
+def main(args):
+    """Entry point of `netscan monitor`"""
+    if any(arg in ("-h", "--help") for arg in args):
+        show_monitor_help()
+        return
+    try:
+        options = parse_monitor_args(args)
+        networks = [parse_network(arg) for arg in options["networks"]] or [parse_network()]
+        sinks = [open_sink(spec) for spec in options["sinks"] or ["stdout"]]
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}")
+        show_monitor_help()
+        return
+    monitor = NetworkMonitor(networks, sinks, options["interval"], options["backend"], rate=options["rate"],
+                             down_after=options["down_after"], seed=options["seed"])
+    print(f"Monitoring {', '.join(map(str, monitor.given))} every {options['interval']:g}s "
+          f"(probe order seed {monitor.seed})", file=sys.stderr)
+
+    async def run():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, stop.set)
+            except (NotImplementedError, RuntimeError):  # Windows
+                pass
+        await monitor.run(options["sweeps"], stop)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,164 @@
+"""
+Neighbour (ARP) table snapshot.
+
+Reads the whole IP -> MAC table once instead of running `arp` for every
+host, then answers lookups from a dict.
+"""
+
+#for detecting operation system
+import platform
+#for the one `arp -a` dump on systems without /proc
+import subprocess
+#for regular expressions
+import re
+#for throttling refreshes
+import time
+#for sharing the cache between scan threads
+import threading
+#for lookup counters and table read timings
+import metrics
+
+PROC_NET_ARP = "/proc/net/arp"
+
+MAC_PATTERN = re.compile(r'([0-9a-fA-F]{1,2}[:-]){5}[0-9a-fA-F]{1,2}')
+IP_PATTERN = re.compile(r'(?<![\d.])(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})(?![\d.])')
+
+# Incomplete entries show up with an all-zero address
+EMPTY_MAC = "00:00:00:00:00:00"
+
+TABLE_READ_SECONDS = metrics.stage_seconds("arp_table")
+
+
+def normalize_mac(mac):
+    """
+    Returns a MAC address as upper-case, colon separated, zero padded octets.
+    macOS prints octets without leading zeros (e.g. 0:1c:42:...).
+    """
+    return ":".join(part.zfill(2) for part in re.split(r'[:-]', mac)).upper()
+
+
+def parse_proc_net_arp(text):
+    """
+    Parses the contents of /proc/net/arp into an {ip: mac} dict.
+    Skips the header and incomplete entries (flags 0x0).
+    """
+    table = {}
+    for line in text.splitlines()[1:]:
+        fields = line.split()
+        if len(fields) < 4 or fields[2] == "0x0":
+            continue
+        mac = normalize_mac(fields[3])
+        if mac != EMPTY_MAC:
+            table[fields[0]] = mac
+    return table
+
+
+def parse_ip_neigh(text):
+    """
+    Parses `ip neigh` output into an {ip: mac} dict.
+    Lines look like: 192.168.1.1 dev eth0 lladdr aa:bb:cc:dd:ee:ff REACHABLE
+    """
+    table = {}
+    for line in text.splitlines():
+        fields = line.split()
+        if "lladdr" in fields and fields.index("lladdr") + 1 < len(fields):
+            mac = normalize_mac(fields[fields.index("lladdr") + 1])
+            if mac != EMPTY_MAC:
+                table[fields[0]] = mac
+    return table
+
+
+def parse_arp_output(text):
+    """
+    Parses `arp -a` output (Windows or macOS/BSD) into an {ip: mac} dict.
+    Any line holding both an IPv4 address and a MAC address counts.
+    """
+    table = {}
+    for line in text.splitlines():
+        ip_match = IP_PATTERN.search(line)
+        mac_match = MAC_PATTERN.search(line)
+        if ip_match and mac_match:
+            mac = normalize_mac(mac_match.group(0))
+            if mac != EMPTY_MAC and mac != "FF:FF:FF:FF:FF:FF":
+                table[ip_match.group(1)] = mac
+    return table
+
+
+def load_neighbor_table(path):
+    """
+    Loads a saved neighbour table dump (/proc/net/arp, `ip neigh` or `arp -a`
+    format) from a file.
+    """
+    with open(path) as f:
+        text = f.read()
+    if text.startswith("IP address"):
+        return parse_proc_net_arp(text)
+    if "lladdr" in text:
+        return parse_ip_neigh(text)
+    return parse_arp_output(text)
+
+
+def read_neighbor_table():
+    """
+    Reads the system neighbour table in one go.
+    Linux reads /proc/net/arp directly; other systems run `arp -a` once.
+    """
+    if platform.system().lower() == "linux":
+        try:
+            with open(PROC_NET_ARP) as f:
+                return parse_proc_net_arp(f.read())
+        except OSError:
+            pass
+    try:
+        metrics.subprocess_forks("arp").inc()
+        result = subprocess.run(['arp', '-a'], capture_output=True, text=True, timeout=5)
+        return parse_arp_output(result.stdout)
+    except Exception as e:
+        print(f"Error reading ARP table: {e}")
+        return {}
+
+
+class NeighborCache:
+    """
+    IP -> MAC snapshot of the neighbour table.
+    The table is read on the first lookup after invalidate(), and re-read
+    when a lookup misses, at most once every `min_refresh` seconds.
+    """
+
+    def __init__(self, loader=read_neighbor_table, min_refresh=1.0):
+        self.loader = loader
+        self.min_refresh = min_refresh
+        self.table = {}
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def invalidate(self):
+        """Forget the snapshot so the next lookup reads a fresh table"""
+        with self.lock:
+            self.loaded_at = None
+
+    def _load(self):
+        # Caller holds self.lock, so concurrent lookups wait for one read
+        metrics.arp_table_reads.inc()
+        with TABLE_READ_SECONDS.time():
+            self.table = self.loader()
+        self.loaded_at = time.monotonic()
+
+    def refresh(self):
+        with self.lock:
+            self._load()
+
+    def lookup(self, ip):
+        """
+        Returns the MAC address for ip, or None if it isn't in the table.
+        """
+        metrics.arp_lookups.inc()
+        with self.lock:
+            if self.loaded_at is None:
+                self._load()
+            mac = self.table.get(ip)
+            if mac is None and time.monotonic() - self.loaded_at >= self.min_refresh:
+                # The host may have answered after the snapshot was taken
+                self._load()
+                mac = self.table.get(ip)
+        return mac
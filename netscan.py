@@ -1,13 +1,17 @@
-print("SCRIPT STARTED")
-
 #for comand-line and arguments and exit
 import sys
-#for networking interface and ip operations
-import socket 
 # for ip network calculations
 import ipaddress
-#for parallel thread execution
+#for running thousands of probes concurrently
+import asyncio
+#for finding local interfaces without running ifconfig
+from interfaces import inventory
+#for running the scan event loop beside a synchronous caller
+import threading
+#for sharding large networks across worker processes
 import concurrent.futures
+#for telling shard worker processes to stop
+import multiprocessing
 #for detecting operation system
 import platform
 #for running os commands
@@ -16,6 +20,39 @@ import subprocess
 import re
 #for possible future os operations
 import os
+#for measuring probe round trips
+import time
+#for the native icmp sweep backend
+from icmp_sweep import open_async_prober
+#for the packet rate cap and adaptive timeouts
+from ratelimit import TokenBucket, AdaptiveTimeout
+#for racing several liveness probes per host
+from liveness import MultiProber
+#for probe counters and stage timings
+import metrics
+#for target lists of several networks, ranges and addresses
+from targets import TargetSet, ADDRESS_CLASSES, cidr_hosts, read_target_file, split_specs
+#for probing in a seeded pseudo-random order instead of subnet by subnet
+from permute import permuted_hosts, new_seed
+
+# Probes in flight at once; the semaphore in async_scan_network is the only limit
+DEFAULT_CONCURRENCY = 2000
+# Seconds to wait for an echo reply
+DEFAULT_TIMEOUT = 1.0
+# Each ping subprocess is a whole process, so that path is kept much lower
+PING_CONCURRENCY = 100
+# Shards per worker process, so a shard full of slow hosts doesn't leave other cores idle
+SHARDS_PER_WORKER = 4
+# Below this many addresses per shard the process startup costs more than it saves
+MIN_SHARD_SIZE = 256
+# How often, in seconds, a waiting scan checks whether it has been cancelled
+CANCEL_POLL_INTERVAL = 0.2
+# How shard worker processes start; never "fork", see worker_context
+WORKER_START_METHOD = "forkserver"
+
+PROBE_SECONDS = metrics.stage_seconds("probe")
+PING_SECONDS = metrics.stage_seconds("ping")
+PING_FORKS = metrics.subprocess_forks("ping")
 
 def print_app_name():
     print("""
@@ -33,38 +70,14 @@ def print_app_name():
                                                                       
           """)
     
-def get_local_ip_and_mask():
-    """
-    Detects the local IP address and subnet mask from the system.
-    Works for both Windows and Unix-like systems.
-    """
-    system = platform.system().lower() 
-    if system == 'windows':
-        output = subprocess.check_output("ipconfig", universal_newlines=True)  
-        ip_match = re.search(r'IPv4 Address[. ]*: ([\d.]+)', output)           
-        mask_match = re.search(r'Subnet Mask[. ]*: ([\d.]+)', output)          
-        if ip_match and mask_match:
-            return ip_match.group(1), mask_match.group(1)                      
-    else:
-        
-        output = subprocess.check_output("ifconfig", shell=True, universal_newlines=True)
-        ip_match = re.search(r'inet ([\d.]+).*?netmask (0x[\da-f]+|[\d.]+)', output)
-        if ip_match:
-            ip = ip_match.group(1)                                            
-            mask = ip_match.group(2)                                           
-            if mask.startswith("0x"):                                          
-                mask = socket.inet_ntoa(int(mask,16).to_bytes(4, "big"))       
-            return ip, mask
-    # 
-    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    try:
-        s.connect(('8.8.8.8', 80))                                             
-        ip = s.getsockname()[0]
-    except Exception:
-        ip = '127.0.0.1'
-    finally:
-        s.close()
-    return ip, '255.255.255.0'   
+def get_local_ip_and_mask(interface=None):
+    """
+    Returns the local IP address and subnet mask scans default to.
+    Comes from the cached interface inventory, so no command is run; pass
+    an interface name (or set NETSCAN_INTERFACE) to pick a specific one.
+    """
+    address = inventory.primary(interface).interface
+    return str(address.ip), str(address.netmask)
 def mask_to_cidr(mask):
     """
     Converts a dotted-decimal subnet mask (e.g., 255.255.255.0) to CIDR notation (e.g., 24).
@@ -72,25 +85,56 @@ def mask_to_cidr(mask):
     return sum(bin(int(x)).count('1') for x in mask.split('.'))
 # 
 # 
-def parse_network(arg=None):
+def parse_network(arg=None, interface=None):
     """
     Parses the network argument and returns an ipaddress.ip_network object.
-    Handles no argument (auto-detect), /24, /16, etc.
+    Handles no argument (auto-detect, from `interface` if given), CIDRs
+    (/24, /16, etc.), partial addresses like 192.168.1 (its /24) and bare
+    addresses, which are just that one host.
     """
     if not arg:
-        ip, mask = get_local_ip_and_mask()                                    
+        ip, mask = get_local_ip_and_mask(interface)                                    
         cidr = mask_to_cidr(mask)                                              
         return ipaddress.ip_network(f"{ip}/{cidr}", strict=False)              
     if '/' in arg:
         return ipaddress.ip_network(arg, strict=False)                         
     elif re.match(r'^\d+\.\d+\.\d+$', arg):
         return ipaddress.ip_network(arg + '.0/24', strict=False)               
-    elif re.match(r'^\d+\.\d+\.\d+\.\d+$', arg):
-        return ipaddress.ip_network(arg + '/24', strict=False)                 
-    else:
-        raise ValueError("Invalid network format")                             
+    try:
+        # One host, as in a target list; 192.168.1.0/24 or 192.168.1 scans its network
+        return ipaddress.ip_network(ipaddress.ip_address(arg))
+    except ValueError:
+        raise ValueError("Invalid network format") from None
+
+# 
+def parse_targets(specs=(), exclude=(), interface=None):
+    """
+    Parses what to scan. A single network argument (or none) gives an
+    ipaddress network, exactly as parse_network does. Several targets,
+    address ranges like 10.0.0.5-10.0.3.200 or any exclusions give a
+    TargetSet: overlapping targets merged and excluded addresses taken
+    out. A bare address is just that address either way.
+    Raises ValueError for bad targets or when nothing is left to scan.
+    """
+    specs = list(specs)
+    if len(specs) <= 1 and not exclude and not any("-" in spec for spec in specs):
+        return parse_network(specs[0] if specs else None, interface)
+    if not specs:
+        specs = [str(parse_network(None, interface))]
+    targets = TargetSet.parse(specs, exclude)
+    if not targets:
+        raise ValueError("No addresses left to scan after exclusions")
+    return targets
 
 # 
+def ping_command(ip, timeout=DEFAULT_TIMEOUT):
+    """
+    Returns the ping command line for a single echo request on this OS.
+    """
+    if platform.system().lower() == "windows":
+        return ["ping", "-n", "1", "-w", str(max(1, int(timeout * 1000))), str(ip)]
+    return ["ping", "-c", "1", "-W", f"{timeout:g}", str(ip)]
+
 #
 def ping(ip):
     """
@@ -98,22 +142,272 @@ def ping(ip):
     Returns the IP if online (responds to ping), otherwise None.
     """
     ip = str(ip)                                                               
-    system = platform.system().lower()                                         
-    if system == "windows":
-        cmd = ["ping", "-n", "1", "-w", "1000", ip]                          
-    else:
-        cmd = ["ping", "-c", "1", "-W", "1", ip]                               
+    cmd = ping_command(ip)
+    metrics.probes_sent.inc()
+    PING_FORKS.inc()
     try:
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=2)
+        with PING_SECONDS.time():
+            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=2)
         if re.search(r"ttl", result.stdout, re.IGNORECASE):                    
+            metrics.probe_replies.inc()
             return ip
     except subprocess.TimeoutExpired:
-        return None                                                            
+        pass
     except Exception:
         return None                                                           
+    metrics.probe_timeouts.inc()
+    return None
+
+# 
+class SubprocessPinger:
+    """
+    Fallback prober that runs the system ping command without blocking the event loop.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        self.timeout = timeout
+
+    async def probe(self, ip, timeout=None):
+        timeout = timeout or self.timeout
+        PING_FORKS.inc()
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *ping_command(ip, timeout), stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+        except OSError:
+            return False
+        try:
+            stdout, _ = await asyncio.wait_for(proc.communicate(), timeout=timeout + 1)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            return False
+        return re.search(rb"ttl", stdout, re.IGNORECASE) is not None
+
+    def close(self):
+        pass
+
+# Extra probe backends by name: factory(timeout) -> prober with
+# `async probe(ip, timeout=None)` and `close()` (see bench.py for one)
+PROBER_FACTORIES = {}
+
+def register_prober(name, factory):
+    """
+    Makes a custom prober available as backend `name`. Sharded scans send
+    the factory to their worker processes, so it has to pickle: use a
+    module-level function or class, or a functools.partial of one.
+    """
+    PROBER_FACTORIES[name] = factory
+
+# 
+def open_prober(backend="auto", timeout=DEFAULT_TIMEOUT):
+    """
+    Returns a prober for the running event loop.
+    backend: "icmp" sends echo requests from one native socket,
+             "ping" runs one ping subprocess per host,
+             "auto" uses icmp and falls back to ping if the socket can't be opened,
+             "multi" races icmp (when available), tcp and udp probes per host.
+    The arp backend has no per-address prober; see arp_sweep.
+    Backends added with register_prober are looked up first.
+    """
+    if backend in PROBER_FACTORIES:
+        return PROBER_FACTORIES[backend](timeout)
+    if backend not in ("auto", "icmp", "ping", "multi"):
+        raise ValueError(f"Unknown probe backend: {backend}")
+    if backend == "multi":
+        return MultiProber(timeout, open_async_prober(timeout))
+    if backend in ("auto", "icmp"):
+        prober = open_async_prober(timeout)
+        if prober:
+            return prober
+        print("ICMP socket unavailable, falling back to ping subprocesses")
+    return SubprocessPinger(timeout)
+
+# 
+async def async_probe_batches(addresses, concurrency=DEFAULT_CONCURRENCY, backend="auto", timeout=DEFAULT_TIMEOUT,
+                              rate=None, adaptive=True, prober=None, budget=None):
+    """
+    Probes addresses on the running event loop and yields lists of
+    (ip, online) as probes finish.
+    Addresses are pulled lazily: a new probe only starts when a slot frees up,
+    and a slot stays taken until its result has been handed to the caller, so
+    at most `concurrency` probes and unread results exist at any time.
+    rate caps the probes sent per second. With adaptive, each probe's timeout
+    comes from the RTTs seen in its subnet so far, never above `timeout`;
+    pass an AdaptiveTimeout instead of True to keep what it learned across calls.
+    A caller that probes repeatedly can pass its own open prober, which is
+    then left open, instead of a backend. With a ratelimit.ProbeBudget,
+    each probe also holds one of its slots while in flight, so scans that
+    share it stay under its size between them.
+    online is True or False, except with the multi backend, where a host
+    that answered gets the name of the winning method ("tcp/443") instead.
+    """
+    owns_prober = prober is None
+    if owns_prober:
+        prober = open_prober(backend, timeout)
+    if isinstance(prober, SubprocessPinger):
+        concurrency = min(concurrency, PING_CONCURRENCY)
+    elif isinstance(prober, MultiProber):
+        concurrency = prober.max_concurrency(concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    bucket = TokenBucket(rate) if rate else None
+    if isinstance(adaptive, AdaptiveTimeout):
+        timeouts = adaptive
+    else:
+        timeouts = AdaptiveTimeout(timeout) if adaptive else None
+    results = asyncio.Queue()
+    finished = object()
+    tasks = set()
+
+    async def probe_one(ip):
+        metrics.probes_sent.inc()
+        sent = time.monotonic()
+        try:
+            if timeouts:
+                is_online = await prober.probe(ip, timeouts.timeout_for(ip))
+                if is_online:
+                    timeouts.observe(ip, time.monotonic() - sent)
+            else:
+                is_online = await prober.probe(ip)
+        except Exception:
+            is_online = False
+        PROBE_SECONDS.observe(time.monotonic() - sent)
+        (metrics.probe_replies if is_online else metrics.probe_timeouts).inc()
+        results.put_nowait((ip, is_online))
+
+    async def feed():
+        for count, ip in enumerate(addresses, 1):
+            await semaphore.acquire()
+            if bucket:
+                await bucket.acquire()
+            if budget:
+                await budget.acquire()
+            task = asyncio.create_task(probe_one(str(ip)))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            if budget:
+                # Also runs for a task cancelled before it started
+                task.add_done_callback(lambda _: budget.release())
+            # Let replies be read between bursts of sends
+            if count % 64 == 0:
+                await asyncio.sleep(0)
+        while tasks:
+            await asyncio.wait(set(tasks))
+        results.put_nowait(finished)
+
+    feeder = asyncio.create_task(feed())
+    try:
+        while True:
+            batch = [await results.get()]
+            while not results.empty():
+                batch.append(results.get_nowait())
+            done = batch[-1] is finished
+            if done:
+                batch.pop()
+            for _ in batch:
+                semaphore.release()
+            if batch:
+                yield batch
+            if done:
+                return
+    finally:
+        pending = [feeder, *tasks]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        if owns_prober:
+            prober.close()
+
+# 
+async def async_scan_network(network, concurrency=DEFAULT_CONCURRENCY, backend="auto", on_result=None):
+    """
+    Probes all hosts in the given network concurrently on the event loop.
+    on_result(ip, online) is called as each probe finishes.
+    Returns a list of online hosts.
+    """
+    online = []
+    async for batch in async_probe_batches(network.hosts(), concurrency, backend):
+        for ip, is_online in batch:
+            if is_online:
+                online.append(ip)
+            if on_result:
+                on_result(ip, is_online)
+    return online
 
 # 
-def scan_network(network):
+def probe_host_batches(addresses, backend="auto", concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT,
+                       cancel=None, rate=None, adaptive=True, budget=None):
+    """
+    Probes every address and yields lists of (ip, online) for the probes
+    that finished since the last list.
+    The event loop runs on its own thread, so probes already in flight keep
+    going while the caller works on the results.
+    cancel is an optional Event; once it is set the generator stops and
+    every outstanding probe is cancelled.
+    rate, adaptive and budget are passed on to async_probe_batches.
+    """
+    loop = asyncio.new_event_loop()
+    runner = threading.Thread(target=loop.run_forever, daemon=True)
+    runner.start()
+    batches = async_probe_batches(addresses, concurrency, backend, timeout, rate, adaptive, budget=budget)
+    waiting = []
+
+    async def next_batch():
+        waiting.append(asyncio.current_task())
+        try:
+            return await batches.__anext__()
+        finally:
+            waiting.remove(asyncio.current_task())
+
+    async def shutdown():
+        # A cancelled wait unwinds the generator, which cancels its probes
+        for task in list(waiting):
+            task.cancel()
+        await asyncio.gather(*waiting, return_exceptions=True)
+        await batches.aclose()
+
+    try:
+        while not (cancel and cancel.is_set()):
+            future = asyncio.run_coroutine_threadsafe(next_batch(), loop)
+            while True:
+                try:
+                    batch = future.result(CANCEL_POLL_INTERVAL if cancel else None)
+                    break
+                except concurrent.futures.TimeoutError:
+                    if cancel.is_set():
+                        return
+                except StopAsyncIteration:
+                    return
+            yield batch
+    finally:
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        runner.join()
+        loop.close()
+
+# 
+def probe_hosts(addresses, backend="auto", concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT, cancel=None,
+                rate=None, adaptive=True, budget=None):
+    """
+    Probes every address and yields (ip, online) as each probe finishes.
+    See probe_host_batches for the other options.
+    """
+    for batch in probe_host_batches(addresses, backend, concurrency, timeout, cancel, rate, adaptive, budget):
+        yield from batch
+
+# 
+def iter_scan(network, backend="auto", concurrency=DEFAULT_CONCURRENCY, rate=None, seed=None):
+    """
+    Scans the network and yields each online host as soon as it answers.
+    Memory use stays flat however large the network is.
+    rate optionally caps the probes sent per second; with a seed the
+    addresses are probed in random order (see scan_addresses).
+    """
+    for ip, is_online in probe_hosts(scan_addresses(network, seed), backend, concurrency, rate=rate):
+        if is_online:
+            yield ip
+
+# 
+def scan_network(network, backend="auto"):
     """
     Scans all hosts in the given network in parallel.
     Returns a list of online hosts.
@@ -121,19 +415,185 @@ def scan_network(network):
     print(f"Scanning network: {network}")                                      
     online = []                                                                
     try:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=100) as executor:   
-            futures = {executor.submit(ping, ip): ip for ip in network.hosts()}   
-            for future in concurrent.futures.as_completed(futures):                
-                try:
-                    result = future.result()                                       
-                    if result:
-                        online.append(result)                                      
-                except Exception:
-                    continue                                                       
+        for ip in iter_scan(network, backend):
+            online.append(ip)                                                  
     except KeyboardInterrupt:
         print("\nScan interrupted by user. Showing results so far...")         
     return online
 #
+# 
+def host_range(network):
+    """
+    Returns the first and last host address of the network as integers,
+    matching what network.hosts() would produce.
+    """
+    _, first, last = cidr_hosts(network)
+    return first, last
+
+# 
+def target_ranges(network):
+    """
+    The (version, first, last) integer ranges to scan for a network
+    (its hosts) or a TargetSet (its merged ranges).
+    """
+    if isinstance(network, TargetSet):
+        return network.ranges
+    return [cidr_hosts(network)]
+
+# 
+def scan_addresses(network, seed=None):
+    """
+    The addresses a scan of the network or TargetSet probes: ascending
+    without a seed, otherwise every address once in the seeded pseudo-random
+    order of permute.permuted_hosts, so consecutive probes go to different
+    subnets instead of one gateway at a time.
+    """
+    if seed is None:
+        return network.hosts()
+    return permuted_hosts(target_ranges(network), seed)
+
+# 
+def count_hosts(network):
+    """How many addresses a scan of the network or TargetSet probes"""
+    return sum(last - first + 1 for _, first, last in target_ranges(network))
+
+# 
+def shard_network(network, workers):
+    """
+    Splits the hosts of a network or TargetSet into shards of about the
+    same size for worker processes. Each shard is an ascending list of
+    (version, first, last) integer ranges; a shard can span the end of
+    one target range and the start of the next.
+    Ranges follow the parent's hosts(), so addresses like a sub-prefix's
+    network or broadcast address are still scanned.
+    """
+    total = count_hosts(network)
+    shards = max(1, min(workers * SHARDS_PER_WORKER, total // MIN_SHARD_SIZE))
+    size = -(-total // shards)
+    result = []
+    shard, room = [], size
+    for version, first, last in target_ranges(network):
+        while first <= last:
+            end = min(last, first + room - 1)
+            shard.append((version, first, end))
+            room -= end - first + 1
+            first = end + 1
+            if not room:
+                result.append(shard)
+                shard, room = [], size
+    if shard:
+        result.append(shard)
+    return result
+
+# Set in each shard worker process by its pool initializer
+shard_stop = None
+shard_budget = None
+
+def init_shard_worker(stop, factories, budget=None):
+    global shard_stop, shard_budget
+    shard_stop = stop
+    shard_budget = budget
+    # Workers start fresh, without the parent's custom backends
+    PROBER_FACTORIES.update(factories)
+
+# 
+def worker_context():
+    """
+    The multiprocessing context shard workers start from. Forking the web
+    app or monitor would copy its threads' locks and open sockets into the
+    workers, so they start fresh from a forkserver (spawn where there is
+    none, as on Windows).
+    """
+    method = WORKER_START_METHOD
+    if method not in multiprocessing.get_all_start_methods():
+        method = "spawn"
+    return multiprocessing.get_context(method)
+
+# 
+def scan_shard(ranges, backend="auto", concurrency=DEFAULT_CONCURRENCY, rate=None, seed=None, shard=0, shards=1):
+    """
+    Worker process entry point: scans a list of (version, first, last)
+    integer address ranges and returns (addresses scanned, online hosts in
+    ascending order, {ip: method} for hosts whose winning liveness method
+    is known).
+    With a seed, the ranges are the whole scan's and this worker probes
+    every shards-th address of the seeded random order, from shard on.
+    """
+    total = sum(last - first + 1 for _, first, last in ranges)
+    if seed is None:
+        addresses = (ADDRESS_CLASSES[version](i) for version, first, last in ranges for i in range(first, last + 1))
+        scanned = total
+    else:
+        addresses = permuted_hosts(ranges, seed, shard, shards)
+        scanned = len(range(shard, total, shards))
+    online = []
+    methods = {}
+    for ip, is_online in probe_hosts(addresses, backend, concurrency, cancel=shard_stop, rate=rate,
+                                     budget=shard_budget):
+        if is_online:
+            online.append(ip)
+            if isinstance(is_online, str):
+                methods[ip] = is_online
+    online.sort(key=lambda ip: (ipaddress.ip_address(ip).version, int(ipaddress.ip_address(ip))))
+    return scanned, online, methods
+
+# 
+def iter_shard_results(network, workers, backend="auto", concurrency=DEFAULT_CONCURRENCY, cancel=None, rate=None,
+                       seed=None, budget=None):
+    """
+    Scans the network (or TargetSet) with one process per worker and yields
+    (addresses scanned, online hosts, {ip: method}) for each shard.
+    Without a seed, shards are address ranges and come back in address
+    order, so the hosts are already sorted. With a seed, every shard
+    interleaves the whole target set in the seeded random order.
+    concurrency is the probe limit of each worker process and rate the
+    probes per second of the whole scan, split between them. The workers
+    take their probes' slots from the optional ProbeBudget, which has to
+    come from worker_context(). When cancel is set, or the caller stops
+    early, the workers abandon their shards.
+    """
+    shards = shard_network(network, workers)
+    if seed is None:
+        shards = [(ranges, 0, 1) for ranges in shards]
+    else:
+        shards = [(target_ranges(network), shard, len(shards)) for shard in range(len(shards))]
+    worker_rate = rate / workers if rate else None
+    context = worker_context()
+    stop = context.Event()
+    factories = {backend: PROBER_FACTORIES[backend]} if backend in PROBER_FACTORIES else {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_shard_worker,
+                                                initargs=(stop, factories, budget)) as executor:
+        futures = [executor.submit(scan_shard, ranges, backend, concurrency, worker_rate, seed, shard, count)
+                   for ranges, shard, count in shards]
+        try:
+            for future in futures:
+                while True:
+                    try:
+                        result = future.result(CANCEL_POLL_INTERVAL if cancel else None)
+                        break
+                    except concurrent.futures.TimeoutError:
+                        if cancel.is_set():
+                            return
+                # The workers' own metrics die with them; count their probes here
+                scanned, online, _ = result
+                metrics.probes_sent.inc(scanned)
+                metrics.probe_replies.inc(len(online))
+                metrics.probe_timeouts.inc(scanned - len(online))
+                yield result
+        finally:
+            stop.set()
+            for future in futures:
+                future.cancel()
+
+# 
+def iter_scan_sharded(network, workers, backend="auto", rate=None, seed=None):
+    """
+    Like iter_scan, but spread over worker processes.
+    Online hosts are yielded one shard at a time, in ascending IP order
+    within each shard (and overall without a seed).
+    """
+    for _, online, _ in iter_shard_results(network, workers, backend, rate=rate, seed=seed):
+        yield from online
 
 #
 def show_help():
@@ -141,17 +601,244 @@ def show_help():
     Prints usage and help information.
     """
     print(
-        "Usage: netscan [network]\n"
+        "Usage: netscan [options] [target ...]\n"
+        "       netscan monitor [options] [network ...]  (see netscan monitor --help)\n"
         "Scan a network for online devices.\n\n"
+        "Targets are networks (192.168.1.0/24, or 192.168.1 for its /24), ranges\n"
+        "(10.0.0.5-10.0.3.200, 10.0.0.5-200) and single addresses: 192.168.1.7\n"
+        "is that one host, never its /24. Without a target the local network is scanned.\n\n"
         "Options:\n"
         "  -h, --help     Show this help message\n"
+        "  --workers N    Split the network across N worker processes\n"
+        "  --incremental  Rescan using earlier results and print what changed;\n"
+        "                 runs in one process, last run's hosts first (no --workers or --seed)\n"
+        "  --rate N       Send at most N probes per second\n"
+        "  --backend B    How hosts are probed: auto (default), icmp, ping,\n"
+        "                 multi (races icmp, tcp 80/443/22 and udp per host), or\n"
+        "                 arp for directly attached networks (also finds MACs)\n"
+        "  --interface I  Without a network, scan the one on interface I\n"
+        "  --targets FILE Also scan the networks, ranges and addresses listed in FILE\n"
+        "  --exclude LIST Skip these networks, ranges or addresses (comma separated)\n"
+        "  --exclude-file FILE\n"
+        "                 Skip the targets listed in FILE\n"
+        "  --ports LIST   Port scan the hosts found: top20, top100, top1000\n"
+        "                 or a list like 22,80,8000-8100\n"
+        "  --order O      Probe addresses in random (default) or sequential order;\n"
+        "                 random spreads probes across subnets and their routers\n"
+        "  --seed N       Seed of the random order, to repeat an earlier scan's order\n"
+        "  --stats        Print probe counts and stage timings at the end\n"
         "Examples:\n"
         "  netscan                 # Scan current local network\n"
-        "  netscan 192.168.1.0     # Scan 192.168.1.0/24\n"
         "  netscan 192.168.1       # Scan 192.168.1.0/24\n"
-        "  netscan 192.168.1.0/24  # Scan 192.168.1.0/24"
+        "  netscan 192.168.1.0/24  # Scan 192.168.1.0/24\n"
+        "  netscan 192.168.1.7     # Scan just 192.168.1.7\n"
+        "  netscan 10.0.0.0/24 10.0.5.1-10.0.5.40 10.0.9.7  # Scan several targets at once\n"
+        "  netscan --targets hosts.txt --exclude 10.0.0.1  # Scan a target list but not the gateway\n"
+        "  netscan --workers 8 10.0.0.0/16  # Scan a /16 on 8 processes\n"
+        "  netscan --rate 500 10.0.0.0/16   # Scan a /16 at 500 probes per second\n"
+        "  netscan --ports top100 192.168.1 # Also find open ports on each host\n"
+        "  netscan --backend arp 192.168.1  # Find hosts that drop ping on the local segment"
     )
 # 
+def print_open_ports(hosts, ports):
+    """
+    Port scans the given hosts and prints the open ports of each.
+    Returns {ip: open ports}.
+    """
+    from portscan import scan_ports
+
+    print(f"\nScanning {len(ports)} ports on {len(hosts)} hosts...")
+    with metrics.stage_seconds("ports").time():
+        open_ports = scan_ports(hosts, ports)
+    for ip in hosts:
+        if open_ports.get(ip):
+            print(f"{ip}: {', '.join(map(str, open_ports[ip]))}")
+    return open_ports
+
+# 
+def scan_arp(network, rate=None, ports=None):
+    """
+    ARP sweeps a directly attached network and prints each host with its
+    MAC address as it answers.
+    """
+    from arp_sweep import iter_arp_sweep, ARP_RATE
+
+    print(f"Scanning network: {network} (arp)")
+    print("\nOnline hosts:")
+    found = []
+    try:
+        for _, replies in iter_arp_sweep(network, rate=rate or ARP_RATE):
+            for ip, mac in replies:
+                print(f"{ip:<16} {mac}")
+                found.append(ip)
+    except KeyboardInterrupt:
+        print("\nScan interrupted by user.")
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}")
+        return
+    print(f"\n{len(found)} hosts online")
+    if ports and found:
+        print_open_ports(found, ports)
+
+# 
+def scan_incremental(network, backend="auto", rate=None, ports=None):
+    """
+    Runs an incremental scan with the given probe backend, saves it to the
+    scan history and prints the hosts as they answer followed by the
+    changes since the last scan.
+    """
+    from datetime import datetime
+    from store import ScanStore
+    from neighbors import NeighborCache
+    from incremental import IncrementalScan
+    from hosttable import HostTable
+
+    store = ScanStore()
+    plan = IncrementalScan(store, network)
+    neighbors = NeighborCache()
+    start = datetime.now()
+    scan_id = store.create_scan(str(network), start.strftime("%Y-%m-%d %H:%M:%S"), "incremental")
+
+    print(f"Scanning network: {network} (incremental, run {plan.run})")
+    print("\nOnline hosts:")
+    hosts = HostTable()
+    try:
+        for ip, is_online in plan.probe(backend, rate=rate):
+            if is_online:
+                print(ip)
+                hosts.append({'ip': ip, 'hostname': 'Unknown', 'mac_address': neighbors.lookup(ip) or 'Unknown'})
+    except KeyboardInterrupt:
+        print("\nScan interrupted by user.")
+        store.fail_scan(scan_id, "Interrupted")
+        return
+
+    if ports:
+        open_ports = print_open_ports(hosts.ip_strings(), ports)
+        for host in hosts:
+            host['open_ports'] = open_ports.get(host.ip, [])
+    store.add_hosts(scan_id, hosts)
+    duration = (datetime.now() - start).total_seconds()
+    store.finish_scan(scan_id, f"{duration:.1f}s", len(hosts), plan.planned())
+    plan.commit()
+    diff = plan.diff(hosts)
+    store.set_diff(scan_id, diff)
+
+    print(f"\n{len(hosts)} hosts online, {plan.skipped} long-dead addresses skipped")
+    for ip in diff["new"]:
+        print(f"  + {ip}")
+    for ip in diff["gone"]:
+        print(f"  - {ip}")
+    for change in diff["changed"]:
+        details = ", ".join(f"{field} {value['from']} -> {value['to']}"
+                            for field, value in change.items() if field != "ip")
+        print(f"  ~ {change['ip']}: {details}")
+
+# 
+def scan_online(network, options):
+    """
+    Probes the network with the chosen backend (sharded if asked) and
+    prints each host as it answers, then port scans them if asked.
+    Addresses are probed in random order unless --order sequential.
+    """
+    seed = None
+    if options["order"] == "random":
+        seed = options["seed"] if options["seed"] is not None else new_seed()
+    if options["workers"] > 1:
+        hosts = iter_scan_sharded(network, options["workers"], options["backend"], rate=options["rate"], seed=seed)
+    else:
+        hosts = iter_scan(network, options["backend"], rate=options["rate"], seed=seed)
+
+    print(f"Scanning network: {network}")
+    if seed is not None:
+        # Pass the seed back with --seed to probe in the same order again
+        print(f"Probe order: random, seed {seed}")
+    print("\nOnline hosts:")
+    found = []
+    try:
+        # Print each host the moment it answers instead of waiting for the whole sweep
+        for host in hosts:
+            print(host)
+            found.append(host)
+    except KeyboardInterrupt:
+        print("\nScan interrupted by user.")                                   
+    print(f"\n{len(found)} hosts online")
+    if options["ports"] and found:
+        print_open_ports(found, options["ports"])
+
+# 
+def parse_args(args):
+    """
+    Splits command-line arguments into options and the targets to scan
+    (network arguments plus the contents of --targets files).
+    Raises ValueError for unknown or malformed options, OSError for
+    unreadable target files.
+    """
+    options = {"targets": [], "exclude": [], "workers": 1, "incremental": False, "rate": None, "ports": None,
+               "backend": "auto", "interface": None, "stats": False, "order": "random", "seed": None}
+    positional = []
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg == "--workers":
+            if not args or not args[0].isdigit() or int(args[0]) < 1:
+                raise ValueError("--workers needs a positive number")
+            options["workers"] = int(args.pop(0))
+        elif arg == "--rate":
+            try:
+                options["rate"] = float(args.pop(0)) if args else 0
+            except ValueError:
+                options["rate"] = 0
+            if options["rate"] <= 0:
+                raise ValueError("--rate needs a positive number")
+        elif arg == "--ports":
+            from portscan import parse_ports
+            if not args:
+                raise ValueError("--ports needs a port list")
+            options["ports"] = parse_ports(args.pop(0))
+        elif arg == "--interface":
+            if not args:
+                raise ValueError("--interface needs an interface name")
+            options["interface"] = args.pop(0)
+        elif arg == "--backend":
+            if not args or args[0] not in ("auto", "icmp", "ping", "multi", "arp"):
+                raise ValueError("--backend needs one of auto, icmp, ping, multi, arp")
+            options["backend"] = args.pop(0)
+        elif arg in ("--targets", "--exclude-file"):
+            if not args:
+                raise ValueError(f"{arg} needs a file of targets")
+            specs = read_target_file(args.pop(0))
+            options["targets" if arg == "--targets" else "exclude"].extend(specs)
+        elif arg == "--exclude":
+            if not args:
+                raise ValueError("--exclude needs a list of targets")
+            options["exclude"].extend(split_specs([args.pop(0)]))
+        elif arg == "--order":
+            if not args or args[0] not in ("random", "sequential"):
+                raise ValueError("--order needs random or sequential")
+            options["order"] = args.pop(0)
+        elif arg == "--seed":
+            if not args or not args[0].isdigit():
+                raise ValueError("--seed needs a non-negative integer")
+            options["seed"] = int(args.pop(0))
+        elif arg == "--incremental":
+            options["incremental"] = True
+        elif arg == "--stats":
+            options["stats"] = True
+        elif arg.startswith("-"):
+            raise ValueError(f"Unknown option: {arg}")
+        else:
+            positional.append(arg)
+    if options["backend"] == "arp" and (options["incremental"] or options["workers"] > 1):
+        raise ValueError("--backend arp can't be combined with --incremental or --workers")
+    # Incremental scans probe last run's hosts first from this process, so
+    # there is no shard split or seeded order for these to change
+    if options["incremental"] and (options["workers"] > 1 or options["seed"] is not None):
+        raise ValueError("--incremental can't be combined with --workers or --seed")
+    if options["seed"] is not None and options["order"] == "sequential":
+        raise ValueError("--seed only applies to --order random")
+    options["targets"] = positional + options["targets"]
+    return options
+# 
 
 # 
 # Main
@@ -161,36 +848,37 @@ def main():
     Main function: parses arguments, runs scan, prints results.
     """
     args = sys.argv[1:]                                                        
-    if not args:
-        try:
-            network = parse_network()                                          
-        except Exception as e:
-            print(f"Error: {e}")
-            show_help()
-            return
-    elif args[0] in ['-h', '--help']:
-        show_help()                                                          
+    if args[:1] == ["monitor"]:
+        from monitor import main as monitor_main
+        monitor_main(args[1:])
         return
-    elif len(args) == 1:
-        try:
-            network = parse_network(args[0])                                   
-        except Exception as e:
-            print(f"Error: {e}")
-            show_help()
-            return
-    else:
-        show_help()                                                            
+    if any(arg in ['-h', '--help'] for arg in args):
+        show_help()                                                          
         return
-
     try:
-        online_hosts = scan_network(network)                                   
-        print("\nOnline hosts:")                                               
-        for host in sorted(online_hosts, key=lambda x: tuple(map(int, x.split('.')))):
-            print(host)                                                        
-    except KeyboardInterrupt:
-        print("\nScan interrupted by user.")                                   
+        options = parse_args(args)
+        network = parse_targets(options["targets"], options["exclude"], options["interface"])
+        if isinstance(network, TargetSet) and (options["incremental"] or options["backend"] == "arp"):
+            raise ValueError("--incremental and --backend arp scan a single network")
+    except Exception as e:
+        print(f"Error: {e}")
+        show_help()
+        return
 
+    with metrics.stage_seconds("scan").time():
+        if options["incremental"]:
+            scan_incremental(network, options["backend"], options["rate"], options["ports"])
+        elif options["backend"] == "arp":
+            scan_arp(network, options["rate"], options["ports"])
+        else:
+            scan_online(network, options)
+    if options["stats"]:
+        print("\nScan statistics:")
+        print(metrics.registry.summary())
 
 if __name__ == "__main__":
     main()
-    input("Press Enter to exit...")
\ No newline at end of file
+    # Keeps a console window opened by double-clicking from closing; never waits
+    # when run from cron, a pipe or as the monitor
+    if sys.stdin.isatty() and sys.argv[1:2] != ["monitor"]:
+        input("Press Enter to exit...")
\ No newline at end of file
@@ -0,0 +1,479 @@
+"""
+MAC vendor lookup from the IEEE registries.
+
+Loads the MA-L (24-bit), MA-M (28-bit) and MA-S (36-bit) assignment files
+once into sorted integer arrays, so a lookup is a couple of binary searches
+and no per-call dict building. The compiled index is pickled next to the
+registry files so later startups skip parsing.
+
+Registry files are the IEEE CSV downloads (oui.csv, mam.csv, oui36.csv)
+or the MA-L text file (oui.txt). They are looked for in $NETSCAN_OUI_DIR,
+./oui next to this file and /usr/share/ieee-data; without them only the
+small built-in table below is used.
+"""
+
+#for the registry search path
+import os
+#for reading the IEEE csv files
+import csv
+#for the compact sorted prefix columns
+from array import array
+#for binary search over the columns
+from bisect import bisect_right
+#for the compiled index cache
+import pickle
+#for regular expressions
+import re
+#for the benchmark
+import sys
+import time
+import random
+
+UNKNOWN_VENDOR = 'Unknown Vendor'
+
+REGISTRY_FILES = ("oui.csv", "mam.csv", "oui36.csv", "oui.txt")
+SEARCH_DIRS = [
+    os.environ.get("NETSCAN_OUI_DIR", ""),
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "oui"),
+    "/usr/share/ieee-data",
+]
+INDEX_CACHE = "netscan_oui.idx"
+INDEX_VERSION = 1
+
+# Prefix lengths in bits, longest first so the most specific assignment wins
+PREFIX_BITS = (36, 28, 24)
+
+TXT_LINE = re.compile(r'^\s*([0-9A-Fa-f]{2})-([0-9A-Fa-f]{2})-([0-9A-Fa-f]{2})\s+\(hex\)\s+(.*\S)')
+
+# Used when no registry file is installed
+BUILTIN_VENDORS = {
+    '00:50:56': 'VMware',
+    '08:00:27': 'VirtualBox',
+    '52:54:00': 'QEMU/KVM',
+    '00:0C:29': 'VMware',
+    '00:1C:42': 'Parallels',
+    '00:03:FF': 'Microsoft',
+    '00:15:5D': 'Microsoft Hyper-V',
+    '28:CD:C1': 'Apple',
+    '3C:07:54': 'Apple',
+    '88:E9:FE': 'Apple',
+    'DC:A6:32': 'Raspberry Pi',
+    'B8:27:EB': 'Raspberry Pi',
+    'E4:5F:01': 'Raspberry Pi',
+    '00:16:3E': 'Xen',
+    '00:1B:21': 'Intel',
+    '00:1F:16': 'Dell',
+    '00:14:22': 'Dell',
+    '70:B3:D5': 'TP-Link',
+    'EC:08:6B': 'TP-Link',
+    '50:C7:BF': 'TP-Link',
+    '00:1D:7E': 'Netgear',
+    '28:C6:8E': 'Netgear',
+    'A0:04:60': 'Netgear',
+    '00:26:F2': 'Netgear',
+    '00:90:A9': 'Western Digital',
+    '00:11:32': 'Synology',
+    '00:0D:B9': 'Netgear',
+    '20:4E:7F': 'Netgear',
+    '84:16:F9': 'TP-Link',
+    'C4:E9:84': 'TP-Link',
+    '98:DA:C4': 'TP-Link',
+    '00:23:CD': 'TP-Link',
+    '14:CC:20': 'TP-Link',
+    '50:D4:F7': 'TP-Link',
+    '74:DA:38': 'TP-Link',
+    '10:FE:ED': 'TP-Link',
+    '00:1E:58': 'WD My Book',
+    '00:04:ED': 'Linksys',
+    '68:7F:74': 'Linksys',
+    '20:AA:4B': 'Linksys',
+    '48:F8:B3': 'Linksys',
+    '00:18:39': 'Cisco',
+    '00:1B:0D': 'Cisco',
+    '00:1C:58': 'Cisco',
+    '00:21:A0': 'Cisco',
+    '00:23:04': 'Cisco',
+    '00:25:45': 'Cisco',
+    '00:26:98': 'Cisco',
+    '00:30:F2': 'Cisco',
+    '00:40:96': 'Cisco',
+    '00:50:0F': 'Cisco',
+    '00:50:73': 'Cisco',
+    '00:60:2F': 'Cisco',
+    '00:60:3E': 'Cisco',
+    '00:60:47': 'Cisco',
+    '00:60:5C': 'Cisco',
+    '00:60:70': 'Cisco',
+    '00:60:83': 'Cisco',
+    '00:90:0C': 'Cisco',
+    '00:90:21': 'Cisco',
+    '00:90:2B': 'Cisco',
+    '00:90:86': 'Cisco',
+    '00:90:92': 'Cisco',
+    '00:90:AB': 'Cisco',
+    '00:90:B1': 'Cisco',
+    '00:90:F2': 'Cisco',
+    '00:A0:C9': 'Cisco',
+    '00:B0:64': 'Cisco',
+    '00:C0:1D': 'Cisco',
+    '00:D0:06': 'Cisco',
+    '00:D0:58': 'Cisco',
+    '00:D0:79': 'Cisco',
+    '00:D0:90': 'Cisco',
+    '00:D0:97': 'Cisco',
+    '00:D0:BA': 'Cisco',
+    '00:D0:BB': 'Cisco',
+    '00:D0:BC': 'Cisco',
+    '00:D0:C0': 'Cisco',
+    '00:D0:D3': 'Cisco',
+    '00:D0:E4': 'Cisco',
+    '00:D0:FF': 'Cisco',
+    '00:E0:14': 'Cisco',
+    '00:E0:1E': 'Cisco',
+    '00:E0:34': 'Cisco',
+    '00:E0:4F': 'Cisco',
+    '00:E0:A3': 'Cisco',
+    '00:E0:B0': 'Cisco',
+    '00:E0:F7': 'Cisco',
+    '00:E0:F9': 'Cisco',
+    '00:E0:FE': 'Cisco',
+    '08:CC:68': 'Cisco',
+    '10:8C:CF': 'Cisco',
+    '18:8B:45': 'Cisco',
+    '1C:DF:0F': 'Cisco',
+    '20:37:06': 'Cisco',
+    '28:C7:CE': 'Cisco',
+    '2C:36:F8': 'Cisco',
+    '34:A8:4E': 'Cisco',
+    '34:BD:C8': 'Cisco',
+    '38:ED:18': 'Cisco',
+    '3C:CE:73': 'Cisco',
+    '40:55:39': 'Cisco',
+    '44:AD:D9': 'Cisco',
+    '48:44:F7': 'Cisco',
+    '4C:4E:35': 'Cisco',
+    '50:06:04': 'Cisco',
+    '50:17:FF': 'Cisco',
+    '50:3D:E5': 'Cisco',
+    '54:78:1A': 'Cisco',
+    '58:97:1E': 'Cisco',
+    '5C:50:15': 'Cisco',
+    '60:73:5C': 'Cisco',
+    '64:00:F1': 'Cisco',
+    '64:16:8D': 'Cisco',
+    '64:A0:E7': 'Cisco',
+    '68:BC:0C': 'Cisco',
+    '6C:20:56': 'Cisco',
+    '6C:41:6A': 'Cisco',
+    '6C:9C:ED': 'Cisco',
+    '70:CA:9B': 'Cisco',
+    '74:26:AC': 'Cisco',
+    '78:BA:F9': 'Cisco',
+    '7C:95:F3': 'Cisco',
+    '80:E0:1D': 'Cisco',
+    '84:78:AC': 'Cisco',
+    '88:43:E1': 'Cisco',
+    '88:F0:31': 'Cisco',
+    '8C:60:4F': 'Cisco',
+    '90:E2:BA': 'Cisco',
+    '94:F4:3E': 'Cisco',
+    '98:FC:11': 'Cisco',
+    '9C:AF:CA': 'Cisco',
+    'A0:E0:AF': 'Cisco',
+    'A0:F8:49': 'Cisco',
+    'A4:0C:C3': 'Cisco',
+    'A4:6C:2A': 'Cisco',
+    'A4:93:4C': 'Cisco',
+    'A8:9D:21': 'Cisco',
+    'AC:A0:16': 'Cisco',
+    'B0:7D:47': 'Cisco',
+    'B4:14:89': 'Cisco',
+    'B8:38:61': 'Cisco',
+    'B8:BE:BF': 'Cisco',
+    'BC:16:65': 'Cisco',
+    'BC:67:1C': 'Cisco',
+    'C0:62:6B': 'Cisco',
+    'C4:0A:CB': 'Cisco',
+    'C4:64:13': 'Cisco',
+    'C8:00:84': 'Cisco',
+    'C8:9C:1D': 'Cisco',
+    'CC:EF:48': 'Cisco',
+    'D0:57:4C': 'Cisco',
+    'D4:8C:B5': 'Cisco',
+    'D4:A0:2A': 'Cisco',
+    'D8:B1:90': 'Cisco',
+    'DC:7B:94': 'Cisco',
+    'E0:2F:6D': 'Cisco',
+    'E4:AA:5D': 'Cisco',
+    'E8:04:0B': 'Cisco',
+    'E8:B7:48': 'Cisco',
+    'EC:44:76': 'Cisco',
+    'F0:25:72': 'Cisco',
+    'F0:29:29': 'Cisco',
+    'F4:4E:05': 'Cisco',
+    'F8:C2:88': 'Cisco',
+    'FC:99:47': 'Cisco'
+}
+
+
+def mac_to_int(mac):
+    """
+    Converts a MAC address string (colon, dash or no separators) to a 48-bit int.
+    Returns None if it isn't a full MAC address.
+    """
+    digits = mac.replace(':', '').replace('-', '').replace('.', '')
+    if len(digits) != 12:
+        return None
+    try:
+        return int(digits, 16)
+    except ValueError:
+        return None
+
+
+def parse_registry_csv(path):
+    """
+    Yields (prefix_bits, prefix, organization) from an IEEE registry CSV.
+    The assignment column is 6, 7 or 9 hex digits for MA-L, MA-M and MA-S.
+    """
+    with open(path, newline='', encoding='utf-8', errors='replace') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            if len(row) < 3:
+                continue
+            assignment = row[1].strip()
+            bits = len(assignment) * 4
+            if bits not in PREFIX_BITS:
+                continue
+            try:
+                yield bits, int(assignment, 16), row[2].strip()
+            except ValueError:
+                continue
+
+
+def parse_registry_txt(path):
+    """
+    Yields (24, prefix, organization) from the IEEE MA-L text file,
+    using its "XX-XX-XX   (hex)   Organization" lines.
+    """
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            match = TXT_LINE.match(line)
+            if match:
+                yield 24, int(''.join(match.group(1, 2, 3)), 16), match.group(4)
+
+
+def parse_registry(path):
+    if path.endswith(".txt"):
+        return parse_registry_txt(path)
+    return parse_registry_csv(path)
+
+
+def find_registry_files():
+    """
+    Returns the registry files in the first search directory that has any.
+    """
+    for directory in SEARCH_DIRS:
+        if not directory or not os.path.isdir(directory):
+            continue
+        paths = [os.path.join(directory, name) for name in REGISTRY_FILES
+                 if os.path.exists(os.path.join(directory, name))]
+        # The csv carries the same MA-L data as the txt file
+        if any(p.endswith("oui.csv") for p in paths):
+            paths = [p for p in paths if not p.endswith(".txt")]
+        if paths:
+            return paths
+    return []
+
+
+class VendorIndex:
+    """
+    Prefix-aware vendor index.
+    Each prefix length has a sorted array of prefixes and a parallel array
+    of indexes into one de-duplicated list of vendor names.
+    """
+
+    def __init__(self, columns, vendors):
+        self.columns = columns  # bits -> (prefixes array, vendor id array)
+        self.vendors = vendors
+        # MA-M and MA-S blocks are carved out of a few hundred 24-bit blocks;
+        # only MACs in those blocks need the longer-prefix searches
+        self.split_blocks = frozenset(
+            [key >> 4 for key in columns[28][0]] + [key >> 12 for key in columns[36][0]])
+
+    @classmethod
+    def build(cls, entries):
+        """
+        Builds the index from (prefix_bits, prefix, organization) tuples.
+        Later entries for the same prefix replace earlier ones.
+        """
+        by_bits = {bits: {} for bits in PREFIX_BITS}
+        vendor_ids = {}
+        vendors = []
+        for bits, prefix, organization in entries:
+            vendor_id = vendor_ids.get(organization)
+            if vendor_id is None:
+                vendor_id = vendor_ids[organization] = len(vendors)
+                vendors.append(organization)
+            by_bits[bits][prefix] = vendor_id
+        columns = {}
+        for bits, assignments in by_bits.items():
+            keys = sorted(assignments)
+            columns[bits] = (array('Q', keys), array('I', (assignments[k] for k in keys)))
+        return cls(columns, vendors)
+
+    @classmethod
+    def from_files(cls, paths):
+        def entries():
+            for path in paths:
+                yield from parse_registry(path)
+        return cls.build(entries())
+
+    @classmethod
+    def builtin(cls):
+        return cls.build((24, int(oui.replace(':', ''), 16), vendor) for oui, vendor in BUILTIN_VENDORS.items())
+
+    def save(self, path):
+        data = {
+            "version": INDEX_VERSION,
+            "vendors": self.vendors,
+            "columns": {bits: (keys.tobytes(), ids.tobytes()) for bits, (keys, ids) in self.columns.items()},
+        }
+        with open(path, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError("Stale vendor index cache")
+        columns = {}
+        for bits, (key_bytes, id_bytes) in data["columns"].items():
+            keys, ids = array('Q'), array('I')
+            keys.frombytes(key_bytes)
+            ids.frombytes(id_bytes)
+            columns[bits] = (keys, ids)
+        return cls(columns, data["vendors"])
+
+    def lookup_int(self, value):
+        """
+        Returns the vendor for a 48-bit MAC integer, or None.
+        """
+        bits_to_check = PREFIX_BITS if (value >> 24) in self.split_blocks else (24,)
+        for bits in bits_to_check:
+            keys, ids = self.columns[bits]
+            prefix = value >> (48 - bits)
+            pos = bisect_right(keys, prefix) - 1
+            if pos >= 0 and keys[pos] == prefix:
+                return self.vendors[ids[pos]]
+        return None
+
+    def lookup(self, mac):
+        """
+        Returns the vendor for a MAC address string, or 'Unknown Vendor'.
+        """
+        value = mac_to_int(mac) if mac else None
+        if value is None:
+            return UNKNOWN_VENDOR
+        return self.lookup_int(value) or UNKNOWN_VENDOR
+
+    def __len__(self):
+        return sum(len(keys) for keys, _ in self.columns.values())
+
+
+def load_vendor_index(paths=None, cache_dir=None):
+    """
+    Returns the vendor index for the installed registry files.
+    Uses the pickled index when it is newer than every registry file,
+    otherwise parses the registries and refreshes the cache.
+    Falls back to the built-in table when no registry file is found.
+    """
+    paths = find_registry_files() if paths is None else paths
+    if not paths:
+        return VendorIndex.builtin()
+    cache_dir = cache_dir or os.path.dirname(paths[0])
+    cache_path = os.path.join(cache_dir, INDEX_CACHE)
+    try:
+        if os.path.getmtime(cache_path) >= max(os.path.getmtime(p) for p in paths):
+            return VendorIndex.load(cache_path)
+    except (OSError, ValueError, pickle.UnpicklingError, EOFError):
+        pass
+    index = VendorIndex.from_files(paths)
+    try:
+        index.save(cache_path)
+    except OSError:
+        pass
+    return index
+
+
+def synthetic_registry(ma_l=36000, ma_m=5500, ma_s=6500, seed=1):
+    """
+    Generates registry entries the size of the full IEEE registry,
+    for benchmarking without the real files.
+    """
+    rng = random.Random(seed)
+    for bits, count in ((24, ma_l), (28, ma_m), (36, ma_s)):
+        for prefix in rng.sample(range(1 << bits), count):
+            yield bits, prefix, f"Vendor {rng.randrange(30000)} Inc."
+
+
+def rss_kb():
+    """Current resident set size in KiB (Linux), or peak RSS elsewhere"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def benchmark(paths=None, lookups=200000):
+    """
+    Prints build/load time, resident memory and per-lookup cost of the index.
+    Uses a synthetic registry of the full IEEE size when no files are given.
+    """
+    import tempfile
+    before = rss_kb()
+    start = time.perf_counter()
+    index = VendorIndex.from_files(paths) if paths else VendorIndex.build(synthetic_registry())
+    build_time = time.perf_counter() - start
+    after = rss_kb()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_path = os.path.join(tmp, INDEX_CACHE)
+        index.save(cache_path)
+        start = time.perf_counter()
+        VendorIndex.load(cache_path)
+        load_time = time.perf_counter() - start
+
+    rng = random.Random(2)
+    known = list(index.columns[24][0])
+    values = [((rng.choice(known) << 24) | rng.randrange(1 << 24)) if i % 2 else rng.randrange(1 << 48)
+              for i in range(lookups)]
+    macs = [':'.join(f"{v:012X}"[i:i + 2] for i in range(0, 12, 2)) for v in values[:lookups // 10]]
+
+    start = time.perf_counter()
+    for value in values:
+        index.lookup_int(value)
+    int_cost = (time.perf_counter() - start) / len(values)
+
+    start = time.perf_counter()
+    for mac in macs:
+        index.lookup(mac)
+    str_cost = (time.perf_counter() - start) / len(macs)
+
+    print(f"Prefixes indexed:   {len(index)} ({len(index.vendors)} distinct vendors)")
+    print(f"Build from source:  {build_time * 1000:.1f} ms")
+    print(f"Load from cache:    {load_time * 1000:.1f} ms")
+    print(f"RSS after build:    +{after - before} KiB")
+    print(f"Lookup (int):       {int_cost * 1e9:.0f} ns")
+    print(f"Lookup (string):    {str_cost * 1e9:.0f} ns")
+
+
+if __name__ == "__main__":
+    # python oui.py [registry files...]
+    benchmark(sys.argv[1:] or None)
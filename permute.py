@@ -0,0 +1,90 @@
+"""
+Randomised probe order.
+
+Probing addresses in ascending order sends bursts of probes through the
+same /24 gateway and switch, which trips ICMP rate limits and makes live
+hosts look dead. permuted_hosts() visits every address of a set of
+ranges exactly once in a pseudo-random order instead, like zmap does:
+a seeded Feistel network is a bijection on [0, 2**bits), and cycle
+walking (re-applying it until the result is below the number of
+addresses) turns that into a bijection on [0, size). Each address is
+computed from its position, so memory doesn't grow with the target set.
+
+The same seed gives the same order, so a scan can be reproduced, and
+worker processes given the same seed can each take every n-th position
+without coordinating.
+"""
+
+#for random seeds
+import random
+#for mapping a position to its range
+import bisect
+
+from targets import ADDRESS_CLASSES
+
+# Feistel rounds; four make a good enough pseudo-random permutation
+ROUNDS = 4
+# Odd constant (2**64 / golden ratio) for the round function
+MIX = 0x9E3779B97F4A7C15
+
+
+def new_seed():
+    """A fresh random seed; print or store it to repeat the order later"""
+    return random.SystemRandom().getrandbits(32)
+
+
+class FeistelPermutation:
+    """
+    A seeded bijection on range(size). permute(i) is the position visited
+    i-th; it takes O(1) memory and, on average, fewer than four passes
+    through the network.
+    """
+
+    def __init__(self, size, seed):
+        self.size = size
+        bits = max(2, (size - 1).bit_length())
+        bits += bits & 1  # Even, so the two halves are the same width
+        self.half = bits // 2
+        self.mask = (1 << self.half) - 1
+        # The round function works on at least 64 bits so small halves still mix well
+        self.width = max(64, bits)
+        self.width_mask = (1 << self.width) - 1
+        keys = random.Random(seed)
+        self.keys = [keys.getrandbits(self.width) for _ in range(ROUNDS)]
+
+    def round(self, value, key):
+        x = ((value ^ key) * MIX) & self.width_mask
+        x ^= x >> (self.width // 2)
+        x = (x * MIX) & self.width_mask
+        return (x >> (self.width - self.half)) & self.mask
+
+    def permute(self, index):
+        while True:
+            left, right = index >> self.half, index & self.mask
+            for key in self.keys:
+                left, right = right, left ^ self.round(right, key)
+            index = (left << self.half) | right
+            if index < self.size:
+                return index
+
+
+def permuted_hosts(ranges, seed, shard=0, shards=1):
+    """
+    Yields the addresses of a list of (version, first, last) integer
+    ranges in the pseudo-random order given by seed. With shards > 1,
+    yields only every shards-th position starting at shard, so workers
+    that share a seed split the addresses between them exactly.
+    """
+    offsets = []
+    size = 0
+    for _, first, last in ranges:
+        offsets.append(size)
+        size += last - first + 1
+    if not size:
+        return
+    permutation = FeistelPermutation(size, seed)
+    for position in range(shard, size, shards):
+        index = permutation.permute(position)
+        which = bisect.bisect_right(offsets, index) - 1
+        version, first, _ = ranges[which]
+        yield ADDRESS_CLASSES[version](first + index - offsets[which])
@@ -0,0 +1,195 @@
+"""
+TCP port scan stage.
+
+Runs after discovery on the hosts that answered. Uses non-blocking
+connect() calls multiplexed with selectors (epoll/kqueue): a fixed number
+of sockets are open at any moment, and every attempt ends after a short
+timeout, so the run time is bounded by (hosts * ports / concurrency) * timeout.
+The loop works on sockets directly rather than through asyncio, which
+makes each attempt several times cheaper.
+"""
+
+#for waiting on many connects at once
+import selectors
+#for the sockets
+import socket
+#for connect error codes
+import errno
+#for attempt deadlines
+import time
+#for the deadline queue
+from collections import deque
+#for SO_LINGER
+import struct
+#for the open-file limit
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from ratelimit import BUDGET_POLL_INTERVAL
+
+# Sockets open at once
+PORT_CONCURRENCY = 1000
+# Seconds to wait for a connect to be accepted or refused
+PORT_TIMEOUT = 0.5
+# File descriptors kept free for everything else in the process
+RESERVED_FDS = 64
+# Longest wait, in seconds, between checks for cancellation
+CANCEL_POLL_INTERVAL = 0.2
+# SO_LINGER on with a zero timeout: close() resets the connection, so a big
+# scan doesn't leave thousands of sockets in TIME_WAIT
+RESET_ON_CLOSE = struct.pack("ii", 1, 0)
+
+# Most frequently open TCP ports, most common first
+TOP_PORTS = [
+    80, 23, 443, 21, 22, 25, 3389, 110, 445, 139, 143, 53, 135, 3306, 8080, 1723, 111, 995, 993, 5900,
+    1025, 587, 8888, 199, 1720, 465, 548, 113, 81, 6001, 10000, 514, 5060, 179, 1026, 2000, 8443, 8000, 32768, 554,
+    26, 1433, 49152, 2001, 515, 8008, 49154, 1027, 5666, 646, 5000, 5631, 631, 49153, 8081, 2049, 88, 79, 5800, 106,
+    2121, 1110, 49155, 6000, 513, 990, 5357, 427, 49156, 543, 544, 5101, 144, 7, 389, 8009, 3128, 444, 9999, 5009,
+    7070, 5190, 3000, 5432, 1900, 3986, 13, 1029, 9, 5051, 6646, 49157, 1028, 873, 1755, 2717, 4899, 9100, 119, 37,
+]
+
+PRESETS = {"top20": 20, "top100": 100, "top1000": 1000}
+
+
+def top_ports(count):
+    """
+    The `count` most common ports. Past the ranked list, the remaining
+    ports follow in numerical order.
+    """
+    ports = TOP_PORTS[:count]
+    if count > len(ports):
+        ranked = set(TOP_PORTS)
+        ports += [p for p in range(1, 65536) if p not in ranked][:count - len(ports)]
+    return ports
+
+
+def parse_ports(spec):
+    """
+    Parses a port list: a preset name ("top100"), or comma-separated ports
+    and ranges ("22,80,8000-8100"), or an iterable of ints.
+    Returns the ports in scan order. Raises ValueError for bad input.
+    """
+    if not isinstance(spec, str):
+        ports = [int(p) for p in spec]
+    elif spec in PRESETS:
+        return top_ports(PRESETS[spec])
+    else:
+        ports = []
+        for part in spec.split(","):
+            first, dash, last = part.strip().partition("-")
+            if not first.isdigit() or (dash and not last.isdigit()) or (last and int(last) < int(first)):
+                raise ValueError(f"Invalid port list: {spec}")
+            ports.extend(range(int(first), int(last or first) + 1))
+    if not ports or not all(1 <= p <= 65535 for p in ports):
+        raise ValueError(f"Ports must be between 1 and 65535: {spec}")
+    return list(dict.fromkeys(ports))
+
+
+def socket_budget(concurrency):
+    """
+    Caps concurrency to the process's open-file limit, raising the soft
+    limit towards the hard one first if it is too low.
+    """
+    if resource is None:
+        return concurrency
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = concurrency + RESERVED_FDS
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        new_soft = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (new_soft, hard))
+            soft = new_soft
+        except (ValueError, OSError):
+            pass
+    if soft == resource.RLIM_INFINITY:
+        return concurrency
+    return max(1, min(concurrency, soft - RESERVED_FDS))
+
+
+def start_connect(ip, port):
+    """
+    Starts a non-blocking connect. Returns (socket, None) while it is in
+    progress, or (None, open) when it finished straight away.
+    """
+    sock = socket.socket(socket.AF_INET6 if ":" in ip else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, RESET_ON_CLOSE)
+    error = sock.connect_ex((ip, port))
+    if error in (errno.EINPROGRESS, errno.EWOULDBLOCK):
+        return sock, None
+    sock.close()
+    return None, error == 0
+
+
+def scan_ports(hosts, ports, concurrency=PORT_CONCURRENCY, timeout=PORT_TIMEOUT, cancel=None, budget=None):
+    """
+    Tries every port on every host and returns {ip: sorted open ports} for
+    the hosts with any open. ports is anything parse_ports accepts.
+    Ports go out one at a time across all hosts, so no single host gets
+    the whole burst. Stops early once the optional cancel Event is set.
+    With a ratelimit.ProbeBudget, each open attempt holds one of its slots.
+    """
+    hosts = [str(ip) for ip in hosts]
+    targets = ((ip, port) for port in parse_ports(ports) for ip in hosts)
+    limit = socket_budget(concurrency)
+    selector = selectors.DefaultSelector()
+    # Every attempt has the same timeout, so deadlines come due in start order
+    deadlines = deque()
+    open_ports = {}
+
+    def finish(sock, is_open):
+        ip, port = selector.unregister(sock).data
+        sock.close()
+        if budget:
+            budget.release()
+        if is_open:
+            open_ports.setdefault(ip, []).append(port)
+
+    try:
+        exhausted = False
+        while not (cancel and cancel.is_set()):
+            while not exhausted and len(selector.get_map()) < limit:
+                if budget and not budget.try_acquire():
+                    break
+                target = next(targets, None)
+                if target is None:
+                    exhausted = True
+                    if budget:
+                        budget.release()
+                    break
+                try:
+                    sock, is_open = start_connect(*target)
+                except OSError:
+                    sock, is_open = None, False
+                if sock is None:
+                    # Decided without a socket to wait on
+                    if budget:
+                        budget.release()
+                    if is_open:
+                        open_ports.setdefault(target[0], []).append(target[1])
+                    continue
+                selector.register(sock, selectors.EVENT_WRITE, target)
+                deadlines.append((time.monotonic() + timeout, sock))
+            if not selector.get_map():
+                if exhausted:
+                    break
+                # Other scans hold the whole probe budget
+                time.sleep(BUDGET_POLL_INTERVAL)
+                continue
+            wait = min(max(deadlines[0][0] - time.monotonic(), 0), CANCEL_POLL_INTERVAL)
+            for key, _ in selector.select(wait):
+                finish(key.fileobj, key.fileobj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0)
+            now = time.monotonic()
+            while deadlines and (deadlines[0][1].fileno() == -1 or deadlines[0][0] <= now):
+                _, sock = deadlines.popleft()
+                if sock.fileno() != -1:
+                    finish(sock, False)
+    finally:
+        for key in list(selector.get_map().values()):
+            key.fileobj.close()
+            if budget:
+                budget.release()
+        selector.close()
+    return {ip: sorted(found) for ip, found in open_ports.items()}
@@ -0,0 +1,73 @@
+"""
+Scan progress counters.
+
+The scan thread is the only writer and only ever adds to two counters,
+which costs one attribute increment per batch of probes. Readers on other
+threads (the status and stream routes) work out percentages, rate and ETA
+from a snapshot, so none of that runs inside the scan loop, and no lock is
+needed: the counters only grow and are always read in the reverse order
+of how they are written, so a snapshot never shows more hosts found than
+addresses scanned.
+"""
+
+#for elapsed time, rate and ETA
+import time
+
+
+class ScanProgress:
+    """
+    Progress of one scan.
+    The scanning thread calls add(); everyone else calls snapshot().
+    """
+
+    def __init__(self, total=0, clock=time.monotonic):
+        self.clock = clock
+        self.total = total
+        self.scanned = 0
+        self.found = 0
+        self.started = None
+        self.finished = None
+
+    def start(self, total):
+        self.total = total
+        self.started = self.clock()
+
+    def add(self, scanned, found=0):
+        # found after scanned, matching the reverse read order in snapshot()
+        self.scanned += scanned
+        self.found += found
+
+    def finish(self):
+        self.finished = self.clock()
+
+    def snapshot(self):
+        """
+        Returns a consistent dict of counters plus derived fields:
+        progress (percent), elapsed (s), rate (probes/s) and eta (s, or None
+        while the rate is unknown).
+        """
+        finished = self.finished
+        found = self.found
+        scanned = self.scanned
+        total = self.total
+        started = self.started
+        if started is None:
+            elapsed = 0.0
+        else:
+            elapsed = (finished or self.clock()) - started
+        rate = scanned / elapsed if elapsed > 0 else 0.0
+        if finished is not None:
+            eta = 0.0
+        elif rate > 0:
+            eta = max(total - scanned, 0) / rate
+        else:
+            eta = None
+        return {
+            "total_hosts": total,
+            "scanned_hosts": scanned,
+            "found_hosts": found,
+            "progress": 100 if finished is not None else (min(int(scanned * 100 / total), 100) if total else 0),
+            "elapsed": round(elapsed, 2),
+            "rate": round(rate, 1),
+            "eta": round(eta, 1) if eta is not None else None,
+        }
@@ -0,0 +1,150 @@
+"""
+Probe pacing.
+
+A token bucket caps how many probes a scan sends per second, a probe
+budget caps how many several scans have in flight between them, and
+round-trip times measured from the replies set the timeout of later
+probes, the way TCP sets its retransmission timeout (SRTT/RTTVAR,
+RFC 6298). Each subnet keeps its own estimate, so a slow link doesn't
+stretch the timeouts of a fast one, and dead addresses stop costing a
+full second each once enough hosts nearby have answered. A subnet keeps
+the configured timeout until then: a fast subnet says nothing about a
+slow one, and hosts that can't answer inside a too-short timeout would
+never get to correct it.
+"""
+
+#for waiting on tokens
+import asyncio
+#for the bucket clock
+import time
+#for grouping addresses into subnets
+import ipaddress
+#for a probe budget shared with worker processes
+import multiprocessing
+
+# Smoothing gains from RFC 6298
+RTT_ALPHA = 1 / 8
+RTT_BETA = 1 / 4
+# Adaptive timeouts never go below this, in seconds; hosts in power-save
+# (phones on Wi-Fi) can take several hundred milliseconds to answer
+MIN_TIMEOUT = 0.5
+# Replies a subnet needs before its timeout drops below the configured one
+MIN_SAMPLES = 3
+# Prefix lengths that count as one subnet for RTT estimates
+SUBNET_PREFIX = {4: 24, 6: 64}
+# Seconds between tries for a probe budget slot while all are taken
+BUDGET_POLL_INTERVAL = 0.005
+
+
+class TokenBucket:
+    """
+    Allows `rate` sends per second on average, with bursts of up to `burst`.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = burst or max(1, rate / 20)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def try_take(self):
+        """Takes a token if one is available; otherwise returns the seconds until one is"""
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while True:
+            wait = self.try_take()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+class ProbeBudget:
+    """
+    Probes in flight across every scan that shares it. Scans run on their
+    own threads and event loops, or in worker processes, so the slots are
+    a process-shared semaphore, and waiting for one polls instead of
+    blocking the event loop. Create it from the multiprocessing context
+    the workers start from.
+    """
+
+    def __init__(self, size, context=multiprocessing):
+        self.size = size
+        self.slots = context.BoundedSemaphore(size)
+
+    def try_acquire(self):
+        """Takes a slot if one is free; True if it did"""
+        return self.slots.acquire(False)
+
+    async def acquire(self):
+        while not self.slots.acquire(False):
+            await asyncio.sleep(BUDGET_POLL_INTERVAL)
+
+    def release(self):
+        self.slots.release()
+
+
+class RttEstimator:
+    """
+    Smoothed round-trip time and its variation.
+    """
+
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = None
+        self.samples = 0
+
+    def observe(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - RTT_BETA) * self.rttvar + RTT_BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - RTT_ALPHA) * self.srtt + RTT_ALPHA * rtt
+        self.samples += 1
+
+    def timeout(self, floor, ceiling, min_samples=1):
+        """SRTT + 4 * RTTVAR, kept between floor and ceiling; ceiling until there are min_samples samples"""
+        if self.samples < min_samples:
+            return ceiling
+        return min(max(self.srtt + 4 * self.rttvar, floor), ceiling)
+
+
+class AdaptiveTimeout:
+    """
+    Per-subnet probe timeouts learned from observed RTTs.
+    A subnet's probes use `ceiling` (the configured timeout) until
+    min_samples hosts in it have replied.
+    """
+
+    def __init__(self, ceiling, floor=MIN_TIMEOUT, min_samples=MIN_SAMPLES):
+        self.ceiling = ceiling
+        self.floor = min(floor, ceiling)
+        self.min_samples = min_samples
+        self.subnets = {}
+
+    def subnet(self, ip):
+        address = ipaddress.ip_address(ip)
+        return int(address) >> (address.max_prefixlen - SUBNET_PREFIX[address.version])
+
+    def timeout_for(self, ip):
+        estimator = self.subnets.get(self.subnet(ip))
+        if estimator is None:
+            return self.ceiling
+        return estimator.timeout(self.floor, self.ceiling, self.min_samples)
+
+    def observe(self, ip, rtt):
+        key = self.subnet(ip)
+        estimator = self.subnets.get(key)
+        if estimator is None:
+            estimator = self.subnets[key] = RttEstimator()
+        estimator.observe(rtt)
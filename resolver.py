@@ -0,0 +1,188 @@
+"""
+Reverse DNS stage.
+
+Runs PTR lookups on a bounded thread pool, so one slow lookup never stalls
+the scan, and keeps the answers in an LRU cache with expiry that is shared
+across scans. "No such host" answers are cached too.
+"""
+
+#for reverse lookups
+import socket
+#for the lookup worker pool
+import concurrent.futures
+#for the LRU ordering
+from collections import OrderedDict
+#for expiry
+import time
+#for sharing the cache between scan threads
+import threading
+#for cache hit counters and lookup timings
+import metrics
+
+UNKNOWN = 'Unknown'
+
+LOOKUP_SECONDS = metrics.stage_seconds("dns")
+
+
+def system_resolve(ip):
+    """
+    Resolves ip with the system resolver.
+    Returns the hostname, or None if the name is just the address.
+    Raises socket.herror when there is no PTR record.
+    """
+    hostname = socket.gethostbyaddr(ip)[0]
+    return hostname if hostname != ip else None
+
+
+class TTLCache:
+    """
+    Least-recently-used cache whose entries also expire after a time to live.
+    """
+
+    def __init__(self, max_entries=65536, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.clock = clock
+        self.entries = OrderedDict()  # key -> (value, expires_at)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Returns (True, value) on a fresh hit, (False, None) otherwise.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] <= self.clock():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return False, None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (value, self.clock() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class Lookup:
+    """
+    A submitted lookup: the address, the Future for its hostname and the
+    time by which it has to have finished.
+    """
+
+    def __init__(self, ip, future, deadline):
+        self.ip = ip
+        self.future = future
+        self.deadline = deadline
+
+
+class ReverseResolver:
+    """
+    Concurrent, cached reverse DNS lookups.
+    resolve(ip) is pluggable: it returns a hostname or None, and raises
+    socket.herror when the address has no name (that answer is cached
+    for negative_ttl seconds). Other errors are not cached.
+    Each lookup has `timeout` seconds from when it was submitted, so
+    lookups waited on together time out together rather than one after
+    another.
+    """
+
+    def __init__(self, resolve=system_resolve, workers=32, timeout=2.0,
+                 ttl=3600, negative_ttl=600, max_entries=65536, clock=time.monotonic):
+        self.resolve = resolve
+        self.timeout = timeout
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self.cache = TTLCache(max_entries, clock)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rdns")
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+    def _lookup(self, ip):
+        try:
+            with LOOKUP_SECONDS.time():
+                hostname = self.resolve(ip)
+            self.cache.put(ip, hostname, self.ttl if hostname else self.negative_ttl)
+        except socket.herror:
+            hostname = None
+            self.cache.put(ip, None, self.negative_ttl)
+        except Exception:
+            hostname = None
+        finally:
+            with self.lock:
+                self.in_flight.pop(ip, None)
+        return hostname or UNKNOWN
+
+    def submit(self, ip):
+        """
+        Starts a lookup for ip and returns its Lookup. Cached answers come
+        back already done, and concurrent lookups for the same address
+        share one Future.
+        """
+        deadline = self.clock() + self.timeout
+        hit, hostname = self.cache.get(ip)
+        (metrics.dns_cache_hits if hit else metrics.dns_cache_misses).inc()
+        if hit:
+            future = concurrent.futures.Future()
+            future.set_result(hostname or UNKNOWN)
+            return Lookup(ip, future, deadline)
+        with self.lock:
+            future = self.in_flight.get(ip)
+            if future is None:
+                future = self.executor.submit(self._lookup, ip)
+                self.in_flight[ip] = future
+        return Lookup(ip, future, deadline)
+
+    def ready(self, lookup):
+        """True once the lookup has finished or is past its deadline"""
+        return lookup.future.done() or lookup.deadline <= self.clock()
+
+    def result(self, lookup):
+        """
+        Returns the hostname of a lookup, waiting until its deadline at most.
+        Returns 'Unknown' if it doesn't finish in time; a lookup that never
+        got a worker is then dropped from the queue. One already running
+        keeps its worker until resolve() returns, and its answer is cached.
+        """
+        try:
+            return lookup.future.result(timeout=max(0, lookup.deadline - self.clock()))
+        except (concurrent.futures.TimeoutError, concurrent.futures.CancelledError):
+            if lookup.future.cancel():
+                with self.lock:
+                    if self.in_flight.get(lookup.ip) is lookup.future:
+                        del self.in_flight[lookup.ip]
+            return UNKNOWN
+
+    def collect(self, lookups, wait=False):
+        """
+        Takes the lookups that are ready out of the `lookups` list, in any
+        order, and returns (ip, hostname) for each. With wait, first waits
+        until every lookup in the list is ready.
+        """
+        if wait and lookups:
+            timeout = max(lookup.deadline for lookup in lookups) - self.clock()
+            concurrent.futures.wait([lookup.future for lookup in lookups], timeout=max(0, timeout))
+        ready = []
+        waiting = []
+        for lookup in lookups:
+            (ready if wait or self.ready(lookup) else waiting).append(lookup)
+        lookups[:] = waiting
+        return [(lookup.ip, self.result(lookup)) for lookup in ready]
+
+    def lookup(self, ip):
+        """Blocking lookup of one address, with the cache and timeout applied"""
+        return self.result(self.submit(ip))
@@ -3,7 +3,9 @@
 class NetScanApp {
     constructor() {
         this.isScanning = false;
-        this.statusCheckInterval = null;
+        this.eventSource = null;
+        this.jobId = null;
+        this.liveHostCount = 0;
         this.currentResult = null;
         this.init();
     }
@@ -55,6 +57,17 @@ class NetScanApp {
             });
         }
 
+        // Export buttons download the current scan, streamed by the server
+        ['csv', 'json'].forEach(format => {
+            const exportLink = document.getElementById(`export-${format}`);
+            if (exportLink) {
+                exportLink.addEventListener('click', (e) => {
+                    e.preventDefault();
+                    this.exportResult(format);
+                });
+            }
+        });
+
         console.log('Events bound successfully');
     }
 
@@ -86,6 +99,7 @@ class NetScanApp {
 
             if (response.ok) {
                 this.isScanning = true;
+                this.jobId = result.job_id;
                 
                 if (startBtn) startBtn.disabled = true;
                 if (stopBtn) stopBtn.disabled = false;
@@ -106,8 +120,17 @@ class NetScanApp {
         }
     }
 
-    stopScan() {
+    async stopScan() {
         console.log('Stopping scan...');
+        if (this.jobId) {
+            // Cancel the job on the server so its probes stop too
+            try {
+                await fetch(`/api/scan/${this.jobId}`, { method: 'DELETE' });
+            } catch (error) {
+                console.error('Cancel error:', error);
+            }
+            this.jobId = null;
+        }
         this.isScanning = false;
         this.stopStatusChecking();
         this.resetScanControls();
@@ -145,12 +168,16 @@ class NetScanApp {
     async refreshResults() {
         console.log('Refreshing results...');
         try {
-            const response = await fetch('/api/results');
+            // Summaries only; the hosts of the latest scan are fetched on their own
+            const response = await fetch('/api/results?summary=1');
             const results = await response.json();
             console.log('Results fetched:', results);
             
             if (results.length > 0) {
-                const latestResult = results[results.length - 1];
+                let latestResult = results[results.length - 1];
+                if (!latestResult.error) {
+                    latestResult = await (await fetch(`/api/results/${latestResult.id}`)).json();
+                }
                 this.displayScanResult(latestResult);
                 this.updateHistory(results);
                 this.showToast('Results Refreshed', 'Latest scan results loaded', 'success');
@@ -165,40 +192,63 @@ class NetScanApp {
     }
 
     startStatusChecking() {
-        console.log('Starting status checking...');
-        this.statusCheckInterval = setInterval(async () => {
-            try {
-                const response = await fetch('/api/status');
-                const status = await response.json();
-                
-                this.updateProgress(status);
-                
-                if (!status.running && this.isScanning) {
-                    console.log('Scan completed, loading results...');
-                    // Scan completed
-                    this.isScanning = false;
-                    this.stopStatusChecking();
-                    this.resetScanControls();
-                    this.showProgressSection(false);
-                    
-                    // Wait a moment then load results
-                    setTimeout(async () => {
-                        await this.refreshResults();
-                        this.showToast('Scan Complete', 'Network scan completed successfully', 'success');
-                    }, 1000);
-                }
-            } catch (error) {
-                console.error('Failed to check status:', error);
-            }
-        }, 1000);
+        console.log('Opening scan event stream...');
+        this.stopStatusChecking();
+        this.liveHostCount = 0;
+
+        // The server pushes progress and newly found hosts, coalesced a few times a second
+        this.eventSource = new EventSource(`/api/stream?job=${this.jobId}`);
+
+        this.eventSource.addEventListener('progress', (event) => {
+            this.updateProgress(JSON.parse(event.data));
+        });
+
+        this.eventSource.addEventListener('hosts', (event) => {
+            this.appendLiveHosts(JSON.parse(event.data));
+        });
+
+        this.eventSource.addEventListener('done', () => {
+            // The stream has nothing more to send, even if the scan was already stopped here
+            this.stopStatusChecking();
+            if (!this.isScanning) return;
+            console.log('Scan completed, loading results...');
+            // Scan completed
+            this.isScanning = false;
+            this.resetScanControls();
+            this.showProgressSection(false);
+
+            // Wait a moment then load results
+            setTimeout(async () => {
+                await this.refreshResults();
+                this.showToast('Scan Complete', 'Network scan completed successfully', 'success');
+            }, 1000);
+        });
+
+        this.eventSource.onerror = (error) => {
+            console.error('Event stream error:', error);
+        };
     }
 
     stopStatusChecking() {
-        if (this.statusCheckInterval) {
-            clearInterval(this.statusCheckInterval);
-            this.statusCheckInterval = null;
-            console.log('Status checking stopped');
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
+            console.log('Event stream closed');
+        }
+    }
+
+    appendLiveHosts(hosts) {
+        const resultsContainer = document.getElementById('results-container');
+        if (!resultsContainer || hosts.length === 0) return;
+
+        let tbody = document.getElementById('live-results-body');
+        if (!tbody) {
+            resultsContainer.innerHTML = this.renderResultsTable('', 'live-results-body');
+            tbody = document.getElementById('live-results-body');
         }
+
+        const rowsHtml = hosts.map(host => this.renderHostRow(host, this.liveHostCount++)).join('');
+        tbody.insertAdjacentHTML('beforeend', rowsHtml);
     }
 
     updateProgress(status) {
@@ -209,6 +259,8 @@ class NetScanApp {
         const progressPercentage = document.getElementById('progress-percentage');
         const foundCount = document.getElementById('found-count');
         const scannedCount = document.getElementById('scanned-count');
+        const rateValue = document.getElementById('rate-value');
+        const etaValue = document.getElementById('eta-value');
 
         if (progressTitle) {
             progressTitle.textContent = `Scanning ${status.current_scan || 'Network'}`;
@@ -229,6 +281,14 @@ class NetScanApp {
         if (scannedCount) {
             scannedCount.textContent = status.scanned_hosts || 0;
         }
+
+        if (rateValue) {
+            rateValue.textContent = Math.round(status.rate || 0);
+        }
+
+        if (etaValue) {
+            etaValue.textContent = status.eta === null || status.eta === undefined ? '-' : `${Math.ceil(status.eta)}s`;
+        }
     }
 
     displayScanResult(result) {
@@ -275,31 +335,43 @@ class NetScanApp {
         this.showSummaryCards(result);
 
         // Create results table
-        const hostsHtml = result.hosts.map((host, index) => {
-            const ip = typeof host === 'string' ? host : host.ip;
-            const hostname = typeof host === 'object' ? host.hostname : 'Unknown';
-            const deviceType = typeof host === 'object' ? host.device_type : '💻 Computer/Device';
-            const macAddress = typeof host === 'object' ? host.mac_address : 'Unknown';
-            const vendor = typeof host === 'object' ? host.vendor : 'Unknown';
-            
-            return `
-                <tr>
-                    <td>${index + 1}</td>
-                    <td class="device-ip">${ip}</td>
-                    <td>
-                        <div class="device-status">
-                            <span class="status-indicator"></span>
-                            <span class="status-online">Online</span>
-                        </div>
-                    </td>
-                    <td class="device-type">${deviceType}</td>
-                    <td class="hostname" title="${hostname}">${hostname.length > 20 ? hostname.substring(0, 20) + '...' : hostname}</td>
-                    <td class="mac-address" title="${vendor}">${macAddress}</td>
-                </tr>
-            `;
-        }).join('');
+        const hostsHtml = result.hosts.map((host, index) => this.renderHostRow(host, index)).join('');
+
+        resultsContainer.innerHTML = this.renderResultsTable(hostsHtml);
+        
+        // Store current result for export
+        this.currentResult = result;
+        console.log('Results displayed successfully');
+    }
+
+    renderHostRow(host, index) {
+        const ip = typeof host === 'string' ? host : host.ip;
+        const hostname = typeof host === 'object' ? host.hostname : 'Unknown';
+        const deviceType = typeof host === 'object' ? host.device_type : '💻 Computer/Device';
+        const macAddress = typeof host === 'object' ? host.mac_address : 'Unknown';
+        const vendor = typeof host === 'object' ? host.vendor : 'Unknown';
+        const openPorts = typeof host === 'object' && host.open_ports ? host.open_ports.join(', ') : '';
+        const liveness = typeof host === 'object' && host.liveness ? host.liveness : '';
+        
+        return `
+            <tr>
+                <td>${index + 1}</td>
+                <td class="device-ip">${ip}</td>
+                <td>
+                    <div class="device-status"${liveness ? ` title="Answered ${liveness}"` : ''}>
+                        <span class="status-indicator"></span>
+                        <span class="status-online">Online</span>
+                    </div>
+                </td>
+                <td class="device-type"${openPorts ? ` title="Open ports: ${openPorts}"` : ''}>${deviceType}</td>
+                <td class="hostname" title="${hostname}">${hostname.length > 20 ? hostname.substring(0, 20) + '...' : hostname}</td>
+                <td class="mac-address" title="${vendor}">${macAddress}</td>
+            </tr>
+        `;
+    }
 
-        resultsContainer.innerHTML = `
+    renderResultsTable(rowsHtml, bodyId = '') {
+        return `
             <div class="results-table-container">
                 <table class="results-table">
                     <thead>
@@ -312,16 +384,12 @@ class NetScanApp {
                             <th>MAC Address</th>
                         </tr>
                     </thead>
-                    <tbody>
-                        ${hostsHtml}
+                    <tbody${bodyId ? ` id="${bodyId}"` : ''}>
+                        ${rowsHtml}
                     </tbody>
                 </table>
             </div>
         `;
-        
-        // Store current result for export
-        this.currentResult = result;
-        console.log('Results displayed successfully');
     }
 
     showSummaryCards(result) {
@@ -393,7 +461,7 @@ class NetScanApp {
                         <span class="history-time">
                             <i class="fas fa-clock"></i> ${scan.timestamp}
                         </span>
-                        ${scan.hosts ? `
+                        ${!scan.error ? `
                             <span class="history-count">
                                 <i class="fas fa-devices"></i> ${scan.total_found} devices
                             </span>
@@ -401,7 +469,7 @@ class NetScanApp {
                     </div>
                 </div>
                 <div class="history-actions">
-                    ${scan.hosts ? `
+                    ${!scan.error ? `
                         <button class="btn btn-ghost btn-xs" onclick="app.loadScanResult(${scan.id})">
                             <i class="fas fa-eye"></i> View
                         </button>
@@ -537,10 +605,18 @@ class NetScanApp {
         }, 5000);
     }
 
+    exportResult(format) {
+        if (!this.currentResult || !this.currentResult.id) {
+            this.showToast('Nothing to Export', 'Load a scan result first', 'info');
+            return;
+        }
+        window.location.href = `/api/export/${this.currentResult.id}?format=${format}`;
+    }
+
     async loadInitialData() {
         console.log('Loading initial data...');
         try {
-            const response = await fetch('/api/results');
+            const response = await fetch('/api/results?summary=1');
             const results = await response.json();
             console.log('Initial data loaded:', results);
             
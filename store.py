@@ -0,0 +1,391 @@
+"""
+Persistent scan result store.
+
+Keeps scans and their hosts in SQLite (WAL mode) so history survives
+restarts and can grow without growing the process's memory.
+"""
+
+#for the database
+import sqlite3
+#for the default database location
+import os
+#for one connection per thread
+import threading
+#for sortable ip key columns
+import ipaddress
+#for the stored scan diff
+import json
+
+from hosttable import HostTable
+
+DEFAULT_DB_PATH = os.environ.get(
+    "NETSCAN_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "netscan.db"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    network TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running',
+    duration TEXT,
+    total_found INTEGER NOT NULL DEFAULT 0,
+    total_scanned INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS hosts (
+    scan_id INTEGER NOT NULL REFERENCES scans(id) ON DELETE CASCADE,
+    ip TEXT NOT NULL,
+    ip_key BLOB NOT NULL,
+    hostname TEXT,
+    mac_address TEXT,
+    device_type TEXT,
+    vendor TEXT
+);
+CREATE INDEX IF NOT EXISTS hosts_scan_ip ON hosts (scan_id, ip_key);
+CREATE INDEX IF NOT EXISTS hosts_ip ON hosts (ip_key);
+CREATE INDEX IF NOT EXISTS hosts_mac ON hosts (mac_address);
+CREATE INDEX IF NOT EXISTS scans_network ON scans (network, id);
+CREATE TABLE IF NOT EXISTS network_runs (
+    network TEXT PRIMARY KEY,
+    run INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS address_state (
+    network TEXT NOT NULL,
+    ip_key BLOB NOT NULL,
+    dead_runs INTEGER NOT NULL,
+    skip_until INTEGER NOT NULL,
+    PRIMARY KEY (network, ip_key)
+) WITHOUT ROWID;
+"""
+
+# Columns added after the first release, created on older databases at startup
+MIGRATIONS = {
+    "scans": [("mode", "TEXT NOT NULL DEFAULT 'full'"), ("diff", "TEXT")],
+    "hosts": [("open_ports", "TEXT"), ("liveness", "TEXT")],
+}
+
+
+# Query parameters accepted as host filters (see host_filter_sql)
+HOST_FILTERS = ("device_type", "vendor", "ip", "hostname")
+
+
+def ip_key(ip):
+    """
+    The sortable database key of an address: its IP version, then the
+    address as 16 big-endian bytes. SQLite integers are 64-bit, too small
+    for IPv6, and blobs compare bytewise, so IPv4 sorts before IPv6 and
+    each in address order.
+    """
+    address = ipaddress.ip_address(ip)
+    return value_key(address.version, int(address))
+
+
+def value_key(version, value):
+    """ip_key of an address given as its version and integer value"""
+    return bytes((version,)) + value.to_bytes(16, "big")
+
+
+def key_value(key):
+    """The (version, integer value) of an ip_key"""
+    return key[0], int.from_bytes(key[1:], "big")
+
+
+def encode_ports(ports):
+    """Open ports are stored as "22,80,443"; None means no port scan was run"""
+    return None if ports is None else ",".join(map(str, ports))
+
+
+def decode_ports(text):
+    return None if text is None else [int(p) for p in text.split(",") if p]
+
+
+def parse_ip_range(spec):
+    """
+    Parses "192.168.1.0/24", "192.168.1.10-192.168.1.20" or a single
+    address into an inclusive (first, last) pair of ip keys.
+    Raises ValueError for anything else.
+    """
+    first, _, last = spec.partition("-")
+    if last:
+        first, last = ipaddress.ip_address(first.strip()), ipaddress.ip_address(last.strip())
+        if first.version != last.version or first > last:
+            raise ValueError(f"Empty address range: {spec}")
+        return ip_key(first), ip_key(last)
+    network = ipaddress.ip_network(spec.strip(), strict=False)
+    return ip_key(network.network_address), ip_key(network.broadcast_address)
+
+
+def host_filter_sql(filters):
+    """
+    Turns host filters into an SQL condition and its parameters:
+      device_type  case-insensitive substring of the type, so "printer"
+                   matches "🖨️ Printer"; several separated by commas match any
+      vendor       case-insensitive substring
+      ip           CIDR, "first-last" range or single address
+      hostname     case-insensitive glob ("*.lan") or substring
+    Raises ValueError for a malformed ip filter.
+    """
+    clauses = []
+    params = []
+    types = [t.strip() for t in (filters.get('device_type') or "").split(",") if t.strip()]
+    if types:
+        # Stored types carry an emoji, which nobody types into a filter
+        clauses.append("(" + " OR ".join(["device_type LIKE ? ESCAPE '\\'"] * len(types)) + ")")
+        params.extend("%" + escape_like(t) + "%" for t in types)
+    if filters.get('vendor'):
+        clauses.append("vendor LIKE ? ESCAPE '\\'")
+        params.append("%" + escape_like(filters['vendor']) + "%")
+    if filters.get('ip'):
+        clauses.append("ip_key BETWEEN ? AND ?")
+        params.extend(parse_ip_range(filters['ip']))
+    if filters.get('hostname'):
+        pattern = filters['hostname'].lower()
+        if any(c in pattern for c in "*?["):
+            clauses.append("LOWER(hostname) GLOB ?")
+            params.append(pattern)
+        else:
+            clauses.append("hostname LIKE ? ESCAPE '\\'")
+            params.append("%" + escape_like(pattern) + "%")
+    return " AND ".join(clauses) or "1", params
+
+
+def escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def host_dict(row):
+    host = dict(row)
+    ports = decode_ports(host.pop('open_ports'))
+    if ports is not None:
+        host['open_ports'] = ports
+    if host['liveness'] is None:
+        del host['liveness']
+    return host
+
+
+class ScanStore:
+    """
+    SQLite-backed history of scans and the hosts they found.
+    Safe to use from several threads; each thread gets its own connection.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        self.local = threading.local()
+        with self.connection() as db:
+            legacy = "ip_int" in self.column_names(db, "hosts")
+            if legacy:
+                # Addresses used to be INTEGER ip_int, which can't hold IPv6; move
+                # the hosts aside and copy them into the new table below
+                for index in ("hosts_scan_ip", "hosts_ip", "hosts_mac"):
+                    db.execute(f"DROP INDEX IF EXISTS {index}")
+                db.execute("ALTER TABLE hosts RENAME TO legacy_hosts")
+            if "ip_int" in self.column_names(db, "address_state"):
+                # Only backoff state: losing it means dead addresses get probed once more
+                db.execute("DROP TABLE address_state")
+            db.executescript(SCHEMA)
+            for table, columns in MIGRATIONS.items():
+                existing = self.column_names(db, table)
+                for name, definition in columns:
+                    if name not in existing:
+                        db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+            if legacy:
+                columns = ", ".join(name for name in self.column_names(db, "legacy_hosts") if name != "ip_int")
+                db.create_function("ip_key", 1, ip_key)
+                db.execute(f"INSERT INTO hosts ({columns}, ip_key) SELECT {columns}, ip_key(ip) FROM legacy_hosts")
+                db.execute("DROP TABLE legacy_hosts")
+
+    def column_names(self, db, table):
+        return {row['name'] for row in db.execute(f"PRAGMA table_info({table})")}
+
+    def connection(self):
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("PRAGMA foreign_keys=ON")
+            self.local.db = db
+        return db
+
+    def create_scan(self, network, timestamp, mode='full'):
+        """Record a new running scan and return its id"""
+        with self.connection() as db:
+            cursor = db.execute("INSERT INTO scans (network, timestamp, mode) VALUES (?, ?, ?)",
+                                (network, timestamp, mode))
+            return cursor.lastrowid
+
+    def add_hosts(self, scan_id, hosts):
+        """Write a batch of host records for a scan in one transaction"""
+        if not hosts:
+            return
+        rows = [(scan_id, h['ip'], ip_key(h['ip']), h.get('hostname'), h.get('mac_address'),
+                 h.get('device_type'), h.get('vendor'), encode_ports(h.get('open_ports')), h.get('liveness'))
+                for h in hosts]
+        with self.connection() as db:
+            db.executemany(
+                "INSERT INTO hosts (scan_id, ip, ip_key, hostname, mac_address, device_type, vendor, open_ports, "
+                "liveness) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def set_open_ports(self, scan_id, hosts):
+        """Saves the port scan results and updated device types of a scan's hosts"""
+        rows = [(encode_ports(h.get('open_ports') or []), h.get('device_type'), scan_id, ip_key(h['ip']))
+                for h in hosts]
+        with self.connection() as db:
+            db.executemany("UPDATE hosts SET open_ports = ?, device_type = ? WHERE scan_id = ? AND ip_key = ?",
+                           rows)
+
+    def finish_scan(self, scan_id, duration, total_found, total_scanned):
+        with self.connection() as db:
+            db.execute(
+                "UPDATE scans SET status = 'completed', duration = ?, total_found = ?, total_scanned = ? "
+                "WHERE id = ?", (duration, total_found, total_scanned, scan_id))
+
+    def set_diff(self, scan_id, diff):
+        with self.connection() as db:
+            db.execute("UPDATE scans SET diff = ? WHERE id = ?", (json.dumps(diff), scan_id))
+
+    def latest_scan(self, network, before=None):
+        """
+        Returns the newest completed scan of a network (optionally older than
+        scan id `before`) without hosts, or None.
+        """
+        row = self.connection().execute(
+            "SELECT * FROM scans WHERE network = ? AND status = 'completed' AND id < ? "
+            "ORDER BY id DESC LIMIT 1", (network, before or 2 ** 62)).fetchone()
+        return self._scan_dict(row) if row else None
+
+    def next_run(self, network):
+        """Bump and return the incremental run counter of a network"""
+        with self.connection() as db:
+            db.execute("INSERT INTO network_runs (network, run) VALUES (?, 1) "
+                       "ON CONFLICT (network) DO UPDATE SET run = run + 1", (network,))
+            return db.execute("SELECT run FROM network_runs WHERE network = ?", (network,)).fetchone()[0]
+
+    def get_address_state(self, network):
+        """Returns {ip int: (dead_runs, skip_until)} for addresses that have been dead"""
+        rows = self.connection().execute(
+            "SELECT ip_key, dead_runs, skip_until FROM address_state WHERE network = ?", (network,))
+        return {key_value(row[0])[1]: (row[1], row[2]) for row in rows}
+
+    def update_address_state(self, network, alive, dead, version=4):
+        """
+        alive: ip ints that answered, their dead streak is cleared.
+        dead: (ip int, dead_runs, skip_until) tuples for addresses that didn't.
+        version is the IP version of the network's addresses.
+        """
+        with self.connection() as db:
+            db.executemany("DELETE FROM address_state WHERE network = ? AND ip_key = ?",
+                           ((network, value_key(version, ip)) for ip in alive))
+            db.executemany("INSERT OR REPLACE INTO address_state (network, ip_key, dead_runs, skip_until) "
+                           "VALUES (?, ?, ?, ?)",
+                           ((network, value_key(version, ip), *entry) for ip, *entry in dead))
+
+    def fail_scan(self, scan_id, error):
+        with self.connection() as db:
+            db.execute("UPDATE scans SET status = 'error', error = ? WHERE id = ?", (error, scan_id))
+
+    def count_scans(self):
+        return self.connection().execute("SELECT COUNT(*) FROM scans").fetchone()[0]
+
+    def list_scans(self, limit=20, offset=0, include_hosts=False, before=None):
+        """
+        Returns up to `limit` scans, newest first, skipping the newest `offset`.
+        before is a cursor: only scans with a smaller id are returned, so
+        paging with the last id seen stays cheap however deep it goes.
+        """
+        rows = self.connection().execute(
+            "SELECT * FROM scans WHERE id < ? ORDER BY id DESC LIMIT ? OFFSET ?",
+            (before or 2 ** 62, limit, offset)).fetchall()
+        scans = [self._scan_dict(row) for row in rows]
+        if include_hosts:
+            for scan in scans:
+                if 'error' not in scan:
+                    scan['hosts'] = self.get_hosts(scan['id'])
+        return scans
+
+    def get_scan(self, scan_id, include_hosts=True, filters=None):
+        """Returns one scan as a dict (hosts narrowed by filters), or None if it doesn't exist"""
+        row = self.connection().execute("SELECT * FROM scans WHERE id = ?", (scan_id,)).fetchone()
+        if row is None:
+            return None
+        scan = self._scan_dict(row)
+        if include_hosts and 'error' not in scan:
+            scan['hosts'] = self.get_hosts(scan_id, filters=filters)
+        return scan
+
+    def get_hosts(self, scan_id, limit=-1, offset=0, after=None, filters=None):
+        """
+        Returns a scan's hosts in IP order.
+        after is a cursor: only hosts with a higher address are returned.
+        filters narrow the hosts down (see host_filter_sql).
+        """
+        condition, params = host_filter_sql(filters or {})
+        rows = self.connection().execute(
+            "SELECT ip, hostname, mac_address, device_type, vendor, open_ports, liveness FROM hosts "
+            f"WHERE scan_id = ? AND ip_key > ? AND {condition} ORDER BY ip_key LIMIT ? OFFSET ?",
+            (scan_id, b"" if after is None else ip_key(after), *params, limit, offset))
+        return [host_dict(row) for row in rows]
+
+    def get_host_table(self, scan_id, filters=None):
+        """
+        Returns a scan's hosts in IP order as a columnar HostTable, which
+        takes a fraction of the memory of get_hosts' dicts on big scans.
+        """
+        condition, params = host_filter_sql(filters or {})
+        rows = self.connection().execute(
+            "SELECT ip_key, hostname, mac_address, device_type, vendor, open_ports, liveness "
+            f"FROM hosts WHERE scan_id = ? AND {condition} ORDER BY ip_key", (scan_id, *params))
+        table = HostTable()
+        ports = {None: None}
+        for key, hostname, mac_address, device_type, vendor, open_ports, liveness in rows:
+            if open_ports not in ports:
+                ports[open_ports] = decode_ports(open_ports)
+            version, value = key_value(key)
+            table.add(value, version, hostname=hostname, mac_address=mac_address,
+                      device_type=device_type, vendor=vendor, open_ports=ports[open_ports], liveness=liveness)
+        return table
+
+    def iter_hosts(self, scan_id, filters=None, chunk_size=1000):
+        """
+        Yields a scan's hosts in IP order, reading `chunk_size` at a time,
+        so memory use doesn't depend on the size of the scan.
+        """
+        after = None
+        while True:
+            hosts = self.get_hosts(scan_id, chunk_size, after=after, filters=filters)
+            yield from hosts
+            if len(hosts) < chunk_size:
+                return
+            after = hosts[-1]['ip']
+
+    def count_hosts(self, scan_id, filters=None):
+        condition, params = host_filter_sql(filters or {})
+        return self.connection().execute(
+            f"SELECT COUNT(*) FROM hosts WHERE scan_id = ? AND {condition}", (scan_id, *params)).fetchone()[0]
+
+    def clear(self):
+        with self.connection() as db:
+            db.execute("DELETE FROM hosts")
+            db.execute("DELETE FROM scans")
+            db.execute("DELETE FROM address_state")
+            db.execute("DELETE FROM network_runs")
+
+    def _scan_dict(self, row):
+        if row['status'] == 'error':
+            return {"id": row['id'], "error": row['error'], "timestamp": row['timestamp'],
+                    "network": row['network']}
+        scan = {
+            "id": row['id'],
+            "network": row['network'],
+            "timestamp": row['timestamp'],
+            "status": row['status'],
+            "mode": row['mode'],
+            "duration": row['duration'],
+            "total_found": row['total_found'],
+            "total_scanned": row['total_scanned'],
+        }
+        if row['diff']:
+            scan['diff'] = json.loads(row['diff'])
+        return scan
@@ -0,0 +1,181 @@
+"""
+Target sets.
+
+Parses scan targets given as CIDRs, address ranges and single addresses
+(on the command line, in a file or in an API request), merges them into
+sorted, non-overlapping integer ranges so no address is probed twice,
+and takes exclusions out. A TargetSet can be scanned anywhere a network
+can: it has hosts(), and the sharded scanner splits its ranges.
+"""
+
+#for parsing and formatting addresses
+import ipaddress
+#for partial addresses like 192.168.1
+import re
+
+# How many ranges str() spells out before summarising the rest
+DESCRIBE_RANGES = 3
+
+ADDRESS_CLASSES = {4: ipaddress.IPv4Address, 6: ipaddress.IPv6Address}
+
+
+def cidr_hosts(network):
+    """
+    The (version, first, last) range of a network's hosts: like
+    network.hosts(), without the IPv4 network and broadcast addresses
+    (or the IPv6 subnet-router anycast address).
+    """
+    first, last = int(network.network_address), int(network.broadcast_address)
+    if network.version == 4 and network.num_addresses > 2:
+        first, last = first + 1, last - 1
+    elif network.version == 6 and network.num_addresses > 1:
+        first += 1
+    return network.version, first, last
+
+
+def parse_target(spec, hosts_only=True):
+    """
+    Parses one target into a (version, first, last) range:
+      192.168.1.0/24             the network's hosts (all of it with hosts_only=False)
+      192.168.1                  shorthand for 192.168.1.0/24
+      10.0.0.5-10.0.3.200        an inclusive range
+      10.0.0.5-200               a range within the last octet
+      10.0.0.7                   one address
+    Raises ValueError for anything else.
+    """
+    spec = spec.strip()
+    try:
+        if re.match(r'^\d+\.\d+\.\d+$', spec):
+            spec += ".0/24"
+        if "/" in spec:
+            network = ipaddress.ip_network(spec, strict=False)
+            if hosts_only:
+                return cidr_hosts(network)
+            return network.version, int(network.network_address), int(network.broadcast_address)
+        start, dash, end = spec.partition("-")
+        first = ipaddress.ip_address(start.strip())
+        if not dash:
+            return first.version, int(first), int(first)
+        end = end.strip()
+        if first.version == 4 and end.isdigit():
+            end = start.strip().rpartition(".")[0] + "." + end
+        last = ipaddress.ip_address(end)
+    except ValueError:
+        raise ValueError(f"Invalid target: {spec}") from None
+    if last.version != first.version or int(last) < int(first):
+        raise ValueError(f"Invalid address range: {spec}")
+    return first.version, int(first), int(last)
+
+
+def split_specs(lines):
+    """Splits lines of targets on commas and whitespace, dropping blanks and # comments"""
+    for line in lines:
+        for spec in re.split(r"[\s,]+", line.split("#", 1)[0]):
+            if spec:
+                yield spec
+
+
+def read_target_file(path):
+    """Reads the targets in a file: any number per line, # starts a comment"""
+    with open(path) as f:
+        return list(split_specs(f))
+
+
+def merge_ranges(ranges):
+    """Sorts (version, first, last) ranges and merges overlapping and adjacent ones"""
+    merged = []
+    for version, first, last in sorted(ranges):
+        if merged and merged[-1][0] == version and first <= merged[-1][2] + 1:
+            if last > merged[-1][2]:
+                merged[-1] = (version, merged[-1][1], last)
+        else:
+            merged.append((version, first, last))
+    return merged
+
+
+def subtract_ranges(ranges, removed):
+    """Takes the (merged) `removed` ranges out of the (merged) `ranges`"""
+    result = []
+    removed = merge_ranges(removed)
+    index = 0
+    for version, first, last in ranges:
+        # Skip exclusions that end before this range starts
+        while index < len(removed) and (removed[index][0], removed[index][2]) < (version, first):
+            index += 1
+        cursor = first
+        scan = index
+        while scan < len(removed) and (removed[scan][0], removed[scan][1]) <= (version, last):
+            _, gap_first, gap_last = removed[scan]
+            if gap_first > cursor:
+                result.append((version, cursor, gap_first - 1))
+            cursor = max(cursor, gap_last + 1)
+            scan += 1
+        if cursor <= last:
+            result.append((version, cursor, last))
+    return result
+
+
+class TargetSet:
+    """
+    A set of addresses as sorted, non-overlapping (version, first, last)
+    integer ranges. Memory depends on the number of ranges, not addresses.
+    """
+
+    def __init__(self, ranges=()):
+        self.ranges = merge_ranges(ranges)
+
+    @classmethod
+    def parse(cls, specs, exclude=()):
+        """
+        Builds a target set from target strings (see parse_target), minus
+        the addresses in `exclude`. Excluded networks cover every address,
+        including network and broadcast. Raises ValueError for bad targets.
+        """
+        targets = cls(parse_target(spec) for spec in specs)
+        if exclude:
+            targets.ranges = subtract_ranges(targets.ranges,
+                                             [parse_target(spec, hosts_only=False) for spec in exclude])
+        return targets
+
+    @property
+    def num_addresses(self):
+        return sum(last - first + 1 for _, first, last in self.ranges)
+
+    @property
+    def version(self):
+        """4 or 6, or None when the set mixes both (or is empty)"""
+        versions = {version for version, _, _ in self.ranges}
+        return versions.pop() if len(versions) == 1 else None
+
+    def __bool__(self):
+        return bool(self.ranges)
+
+    def __contains__(self, ip):
+        address = ipaddress.ip_address(ip)
+        value = int(address)
+        return any(version == address.version and first <= value <= last for version, first, last in self.ranges)
+
+    def hosts(self):
+        """Every address in the set, in ascending order"""
+        for version, first, last in self.ranges:
+            address_class = ADDRESS_CLASSES[version]
+            for value in range(first, last + 1):
+                yield address_class(value)
+
+    def describe_range(self, version, first, last):
+        address_class = ADDRESS_CLASSES[version]
+        if first == last:
+            return str(address_class(first))
+        networks = list(ipaddress.summarize_address_range(address_class(first), address_class(last)))
+        if len(networks) == 1:
+            return str(networks[0])
+        return f"{address_class(first)}-{address_class(last)}"
+
+    def __str__(self):
+        parts = [self.describe_range(*r) for r in self.ranges[:DESCRIBE_RANGES]]
+        if len(self.ranges) > DESCRIBE_RANGES:
+            parts.append(f"+{len(self.ranges) - DESCRIBE_RANGES} more")
+        return ", ".join(parts) or "(no targets)"
+
+    def __repr__(self):
+        return f"TargetSet({self})"
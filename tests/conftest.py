@@ -0,0 +1,24 @@
+"""
+Shared test setup: the scanner is a set of top-level modules, so the
+repository root goes on sys.path, and saved command output lives in
+tests/fixtures.
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "tests", "fixtures")
+
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def fixture_text():
+    """Reads a file from tests/fixtures"""
+    def read(name):
+        with open(os.path.join(FIXTURES, name), newline="") as f:
+            return f.read()
+    return read
@@ -0,0 +1,146 @@
+"""ARP frame building and parsing, and the sweep's retry passes over a fake packet socket"""
+
+import ipaddress
+import socket
+
+import pytest
+
+from arp_sweep import FRAME_PADDING, ArpSweeper, build_arp_request, format_mac, parse_arp_reply
+
+LOCAL_MAC = bytes.fromhex("5a7e5e5a1f4a")
+LOCAL = ipaddress.IPv4Interface("10.99.0.1/24")
+
+# Captured on a veth pair between 10.99.0.1 (5a:7e:5e:5a:1f:4a) and a host
+# at 10.99.0.7 (02:11:22:33:44:55) that also had 10.99.0.42:
+# a request for .42, the reply from .7 and an IPv6 multicast listener report
+CAPTURED_REQUEST = bytes.fromhex(
+    "ffffffffffff5a7e5e5a1f4a080600010800060400015a7e5e5a1f4a0a6300010000000000000a63002a"
+    "000000000000000000000000000000000000")
+CAPTURED_REPLY = bytes.fromhex(
+    "5a7e5e5a1f4a021122334455080600010800060400020211223344550a6300075a7e5e5a1f4a0a630001")
+CAPTURED_IPV6 = bytes.fromhex(
+    "3333000000165a7e5e5a1f4a86dd6000000000240001fe80000000000000587e5efffe5a1f4aff02000000000000"
+    "00000000000000163a000502000001008f007c420000000104000000ff0200000000000000000001ff5a1f4a")
+
+
+def test_build_arp_request():
+    frame = build_arp_request(LOCAL_MAC, "10.99.0.1") + bytes([10, 99, 0, 42]) + FRAME_PADDING
+    assert frame == CAPTURED_REQUEST
+    assert frame[0:6] == b"\xff" * 6             # Broadcast
+    assert frame[6:12] == LOCAL_MAC
+    assert frame[12:14] == b"\x08\x06"           # ARP ethertype
+    assert frame[14:22] == bytes.fromhex("0001080006040001")  # Ethernet/IPv4, request
+    assert frame[22:28] == LOCAL_MAC             # Sender hardware address
+    assert frame[28:32] == socket.inet_aton("10.99.0.1")
+    assert frame[32:38] == b"\x00" * 6           # Target hardware address unknown
+    assert frame[38:42] == socket.inet_aton("10.99.0.42")
+
+
+def test_parse_captured_reply():
+    assert parse_arp_reply(CAPTURED_REPLY) == ("10.99.0.7", "02:11:22:33:44:55")
+    # Padded to the 60-byte minimum, as it arrives off a real wire
+    assert parse_arp_reply(CAPTURED_REPLY + FRAME_PADDING) == ("10.99.0.7", "02:11:22:33:44:55")
+
+
+@pytest.mark.parametrize("frame", [CAPTURED_REQUEST, CAPTURED_IPV6, CAPTURED_REPLY[:41], b""])
+def test_parse_ignores_other_frames(frame):
+    assert parse_arp_reply(frame) is None
+
+
+def test_format_mac():
+    assert format_mac(bytes.fromhex("020a0b0c0d0e")) == "02:0A:0B:0C:0D:0E"
+
+
+def reply_frame(ip, mac):
+    return (LOCAL_MAC + mac + b"\x08\x06" + bytes.fromhex("0001080006040002") + mac + socket.inet_aton(ip)
+            + LOCAL_MAC + socket.inet_aton(str(LOCAL.ip)) + FRAME_PADDING)
+
+
+class FakePacketSocket:
+    """
+    Stands in for the AF_PACKET socket. Each address in `hosts` answers
+    its n-th request (n = the value given), the rest never answer.
+    """
+
+    def __init__(self, hosts):
+        self.hosts = hosts
+        self.requests = {}
+        self.inbox, self.outbox = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.inbox.setblocking(False)
+
+    def fileno(self):
+        return self.inbox.fileno()
+
+    def send(self, frame):
+        ip = socket.inet_ntoa(frame[38:42])
+        self.requests[ip] = self.requests.get(ip, 0) + 1
+        if self.hosts.get(ip) == self.requests[ip]:
+            mac = bytes([2, 0, 0, 0, 0, int(ip.rpartition(".")[2])])
+            self.outbox.send(reply_frame(ip, mac))
+        return len(frame)
+
+    def recv(self, size):
+        return self.inbox.recv(size)
+
+    def close(self):
+        self.inbox.close()
+        self.outbox.close()
+
+
+def fake_sweeper(hosts):
+    sweeper = ArpSweeper.__new__(ArpSweeper)
+    sweeper.sock = FakePacketSocket(hosts)
+    sweeper.local = LOCAL
+    sweeper.timeout = 0.05
+    sweeper.rate = None
+    sweeper.mac = format_mac(LOCAL_MAC)
+    sweeper.prefix = build_arp_request(LOCAL_MAC, str(LOCAL.ip))
+    return sweeper
+
+
+def sweep(sweeper, addresses, retries):
+    sent = 0
+    found = {}
+    for count, replies in sweeper.iter_sweep(addresses, retries):
+        sent += count
+        found.update(replies)
+    return sent, found
+
+
+def test_retry_pass_catches_late_hosts():
+    # .7 answers at once, .42 only to the retry, .9 never
+    sweeper = fake_sweeper({"10.99.0.7": 1, "10.99.0.42": 2})
+    addresses = ["10.99.0.7", "10.99.0.9", "10.99.0.42"]
+    with sweeper:
+        sent, found = sweep(sweeper, addresses, retries=1)
+        requests = sweeper.sock.requests
+    assert found == {"10.99.0.7": "02:00:00:00:00:07", "10.99.0.42": "02:00:00:00:00:2A"}
+    # Hosts that answered aren't asked again; each address counts as sent once
+    assert requests == {"10.99.0.7": 1, "10.99.0.9": 2, "10.99.0.42": 2}
+    assert sent == len(addresses)
+
+
+def test_no_retries():
+    sweeper = fake_sweeper({"10.99.0.7": 1, "10.99.0.42": 2})
+    with sweeper:
+        _, found = sweep(sweeper, ["10.99.0.7", "10.99.0.42"], retries=0)
+        requests = sweeper.sock.requests
+    assert found == {"10.99.0.7": "02:00:00:00:00:07"}
+    assert requests == {"10.99.0.7": 1, "10.99.0.42": 1}
+
+
+def test_local_address_is_reported_without_a_request():
+    sweeper = fake_sweeper({})
+    with sweeper:
+        sent, found = sweep(sweeper, [str(LOCAL.ip)], retries=1)
+        requests = sweeper.sock.requests
+    assert found == {"10.99.0.1": format_mac(LOCAL_MAC)}
+    assert sent == 1 and requests == {}
+
+
+def test_replies_from_unswept_addresses_are_ignored():
+    sweeper = fake_sweeper({"10.99.0.7": 1})
+    sweeper.sock.outbox.send(reply_frame("10.99.0.200", b"\x02\x00\x00\x00\x00\xc8"))
+    with sweeper:
+        _, found = sweep(sweeper, ["10.99.0.7"], retries=0)
+    assert found == {"10.99.0.7": "02:00:00:00:00:07"}
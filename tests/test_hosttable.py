@@ -0,0 +1,105 @@
+"""The columnar HostTable: address order and lookups, IPv6 rows, and converting to and from host dicts"""
+
+import ipaddress
+from array import array
+
+import pytest
+
+from hosttable import HostTable
+from store import ScanStore
+
+HOSTS = [
+    {"ip": "10.0.0.20", "hostname": "hp-office.lan", "mac_address": "02:00:00:00:00:14",
+     "device_type": "🖨️ Printer", "vendor": "Hewlett Packard", "open_ports": [80, 631, 9100]},
+    {"ip": "10.0.0.3", "hostname": "Unknown", "mac_address": "Unknown", "device_type": "💻 Computer/Device",
+     "vendor": "Unknown"},
+    {"ip": "10.0.0.100", "hostname": "nas.lan", "mac_address": "02:00:00:00:00:64", "device_type": "💾 NAS",
+     "vendor": "Synology", "open_ports": [], "liveness": "tcp/443"},
+    {"ip": "10.0.0.1", "hostname": "gateway.lan", "mac_address": "02:00:00:00:00:01",
+     "device_type": "🌐 Router/Gateway", "vendor": "Cisco Systems, Inc", "liveness": "icmp"},
+]
+
+
+def ips(records):
+    return [record.ip for record in records]
+
+
+def test_rows_stay_in_insertion_order_until_sorted():
+    table = HostTable(HOSTS)
+    assert table.ip_strings() == ["10.0.0.20", "10.0.0.3", "10.0.0.100", "10.0.0.1"]
+    assert not table.is_sorted
+    table.sort()
+    assert table.ip_strings() == ["10.0.0.1", "10.0.0.3", "10.0.0.20", "10.0.0.100"]
+    # The other columns move with their addresses
+    assert [record["hostname"] for record in table] == ["gateway.lan", "Unknown", "hp-office.lan", "nas.lan"]
+    assert table[-1]["open_ports"] == [] and table[2]["open_ports"] == [80, 631, 9100]
+
+
+def test_find():
+    table = HostTable(HOSTS)
+    assert table.find("10.0.0.20")["vendor"] == "Hewlett Packard"
+    assert table.find(int(ipaddress.ip_address("10.0.0.1"))).ip == "10.0.0.1"
+    assert table.find("10.0.0.2") is None
+    assert table.find("10.0.0.255") is None
+    assert HostTable().find("10.0.0.1") is None
+
+
+def test_between():
+    table = HostTable(HOSTS)
+    assert ips(table.between("10.0.0.2", "10.0.0.20")) == ["10.0.0.3", "10.0.0.20"]
+    assert ips(table.between("10.0.0.1", "10.0.0.100")) == ["10.0.0.1", "10.0.0.3", "10.0.0.20", "10.0.0.100"]
+    assert ips(table.between("10.0.0.21", "10.0.0.99")) == []
+    assert ips(table.between("10.0.0.100", "10.0.0.100")) == ["10.0.0.100"]
+
+
+def test_records_behave_like_host_dicts():
+    table = HostTable(HOSTS)
+    record = table.find("10.0.0.3")
+    assert record["ip"] == "10.0.0.3" and record.ip_int == int(ipaddress.ip_address("10.0.0.3"))
+    assert record["open_ports"] is None and record.get("open_ports", []) == []
+    assert record.get("nonexistent") is None
+    with pytest.raises(KeyError):
+        record["nonexistent"]
+    record["open_ports"] = [22]
+    record["device_type"] = "🐧 Linux Computer"
+    assert table.find("10.0.0.3")["open_ports"] == [22]
+    assert table.find("10.0.0.3")["device_type"] == "🐧 Linux Computer"
+    with pytest.raises(IndexError):
+        table[len(HOSTS)]
+
+
+def test_ipv6_address_promotes_the_address_column():
+    table = HostTable(HOSTS[:2])
+    assert isinstance(table.ips, array)
+    table.append({"ip": "2001:db8::5", "hostname": "v6.lan"})
+    table.append({"ip": "fe80::1"})
+    table.append({"ip": "10.0.0.7"})
+    assert isinstance(table.ips, list)
+    table.sort()
+    # IPv4 sorts before IPv6, whatever the numbers
+    assert table.ip_strings() == ["10.0.0.3", "10.0.0.7", "10.0.0.20", "2001:db8::5", "fe80::1"]
+    assert table.find("2001:db8::5")["hostname"] == "v6.lan"
+    assert table.find("2001:db8::5").ip_int == int(ipaddress.ip_address("2001:db8::5"))
+    assert table.find("::10.0.0.3") is None
+    assert ips(table.between("10.0.0.10", "2001:db8::ffff")) == ["10.0.0.20", "2001:db8::5"]
+
+
+def test_to_dicts_round_trip():
+    table = HostTable(HOSTS)
+    assert list(table.to_dicts()) == HOSTS
+    assert list(HostTable(table.to_dicts()).to_dicts()) == HOSTS
+    # Unset open_ports and liveness are left out; the other fields are always there
+    assert "liveness" not in table.find("10.0.0.20").to_dict()
+    assert HostTable([{"ip": "10.0.0.9"}])[0].to_dict() == {
+        "ip": "10.0.0.9", "hostname": None, "mac_address": None, "device_type": None, "vendor": None}
+    assert "open_ports" not in table.find("10.0.0.1").to_dict()
+
+
+def test_table_from_store_rows_matches_get_hosts(tmp_path):
+    store = ScanStore(str(tmp_path / "scans.db"))
+    scan_id = store.create_scan("10.0.0.0/24", "2024-01-01 00:00:00")
+    store.add_hosts(scan_id, HOSTS + [{"ip": "2001:db8::5", "hostname": "v6.lan"}])
+    table = store.get_host_table(scan_id)
+    assert table.is_sorted
+    assert list(table.to_dicts()) == store.get_hosts(scan_id)
+    assert table.ip_strings() == ["10.0.0.1", "10.0.0.3", "10.0.0.20", "10.0.0.100", "2001:db8::5"]
@@ -0,0 +1,92 @@
+"""Echo packets, and sending over a fake ICMP socket whose buffer fills up"""
+
+import asyncio
+import errno
+
+import icmp_sweep
+from icmp_sweep import AsyncIcmpProber, build_echo_request, checksum, parse_echo_reply
+
+
+def test_echo_request_checksum():
+    packet = build_echo_request(0x1234, 7)
+    assert packet[:2] == b"\x08\x00" and packet[4:8] == bytes.fromhex("12340007")
+    assert packet[8:] == icmp_sweep.PAYLOAD
+    # A packet with its checksum filled in sums to zero
+    assert checksum(packet) == 0
+
+
+def test_parse_echo_reply():
+    reply = bytes([0]) + build_echo_request(0x1234, 7)[1:]
+    assert parse_echo_reply(reply, raw=False) == (0x1234, 7)
+    # Raw sockets hand over the IPv4 header as well
+    assert parse_echo_reply(bytes([0x45]) + bytes(19) + reply, raw=True) == (0x1234, 7)
+    assert parse_echo_reply(build_echo_request(0x1234, 7), raw=False) is None
+    assert parse_echo_reply(reply[:4], raw=False) is None
+
+
+class FullBufferSocket:
+    """Fails the first `full` sends with ENOBUFS, then records what is sent"""
+
+    def __init__(self, full, error=errno.ENOBUFS):
+        self.full = full
+        self.error = error
+        self.sent = []
+
+    def sendto(self, packet, address):
+        if self.full:
+            self.full -= 1
+            raise OSError(self.error, "No buffer space available")
+        self.sent.append((address[0], packet))
+
+
+def fake_prober(sock):
+    prober = AsyncIcmpProber.__new__(AsyncIcmpProber)
+    prober.sock = sock
+    prober.ident = 0x1234
+    prober.seq = 0
+    return prober
+
+
+def test_send_waits_for_the_buffer_without_blocking_the_loop(monkeypatch):
+    monkeypatch.setattr(icmp_sweep, "SEND_RETRY_WAIT", 0.02)
+    prober = fake_prober(FullBufferSocket(full=3))
+    ticks = []
+
+    async def tick():
+        while True:
+            ticks.append(1)
+            await asyncio.sleep(0.005)
+
+    async def main():
+        ticker = asyncio.create_task(tick())
+        await asyncio.sleep(0)
+        seq = await prober.send("10.0.0.7")
+        ticker.cancel()
+        return seq
+
+    assert asyncio.run(main()) == 1
+    assert prober.sock.sent == [("10.0.0.7", build_echo_request(0x1234, 1))]
+    # The loop went on running while send waited out three full buffers
+    assert len(ticks) > 3
+
+
+def test_concurrent_sends_keep_their_own_sequence(monkeypatch):
+    monkeypatch.setattr(icmp_sweep, "SEND_RETRY_WAIT", 0.001)
+    prober = fake_prober(FullBufferSocket(full=1))
+
+    async def main():
+        return await asyncio.gather(prober.send("10.0.0.1"), prober.send("10.0.0.2"))
+
+    assert asyncio.run(main()) == [1, 2]
+    assert sorted(prober.sock.sent) == [("10.0.0.1", build_echo_request(0x1234, 1)),
+                                        ("10.0.0.2", build_echo_request(0x1234, 2))]
+
+
+def test_send_gives_up(monkeypatch):
+    monkeypatch.setattr(icmp_sweep, "SEND_RETRY_WAIT", 0)
+    prober = fake_prober(FullBufferSocket(full=icmp_sweep.SEND_RETRIES))
+    assert asyncio.run(prober.send("10.0.0.7")) is None
+    # Other errors aren't retried
+    prober = fake_prober(FullBufferSocket(full=1, error=errno.EHOSTUNREACH))
+    assert asyncio.run(prober.send("10.0.0.7")) is None
+    assert prober.sock.sent == []
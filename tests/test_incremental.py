@@ -0,0 +1,174 @@
+"""Incremental rescans: the dead-address backoff, which addresses each run probes, and scan diffs"""
+
+import functools
+import ipaddress
+
+import pytest
+
+from incremental import SHORT_TIMEOUT, IncrementalScan, backoff, diff_hosts
+from netscan import PROBER_FACTORIES, register_prober
+from store import ScanStore
+
+NETWORK = ipaddress.ip_network("10.0.0.0/29")  # 10.0.0.1 - 10.0.0.6
+
+
+class FakeProber:
+    """
+    Answers for the addresses in `up`; those in `slow` only when probed
+    with more than the short timeout. Records (ip, timeout) for every probe.
+    """
+
+    def __init__(self, up, slow, probed, timeout):
+        self.up = up
+        self.slow = slow
+        self.probed = probed
+        self.timeout = timeout
+
+    async def probe(self, ip, timeout=None):
+        self.probed.append((ip, self.timeout))
+        return ip in self.up and (ip not in self.slow or self.timeout > SHORT_TIMEOUT)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def network(tmp_path):
+    """A store and a fake backend; `network.up` and `network.slow` say which hosts answer"""
+    store = ScanStore(str(tmp_path / "scans.db"))
+    fake = FakeNetwork(store)
+    register_prober("fake", functools.partial(FakeProber, fake.up, fake.slow, fake.probed))
+    yield fake
+    PROBER_FACTORIES.pop("fake")
+
+
+class FakeNetwork:
+    def __init__(self, store):
+        self.store = store
+        self.up = set()
+        self.slow = set()
+        self.probed = []
+        self.scan_ids = []
+
+    def scan(self, hosts=None):
+        """
+        Runs one incremental scan and saves it like the web app does.
+        hosts gives the stored records of hosts that answer, by IP.
+        Returns the IncrementalScan, the (ip, online) pairs probed and the diff.
+        """
+        self.probed.clear()
+        scan = IncrementalScan(self.store, NETWORK)
+        results = list(scan.probe(backend="fake", timeout=1.0))
+        scan_id = self.store.create_scan(str(NETWORK), "2024-01-01 00:00:00", "incremental")
+        records = [dict((hosts or {}).get(ip, {}), ip=ip) for ip, online in results if online]
+        self.store.add_hosts(scan_id, records)
+        self.store.finish_scan(scan_id, "1.0s", len(records), len(results))
+        self.scan_ids.append(scan_id)
+        scan.commit()
+        return scan, results, scan.diff(self.store.get_host_table(scan_id))
+
+
+def probed(results):
+    return sorted((ip for ip, _ in results), key=ipaddress.ip_address)
+
+
+@pytest.mark.parametrize("dead_runs, skip", [(0, 0), (2, 0), (3, 1), (4, 2), (5, 4), (8, 32), (9, 32), (100, 32)])
+def test_backoff_grows_to_its_cap(dead_runs, skip):
+    assert backoff(dead_runs) == skip
+
+
+def test_backoff_threshold_and_cap():
+    assert [backoff(n, threshold=1, max_skip=5) for n in range(6)] == [0, 1, 2, 4, 5, 5]
+
+
+def test_first_run_probes_every_address(network):
+    network.up.add("10.0.0.2")
+    scan, results, diff = network.scan()
+    assert probed(results) == [str(ip) for ip in NETWORK.hosts()]
+    assert dict(results)["10.0.0.2"] is True
+    assert diff == {"new": ["10.0.0.2"], "gone": [], "changed": [], "previous_scan": None, "skipped": 0}
+    # Every address that didn't answer has one dead run
+    assert {dead_runs for _, dead_runs, _ in scan.dead} == {1}
+
+
+def test_dead_addresses_back_off(network):
+    network.up.add("10.0.0.2")
+    dead_probed = []
+    for run in range(1, 13):
+        scan, results, diff = network.scan()
+        assert scan.planned() == len(results)
+        dead_probed.append("10.0.0.1" in dict(results))
+        assert diff["skipped"] == (0 if dead_probed[-1] else 5)
+        # The host that is up is probed every run
+        assert dict(results)["10.0.0.2"] is True
+    # Probed for the first 3 runs, then skipping 1, 2 and 4 runs in between
+    assert dead_probed == [True, True, True, False, True, False, False, True, False, False, False, False]
+
+
+def test_host_that_comes_back_clears_its_backoff(network):
+    for _ in range(3):
+        network.scan()
+    state = network.store.get_address_state(str(NETWORK))
+    assert state[int(ipaddress.ip_address("10.0.0.5"))] == (3, 4)
+    network.up.add("10.0.0.5")
+    # Backed off for run 4 even though it is up again
+    _, results, _ = network.scan()
+    assert "10.0.0.5" not in dict(results)
+    _, results, diff = network.scan()
+    assert dict(results)["10.0.0.5"] is True and diff["new"] == ["10.0.0.5"]
+    assert int(ipaddress.ip_address("10.0.0.5")) not in network.store.get_address_state(str(NETWORK))
+
+
+def test_hosts_up_last_time_go_first_with_a_short_timeout(network):
+    network.up.update({"10.0.0.3", "10.0.0.4"})
+    network.scan()
+    # .4 now needs the normal timeout to answer
+    network.slow.add("10.0.0.4")
+    _, results, diff = network.scan()
+    assert network.probed[:2] == [("10.0.0.3", SHORT_TIMEOUT), ("10.0.0.4", SHORT_TIMEOUT)]
+    # .4 missed the short timeout and was retried with the normal one, ahead of the rest
+    assert network.probed[2] == ("10.0.0.4", 1.0)
+    assert dict(results)["10.0.0.4"] is True
+    assert len(results) == len(list(NETWORK.hosts()))
+    assert diff["new"] == [] and diff["gone"] == []
+
+
+def test_diff_against_the_previous_scan(network):
+    network.up.update({"10.0.0.1", "10.0.0.2", "10.0.0.3"})
+    network.scan({
+        "10.0.0.1": {"mac_address": "02:00:00:00:00:01", "hostname": "gateway.lan"},
+        "10.0.0.2": {"mac_address": "02:00:00:00:00:02", "hostname": "nas.lan"},
+        "10.0.0.3": {"mac_address": "02:00:00:00:00:03", "hostname": "printer.lan"},
+    })
+    network.up.discard("10.0.0.2")
+    network.up.add("10.0.0.6")
+    _, _, diff = network.scan({
+        "10.0.0.1": {"mac_address": "02:00:00:00:00:11", "hostname": "gateway.lan"},
+        # Not knowing the name this time isn't a change
+        "10.0.0.3": {"mac_address": "02:00:00:00:00:03", "hostname": "Unknown"},
+    })
+    assert diff["new"] == ["10.0.0.6"]
+    assert diff["gone"] == ["10.0.0.2"]
+    assert diff["changed"] == [{"ip": "10.0.0.1", "mac_address": {"from": "02:00:00:00:00:01", "to": "02:00:00:00:00:11"}}]
+    assert diff["previous_scan"] == network.scan_ids[0]
+    assert diff["skipped"] == 0
+
+
+def test_diff_hosts_orders_by_address():
+    previous = [
+        {"ip": "10.0.0.10", "hostname": "a.lan"},
+        {"ip": "10.0.0.9", "hostname": "b.lan", "mac_address": "02:00:00:00:00:09"},
+        {"ip": "10.0.0.100", "hostname": "c.lan"},
+    ]
+    current = [
+        {"ip": "10.0.0.100", "hostname": "c2.lan"},
+        {"ip": "10.0.0.2", "hostname": "d.lan"},
+        {"ip": "10.0.0.11"},
+        {"ip": "10.0.0.9", "hostname": "b.lan", "mac_address": "Unknown"},
+    ]
+    assert diff_hosts(previous, current) == {
+        "new": ["10.0.0.2", "10.0.0.11"],
+        "gone": ["10.0.0.10"],
+        "changed": [{"ip": "10.0.0.100", "hostname": {"from": "c.lan", "to": "c2.lan"}}],
+    }
+    assert diff_hosts([], []) == {"new": [], "gone": [], "changed": []}
@@ -0,0 +1,72 @@
+"""Change detection of the interface inventory"""
+
+import errno
+import socket
+
+from interfaces import InterfaceInventory
+
+
+class FakeNetlink:
+    """A readable socket standing in for the netlink monitor; recv raises `error` when set"""
+
+    def __init__(self, error=None):
+        self.reader, self.writer = socket.socketpair()
+        self.reader.setblocking(False)
+        self.error = error
+
+    def notify(self):
+        self.writer.send(b"x")
+
+    def fileno(self):
+        return self.reader.fileno()
+
+    def recv(self, size):
+        if self.error:
+            raise self.error
+        return self.reader.recv(size)
+
+    def close(self):
+        self.reader.close()
+        self.writer.close()
+
+
+def inventory_with(monitor):
+    inventory = InterfaceInventory()
+    if inventory.monitor is not None:
+        inventory.monitor.close()
+    inventory.monitor = monitor
+    return inventory
+
+
+def test_notifications_mark_the_cache_changed():
+    monitor = FakeNetlink()
+    inventory = inventory_with(monitor)
+    assert not inventory.changed()
+    monitor.notify()
+    monitor.notify()
+    assert inventory.changed()
+    # Drained: nothing new since
+    assert not inventory.changed()
+    monitor.close()
+
+
+def test_lost_notifications_count_as_a_change():
+    monitor = FakeNetlink(OSError(errno.ENOBUFS, "No buffer space available"))
+    inventory = inventory_with(monitor)
+    monitor.notify()
+    assert inventory.changed()
+    monitor.close()
+
+
+def test_stale_reloads_after_a_change():
+    monitor = FakeNetlink()
+    inventory = inventory_with(monitor)
+    loads = []
+    inventory.load = lambda: loads.append(1) or []
+    inventory.all()
+    inventory.all()
+    assert len(loads) == 1
+    monitor.notify()
+    inventory.all()
+    assert len(loads) == 2
+    monitor.close()
@@ -0,0 +1,141 @@
+"""How the job scheduler queues jobs and shares the probe budget"""
+
+import asyncio
+import functools
+import ipaddress
+import threading
+import time
+
+import pytest
+
+from jobs import CANCELLED, COMPLETED, RUNNING, JobScheduler
+from netscan import PROBER_FACTORIES, iter_shard_results, probe_hosts, register_prober, worker_context
+from progress import ScanProgress
+from ratelimit import ProbeBudget
+
+
+class BlockingRunner:
+    """Runs each job until release(job) is called, recording each job's probe limit"""
+
+    def __init__(self):
+        self.gates = {}
+        self.started = {}
+
+    def __call__(self, job):
+        self.started[job.id] = job.concurrency
+        self.gate(job.id).wait(5)
+
+    def gate(self, job_id):
+        return self.gates.setdefault(job_id, threading.Event())
+
+    def release(self, job):
+        self.gate(job.id).set()
+        assert wait_until(lambda: job.state != RUNNING)
+
+
+def wait_until(condition):
+    for _ in range(500):
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class CountingProber:
+    """
+    Probe backend that answers after `delay` and counts the probes in flight
+    in shared memory, so probes in shard worker processes count too.
+    """
+
+    def __init__(self, counters, delay, timeout=None):
+        self.in_flight, self.peak = counters
+        self.delay = delay
+
+    async def probe(self, ip, timeout=None):
+        with self.in_flight.get_lock():
+            self.in_flight.value += 1
+            self.peak.value = max(self.peak.value, self.in_flight.value)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            with self.in_flight.get_lock():
+                self.in_flight.value -= 1
+        return True
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def counting_backend():
+    """Registers a CountingProber backend and returns its (in flight, peak) counters"""
+    context = worker_context()
+    counters = (context.Value("i", 0), context.Value("i", 0))
+    register_prober("counting", functools.partial(CountingProber, counters, 0.02))
+    yield counters
+    PROBER_FACTORIES.pop("counting", None)
+
+
+def addresses(count, third_octet):
+    return [ipaddress.ip_address(f"10.0.{third_octet}.0") + i for i in range(1, count + 1)]
+
+
+def test_jobs_started_one_after_another_stay_within_the_budget(counting_backend):
+    _, peak = counting_backend
+    probed = {}
+
+    def runner(job):
+        found = list(probe_hosts(addresses(120, job.id), "counting", job.concurrency, budget=job.budget))
+        probed[job.id] = len(found)
+
+    scheduler = JobScheduler(runner, probe_budget=40, max_running=4)
+    jobs = []
+    for _ in range(4):
+        jobs.append(scheduler.submit("10.0.0.0/24"))
+        # Each job starts while the ones before it are mid-scan
+        time.sleep(0.03)
+    assert wait_until(lambda: all(job.state == COMPLETED for job in jobs))
+    assert probed == {job.id: 120 for job in jobs}
+    # A lone job could use the whole budget; together they never went over it
+    assert peak.value == 40
+    assert all(job.concurrency == 40 for job in jobs)
+
+
+def test_shard_workers_take_slots_from_the_budget(counting_backend):
+    _, peak = counting_backend
+    budget = ProbeBudget(6, worker_context())
+    network = ipaddress.ip_network("10.0.0.0/24")
+    scanned = sum(count for count, _, _ in iter_shard_results(network, 2, "counting", 50, budget=budget))
+    assert scanned == network.num_addresses - 2
+    assert peak.value == 6
+    # Every slot is back
+    assert all(budget.try_acquire() for _ in range(6)) and not budget.try_acquire()
+
+
+def test_priority_and_cancel():
+    runner = BlockingRunner()
+    scheduler = JobScheduler(runner, max_running=1)
+    busy = scheduler.submit("10.0.0.0/24")
+    assert wait_until(lambda: busy.id in runner.started)
+    low = scheduler.submit("10.0.1.0/24", priority=0)
+    high = scheduler.submit("10.0.2.0/24", priority=5)
+    dropped = scheduler.submit("10.0.3.0/24", priority=9)
+    scheduler.cancel(dropped.id)
+    assert dropped.state == CANCELLED
+    runner.release(busy)
+    assert wait_until(lambda: high.id in runner.started)
+    assert low.id not in runner.started
+    runner.release(high)
+    runner.release(low)
+
+
+def test_progress_add_and_snapshot():
+    now = [0.0]
+    progress = ScanProgress(clock=lambda: now[0])
+    progress.start(200)
+    progress.add(50, 3)
+    progress.add(50)
+    now[0] = 2.0
+    snapshot = progress.snapshot()
+    assert (snapshot["scanned_hosts"], snapshot["found_hosts"], snapshot["progress"]) == (100, 3, 50)
+    assert snapshot["rate"] == 50.0 and snapshot["eta"] == 2.0
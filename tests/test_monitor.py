@@ -0,0 +1,266 @@
+"""The monitor's up/down/MAC change state machine, its sweep loop, and the event sinks"""
+
+import asyncio
+import http.server
+import io
+import ipaddress
+import json
+import threading
+
+import pytest
+
+import monitor
+from monitor import JsonlSink, NetworkMonitor, StreamSink, WebhookSink, open_sink, parse_monitor_args
+from neighbors import NeighborCache
+
+NETWORK = ipaddress.ip_network("10.99.0.0/24")
+
+
+class ListSink:
+    """Keeps every batch it is given"""
+
+    def __init__(self):
+        self.batches = []
+        self.closed = False
+
+    def emit(self, events):
+        self.batches.append(events)
+
+    def close(self):
+        self.closed = True
+
+
+def new_monitor(table, networks=(NETWORK,), **options):
+    """A monitor whose neighbour table is the `table` dict, read afresh each sweep"""
+    neighbors = NeighborCache(loader=lambda: dict(table), min_refresh=3600)
+    return NetworkMonitor(list(networks), [ListSink()], neighbors=neighbors, seed=1, **options)
+
+
+class FakeProber:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def summary(events):
+    return [(e["event"], e["ip"]) for e in events]
+
+
+def test_first_sweep_reports_hosts_as_initial():
+    table = {"10.99.0.7": "02:00:00:00:00:07"}
+    mon = new_monitor(table)
+    events = mon.changes({"10.99.0.7": "icmp", "10.99.0.9": True})
+    assert summary(events) == [("up", "10.99.0.7"), ("up", "10.99.0.9")]
+    assert events[0]["mac"] == "02:00:00:00:00:07" and events[0]["liveness"] == "icmp"
+    assert events[0]["network"] == "10.99.0.0/24"
+    assert all(e["initial"] for e in events)
+    # No MAC and no liveness method: the keys are left out rather than null
+    assert "mac" not in events[1] and "liveness" not in events[1]
+
+
+def test_new_host_after_the_first_sweep():
+    mon = new_monitor({})
+    mon.changes({"10.99.0.7": True})
+    events = mon.changes({"10.99.0.7": True, "10.99.0.8": "tcp"})
+    assert summary(events) == [("up", "10.99.0.8")]
+    assert "initial" not in events[0]
+
+
+def test_down_after_missed_sweeps():
+    mon = new_monitor({"10.99.0.7": "02:00:00:00:00:07"}, down_after=2)
+    mon.changes({"10.99.0.7": True})
+    # One missed sweep is not enough
+    assert mon.changes({}) == []
+    events = mon.changes({})
+    assert summary(events) == [("down", "10.99.0.7")]
+    assert events[0]["mac"] == "02:00:00:00:00:07"
+    assert mon.hosts == {}
+    # Once down, a host coming back is reported up again
+    assert summary(mon.changes({"10.99.0.7": True})) == [("up", "10.99.0.7")]
+
+
+def test_answering_resets_the_miss_count():
+    mon = new_monitor({}, down_after=2)
+    mon.changes({"10.99.0.7": True})
+    for _ in range(5):
+        assert mon.changes({}) == []
+        assert mon.changes({"10.99.0.7": True}) == []
+
+
+def test_down_after_one():
+    mon = new_monitor({}, down_after=1)
+    mon.changes({"10.99.0.7": True})
+    assert summary(mon.changes({})) == [("down", "10.99.0.7")]
+
+
+def test_mac_change():
+    table = {"10.99.0.7": "02:00:00:00:00:07"}
+    mon = new_monitor(table)
+    mon.changes({"10.99.0.7": True})
+    table["10.99.0.7"] = "02:00:00:00:00:77"
+    events = mon.changes({"10.99.0.7": True})
+    assert summary(events) == [("mac_changed", "10.99.0.7")]
+    assert events[0]["mac"] == "02:00:00:00:00:77"
+    assert events[0]["previous_mac"] == "02:00:00:00:00:07"
+    assert mon.changes({"10.99.0.7": True}) == []
+
+
+def test_missing_mac_is_not_a_change():
+    table = {"10.99.0.7": "02:00:00:00:00:07"}
+    mon = new_monitor(table)
+    mon.changes({"10.99.0.7": True})
+    # The entry aged out of the neighbour table: keep the MAC we knew
+    del table["10.99.0.7"]
+    assert mon.changes({"10.99.0.7": True}) == []
+    assert mon.hosts["10.99.0.7"]["mac"] == "02:00:00:00:00:07"
+    # A MAC learned later isn't a change either
+    mon = new_monitor(table)
+    mon.changes({"10.99.0.7": True})
+    table["10.99.0.7"] = "02:00:00:00:00:07"
+    assert mon.changes({"10.99.0.7": True}) == []
+    assert mon.hosts["10.99.0.7"]["mac"] == "02:00:00:00:00:07"
+
+
+def test_events_name_the_narrowest_given_network():
+    networks = [ipaddress.ip_network("10.99.0.0/16"), NETWORK, ipaddress.ip_network("10.99.0.0/25")]
+    mon = new_monitor({}, networks=networks)
+    events = mon.changes({"10.99.0.7": True, "10.99.0.200": True, "10.99.5.1": True})
+    assert {e["ip"]: e["network"] for e in events} == {
+        "10.99.0.7": "10.99.0.0/25", "10.99.0.200": "10.99.0.0/24", "10.99.5.1": "10.99.0.0/16"}
+    # Overlapping networks are probed once
+    assert mon.networks == [ipaddress.ip_network("10.99.0.0/16")]
+
+
+def test_run_emits_each_sweeps_events(monkeypatch):
+    prober = FakeProber()
+    monkeypatch.setattr(monitor, "open_prober", lambda backend, timeout: prober)
+    results = iter([{"10.99.0.7": True}, {"10.99.0.7": True}, {}, {}])
+
+    async def sweep(prober):
+        return next(results)
+
+    mon = new_monitor({}, interval=0.01)
+    monkeypatch.setattr(mon, "sweep", sweep)
+    asyncio.run(mon.run(sweeps=4))
+    sink = mon.sinks[0]
+    # Sweeps without changes send nothing
+    assert [summary(batch) for batch in sink.batches] == [[("up", "10.99.0.7")], [("down", "10.99.0.7")]]
+    assert sink.closed and prober.closed
+
+
+def test_stream_sink_writes_json_lines():
+    stream = io.StringIO()
+    events = [{"event": "up", "ip": "10.99.0.7"}, {"event": "down", "ip": "10.99.0.8"}]
+    StreamSink(stream).emit(events)
+    assert [json.loads(line) for line in stream.getvalue().splitlines()] == events
+
+
+def test_jsonl_sink_appends(tmp_path):
+    path = tmp_path / "events.jsonl"
+    path.write_text('{"event": "up", "ip": "10.99.0.1"}\n')
+    sink = JsonlSink(str(path))
+    sink.emit([{"event": "up", "ip": "10.99.0.7"}])
+    sink.close()
+    assert [json.loads(line)["ip"] for line in path.read_text().splitlines()] == ["10.99.0.1", "10.99.0.7"]
+
+
+@pytest.fixture
+def webhook():
+    """A local HTTP server that records the JSON bodies POSTed to it"""
+    received = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            received.append((self.path, self.headers["Content-Type"], json.loads(body)))
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/hook", received
+    server.shutdown()
+    server.server_close()
+
+
+def test_webhook_sink_posts_each_batch(webhook):
+    url, received = webhook
+    sink = open_sink(url)
+    assert isinstance(sink, WebhookSink)
+    sink.emit([{"event": "up", "ip": "10.99.0.7"}])
+    sink.emit([{"event": "down", "ip": "10.99.0.7"}, {"event": "up", "ip": "10.99.0.8"}])
+    assert received == [
+        ("/hook", "application/json", [{"event": "up", "ip": "10.99.0.7"}]),
+        ("/hook", "application/json", [{"event": "down", "ip": "10.99.0.7"}, {"event": "up", "ip": "10.99.0.8"}]),
+    ]
+
+
+def test_webhook_failure_is_reported_not_raised(capsys):
+    # Nothing listens on the port a closed socket was given
+    probe = http.server.HTTPServer(("127.0.0.1", 0), http.server.BaseHTTPRequestHandler)
+    port = probe.server_address[1]
+    probe.server_close()
+    WebhookSink(f"http://127.0.0.1:{port}/hook", timeout=2).emit([{"event": "up", "ip": "10.99.0.7"}])
+    assert "failed" in capsys.readouterr().err
+
+
+def test_open_sink(tmp_path):
+    assert isinstance(open_sink("stdout"), StreamSink)
+    assert isinstance(open_sink("-"), StreamSink)
+    sink = open_sink("jsonl:" + str(tmp_path / "a.jsonl"))
+    assert isinstance(sink, JsonlSink)
+    sink.close()
+    with pytest.raises(ValueError):
+        open_sink("jsonl:")
+
+
+def test_parse_monitor_args():
+    options = parse_monitor_args(["10.0.0.0/24", "--interval", "30", "--down-after", "3", "--sink", "-",
+                                  "10.0.1.0/24", "--backend", "multi", "--seed", "7"])
+    assert options["networks"] == ["10.0.0.0/24", "10.0.1.0/24"]
+    assert options["interval"] == 30.0 and options["down_after"] == 3
+    assert options["sinks"] == ["-"] and options["backend"] == "multi" and options["seed"] == 7
+
+
+@pytest.mark.parametrize("args", [["--interval", "0"], ["--down-after", "x"], ["--count"], ["--sink"],
+                                  ["--backend", "arp"], ["--seed", "-1"], ["--verbose"]])
+def test_parse_monitor_args_rejects(args):
+    with pytest.raises(ValueError):
+        parse_monitor_args(args)
+
+
+def test_slow_sink_does_not_hold_up_sweeps(monkeypatch, capsys):
+    gate = threading.Event()
+
+    class SlowSink(ListSink):
+        def emit(self, events):
+            gate.wait(5)
+            super().emit(events)
+
+    monkeypatch.setattr(monitor, "open_prober", lambda backend, timeout: FakeProber())
+    monkeypatch.setattr(monitor, "MAX_PENDING", 1)
+    results = iter([{"10.99.0.7": True}, {}, {"10.99.0.7": True}, {}])
+    calls = []
+
+    async def sweep(prober):
+        calls.append(1)
+        if len(calls) == 4:
+            # Every sweep so far ran while the sink was stuck on the first batch
+            gate.set()
+        return next(results)
+
+    mon = new_monitor({}, interval=0.01, down_after=1)
+    mon.sinks = [SlowSink()]
+    monkeypatch.setattr(mon, "sweep", sweep)
+    asyncio.run(mon.run(sweeps=4))
+    batches = [summary(batch) for batch in mon.sinks[0].batches]
+    # The first batch was being delivered and the last is kept; the second was dropped for the third
+    assert batches[0] == [("up", "10.99.0.7")] and batches[-1] == [("down", "10.99.0.7")]
+    assert [("down", "10.99.0.7")] not in batches[1:-1]
+    assert "dropped 1 events" in capsys.readouterr().err
+    assert mon.sinks[0].closed
@@ -0,0 +1,140 @@
+"""Parsers for saved neighbour table dumps, and the NeighborCache refresh rules"""
+
+import os
+import threading
+import time
+
+from conftest import FIXTURES
+from neighbors import (NeighborCache, load_neighbor_table, normalize_mac, parse_arp_output, parse_ip_neigh,
+                       parse_proc_net_arp)
+
+GATEWAY_MAC = "A4:91:B1:0C:22:3E"
+MAC_23 = "00:1C:42:9F:0A:01"
+
+
+def test_normalize_mac():
+    assert normalize_mac("0:1c:42:9f:a:1") == MAC_23
+    assert normalize_mac("a4-91-b1-0c-22-3e") == GATEWAY_MAC
+
+
+def test_proc_net_arp(fixture_text):
+    table = parse_proc_net_arp(fixture_text("proc_net_arp.txt"))
+    assert table == {"192.168.1.1": GATEWAY_MAC, "192.168.1.23": MAC_23, "10.99.0.7": "02:11:22:33:44:55"}
+
+
+def test_proc_net_arp_skips_incomplete_and_zero_mac(fixture_text):
+    table = parse_proc_net_arp(fixture_text("proc_net_arp.txt"))
+    # .40 has flags 0x0 (incomplete); .41 is "complete" but has the all-zero MAC
+    assert "192.168.1.40" not in table
+    assert "192.168.1.41" not in table
+
+
+def test_ip_neigh(fixture_text):
+    table = parse_ip_neigh(fixture_text("ip_neigh.txt"))
+    assert table == {"192.168.1.1": GATEWAY_MAC, "192.168.1.23": MAC_23, "10.99.0.7": "02:11:22:33:44:55",
+                     "fe80::a691:b1ff:fe0c:223e": GATEWAY_MAC}
+
+
+def test_ip_neigh_skips_incomplete_and_zero_mac(fixture_text):
+    table = parse_ip_neigh(fixture_text("ip_neigh.txt"))
+    assert "192.168.1.40" not in table
+    assert "192.168.1.41" not in table
+
+
+def test_arp_a_windows(fixture_text):
+    table = parse_arp_output(fixture_text("arp_a_windows.txt"))
+    # The interface header line has an address but no MAC; broadcast and zero MACs are dropped
+    assert table == {"192.168.1.1": GATEWAY_MAC, "192.168.1.23": MAC_23, "224.0.0.22": "01:00:5E:00:00:16"}
+
+
+def test_arp_a_macos(fixture_text):
+    table = parse_arp_output(fixture_text("arp_a_macos.txt"))
+    # Unpadded octets are normalised; (incomplete) entries have no MAC to parse
+    assert table == {"192.168.1.1": GATEWAY_MAC, "192.168.1.23": MAC_23}
+
+
+def test_load_neighbor_table_detects_format():
+    expected = {"192.168.1.1": GATEWAY_MAC, "192.168.1.23": MAC_23}
+    for name in ("proc_net_arp.txt", "ip_neigh.txt", "arp_a_windows.txt", "arp_a_macos.txt"):
+        table = load_neighbor_table(os.path.join(FIXTURES, name))
+        assert {ip: table.get(ip) for ip in expected} == expected, name
+
+
+def test_cache_reads_table_once_per_invalidate():
+    reads = []
+
+    def loader():
+        reads.append(1)
+        return {"10.0.0.1": GATEWAY_MAC}
+
+    cache = NeighborCache(loader, min_refresh=3600)
+    assert cache.lookup("10.0.0.1") == GATEWAY_MAC
+    assert cache.lookup("10.0.0.2") is None  # A miss doesn't re-read within min_refresh
+    assert len(reads) == 1
+    cache.invalidate()
+    cache.lookup("10.0.0.1")
+    assert len(reads) == 2
+
+
+def test_cache_rereads_on_miss_after_min_refresh():
+    tables = [{}, {"10.0.0.9": MAC_23}]
+    cache = NeighborCache(lambda: tables.pop(0), min_refresh=0)
+    assert cache.lookup("10.0.0.9") == MAC_23
+
+
+class YieldingTable(dict):
+    """Lets other threads run between reading the table and the next step of a lookup"""
+
+    def get(self, key, default=None):
+        time.sleep(0)
+        return super().get(key, default)
+
+
+def test_cache_lookups_race_invalidate():
+    cache = NeighborCache(lambda: YieldingTable({"10.0.0.1": GATEWAY_MAC}), min_refresh=0)
+    stop = threading.Event()
+    errors = []
+
+    def look_up():
+        try:
+            while not stop.is_set():
+                # A miss re-reads the table, racing the invalidates
+                assert cache.lookup("10.0.0.1") == GATEWAY_MAC
+                cache.lookup("10.0.0.2")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=look_up) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for _ in range(300):
+        cache.invalidate()
+        time.sleep(0)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+def test_cache_lookups_after_invalidate_share_one_read():
+    reads = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def loader():
+        reads.append(1)
+        started.set()
+        release.wait(5)
+        return {"10.0.0.1": GATEWAY_MAC}
+
+    cache = NeighborCache(loader, min_refresh=3600)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.lookup("10.0.0.1"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    started.wait(5)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == [GATEWAY_MAC] * 4
+    assert len(reads) == 1
@@ -0,0 +1,66 @@
+"""The seeded probe order: every address exactly once, and shards that split it exactly"""
+
+import ipaddress
+
+import pytest
+
+from permute import FeistelPermutation, permuted_hosts
+
+SIZES = [1, 2, 3, 5, 6, 7, 100, 254, 255, 257, 1000, 4095, 65533]
+
+
+def host_ranges(*networks):
+    ranges = []
+    for text in networks:
+        network = ipaddress.ip_network(text)
+        first, last = int(network[0]), int(network[-1])
+        ranges.append((network.version, first, last))
+    return ranges
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_permutation_is_a_bijection(size):
+    permutation = FeistelPermutation(size, seed=7)
+    assert sorted(permutation.permute(i) for i in range(size)) == list(range(size))
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_every_address_exactly_once(size):
+    ranges = [(4, 0x0A000001, 0x0A000000 + size)]
+    order = list(permuted_hosts(ranges, seed=12345))
+    assert len(order) == size
+    assert sorted(order) == [ipaddress.IPv4Address(0x0A000001 + i) for i in range(size)]
+
+
+def test_ranges_of_mixed_sizes_and_versions():
+    ranges = host_ranges("10.0.0.0/30", "192.168.1.5/32", "172.16.0.0/27", "2001:db8::/123")
+    expected = [ipaddress.ip_address(value) for version, first, last in ranges
+                for value in range(first, last + 1)]
+    order = list(permuted_hosts(ranges, seed=99))
+    assert len(order) == len(expected) == 4 + 1 + 32 + 32
+    assert sorted(order, key=lambda ip: (ip.version, ip)) == sorted(expected, key=lambda ip: (ip.version, ip))
+
+
+def test_order_is_shuffled_and_reproducible():
+    ranges = [(4, 1, 1000)]
+    order = list(permuted_hosts(ranges, seed=1))
+    assert order == list(permuted_hosts(ranges, seed=1))
+    assert order != sorted(order)
+    assert order != list(permuted_hosts(ranges, seed=2))
+
+
+def test_no_ranges():
+    assert list(permuted_hosts([], seed=1)) == []
+
+
+@pytest.mark.parametrize("size, shards", [(1, 2), (7, 3), (100, 4), (257, 8), (1000, 7), (5, 16)])
+def test_shards_are_disjoint_and_cover_the_order(size, shards):
+    ranges = [(4, 0x0A000001, 0x0A000000 + size)]
+    order = list(permuted_hosts(ranges, seed=42))
+    parts = [list(permuted_hosts(ranges, seed=42, shard=shard, shards=shards)) for shard in range(shards)]
+    seen = [ip for part in parts for ip in part]
+    assert len(seen) == len(set(seen)) == size
+    assert set(seen) == set(order)
+    # Each shard takes every shards-th position of the shared order
+    for shard, part in enumerate(parts):
+        assert part == order[shard::shards]
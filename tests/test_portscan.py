@@ -0,0 +1,108 @@
+"""Port list parsing, and the connect scan against listeners on 127.0.0.1"""
+
+import socket
+import threading
+
+import pytest
+
+from portscan import TOP_PORTS, parse_ports, scan_ports
+from ratelimit import ProbeBudget
+
+
+def test_presets():
+    assert parse_ports("top20") == TOP_PORTS[:20]
+    assert parse_ports("top100") == TOP_PORTS[:100]
+    top1000 = parse_ports("top1000")
+    assert len(top1000) == len(set(top1000)) == 1000
+    assert top1000[:100] == TOP_PORTS
+
+
+def test_lists_and_ranges():
+    assert parse_ports("22") == [22]
+    assert parse_ports("22, 80,443") == [22, 80, 443]
+    assert parse_ports("8000-8003,22") == [8000, 8001, 8002, 8003, 22]
+    assert parse_ports("1-1,65535") == [1, 65535]
+
+
+def test_duplicates_keep_first_position():
+    assert parse_ports("80,22,80,20-23") == [80, 22, 20, 21, 23]
+
+
+def test_iterable_of_ints():
+    assert parse_ports([443, 80, 443]) == [443, 80]
+
+
+@pytest.mark.parametrize("spec", ["", "top5", "http", "22,", "22;80", "80-", "-80", "1.5", "0", "65536",
+                                  "100-70000", "80-22", "22,80-22", []])
+def test_malformed(spec):
+    with pytest.raises(ValueError):
+        parse_ports(spec)
+
+
+@pytest.fixture
+def listeners():
+    """Two listening ports on 127.0.0.1 that accept and drop connections, plus a port known to be closed"""
+    sockets = []
+    for _ in range(2):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(("127.0.0.1", 0))
+        server.listen(16)
+        sockets.append(server)
+    # Bound but not listening: connects to it are refused, and nothing else can take the port meanwhile
+    closed = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    closed.bind(("127.0.0.1", 0))
+    stop = threading.Event()
+
+    def accept(server):
+        server.settimeout(0.1)
+        while not stop.is_set():
+            try:
+                server.accept()[0].close()
+            except OSError:
+                pass
+
+    threads = [threading.Thread(target=accept, args=(server,), daemon=True) for server in sockets]
+    for thread in threads:
+        thread.start()
+    yield [server.getsockname()[1] for server in sockets], closed.getsockname()[1]
+    stop.set()
+    for thread in threads:
+        thread.join()
+    for sock in sockets + [closed]:
+        sock.close()
+
+
+def test_scan_reports_open_and_closed(listeners):
+    open_ports, closed_port = listeners
+    ports = [closed_port] + open_ports
+    assert scan_ports(["127.0.0.1"], ports, timeout=2) == {"127.0.0.1": sorted(open_ports)}
+
+
+def test_scan_hosts_without_open_ports_are_left_out(listeners):
+    _, closed_port = listeners
+    assert scan_ports(["127.0.0.1"], [closed_port], timeout=2) == {}
+
+
+def test_scan_with_tiny_concurrency(listeners):
+    open_ports, closed_port = listeners
+    found = scan_ports(["127.0.0.1"], ",".join(map(str, open_ports + [closed_port])), concurrency=1, timeout=2)
+    assert found == {"127.0.0.1": sorted(open_ports)}
+
+
+def test_cancelled_scan_returns_at_once(listeners):
+    open_ports, _ = listeners
+    cancel = threading.Event()
+    cancel.set()
+    assert scan_ports(["127.0.0.1"], open_ports, cancel=cancel) == {}
+
+
+def test_scan_within_a_shared_probe_budget(listeners):
+    open_ports, closed_port = listeners
+    budget = ProbeBudget(2)
+    # Another scan holds one of the two slots throughout
+    assert budget.try_acquire()
+    ports = open_ports + [closed_port]
+    assert scan_ports(["127.0.0.1", "127.0.0.2"], ports, timeout=2, budget=budget) == {
+        "127.0.0.1": sorted(open_ports)}
+    # The scan gave back the slot it used
+    assert budget.try_acquire() and not budget.try_acquire()
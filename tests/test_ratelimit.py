@@ -0,0 +1,165 @@
+"""Probe pacing: the token bucket, the shared probe budget and RFC 6298 adaptive timeouts"""
+
+import asyncio
+
+import pytest
+
+import ratelimit
+from ratelimit import AdaptiveTimeout, ProbeBudget, RttEstimator, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_bucket_starts_with_a_full_burst(clock):
+    bucket = TokenBucket(100, burst=5, clock=clock)
+    assert [bucket.try_take() for _ in range(5)] == [0] * 5
+    # The sixth send has to wait for a token: 1/100 s
+    assert bucket.try_take() == pytest.approx(0.01)
+
+
+def test_bucket_refills_at_its_rate(clock):
+    bucket = TokenBucket(100, burst=5, clock=clock)
+    for _ in range(5):
+        bucket.try_take()
+    clock.now += 0.025
+    assert [bucket.try_take() for _ in range(2)] == [0, 0]
+    # Half a token left over
+    assert bucket.try_take() == pytest.approx(0.005)
+
+
+def test_bucket_never_holds_more_than_the_burst(clock):
+    bucket = TokenBucket(100, burst=5, clock=clock)
+    clock.now += 60
+    sends = 0
+    while not bucket.try_take():
+        sends += 1
+    assert sends == 5
+
+
+def test_bucket_default_burst_is_a_twentieth_of_the_rate(clock):
+    assert TokenBucket(1000, clock=clock).capacity == 50
+    assert TokenBucket(5, clock=clock).capacity == 1
+
+
+def test_bucket_rejects_a_rate_of_zero():
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+
+
+def test_bucket_acquire_keeps_to_the_rate(clock, monkeypatch):
+    async def sleep(seconds):
+        clock.now += seconds
+
+    monkeypatch.setattr(ratelimit.asyncio, "sleep", sleep)
+    # A power of two keeps the waits exact on the fake clock
+    bucket = TokenBucket(64, burst=8, clock=clock)
+
+    async def send(count):
+        for _ in range(count):
+            await bucket.acquire()
+
+    started = clock.now
+    asyncio.run(send(136))
+    # The burst goes at once, the other 128 at 64 per second
+    assert clock.now - started == pytest.approx(2.0)
+
+
+def test_first_sample_sets_srtt_and_rttvar():
+    estimator = RttEstimator()
+    estimator.observe(0.2)
+    assert estimator.srtt == 0.2 and estimator.rttvar == 0.1
+    # SRTT + 4 * RTTVAR
+    assert estimator.timeout(0.0, 10.0) == pytest.approx(0.6)
+
+
+def test_later_samples_follow_rfc_6298():
+    estimator = RttEstimator()
+    estimator.observe(0.2)
+    estimator.observe(0.6)
+    # RTTVAR is updated with the old SRTT, then SRTT moves an eighth of the way
+    assert estimator.rttvar == pytest.approx(3 / 4 * 0.1 + 1 / 4 * 0.4)
+    assert estimator.srtt == pytest.approx(7 / 8 * 0.2 + 1 / 8 * 0.6)
+    assert estimator.timeout(0.0, 10.0) == pytest.approx(0.25 + 4 * 0.175)
+    assert estimator.samples == 2
+
+
+def test_steady_rtts_converge():
+    estimator = RttEstimator()
+    for _ in range(200):
+        estimator.observe(0.05)
+    assert estimator.srtt == pytest.approx(0.05)
+    assert estimator.rttvar == pytest.approx(0, abs=1e-9)
+
+
+def test_timeout_is_clamped():
+    timeouts = AdaptiveTimeout(2.0, floor=0.5, min_samples=1)
+    timeouts.observe("10.0.0.1", 0.001)
+    assert timeouts.timeout_for("10.0.0.9") == 0.5
+    timeouts.observe("10.1.0.1", 5.0)
+    assert timeouts.timeout_for("10.1.0.9") == 2.0
+    # A floor above the configured timeout is brought down to it
+    assert AdaptiveTimeout(0.3, floor=0.5).floor == 0.3
+
+
+def test_configured_timeout_until_enough_replies():
+    timeouts = AdaptiveTimeout(2.0, floor=0.5, min_samples=3)
+    assert timeouts.timeout_for("10.0.0.1") == 2.0
+    timeouts.observe("10.0.0.1", 0.01)
+    timeouts.observe("10.0.0.2", 0.01)
+    assert timeouts.timeout_for("10.0.0.3") == 2.0
+    timeouts.observe("10.0.0.3", 0.01)
+    assert timeouts.timeout_for("10.0.0.3") == 0.5
+
+
+def test_each_subnet_keeps_its_own_estimate():
+    timeouts = AdaptiveTimeout(3.0, floor=0.01, min_samples=1)
+    for host in range(1, 5):
+        timeouts.observe(f"10.0.0.{host}", 0.02)
+        timeouts.observe(f"10.0.1.{host}", 0.4)
+    fast, slow = timeouts.timeout_for("10.0.0.200"), timeouts.timeout_for("10.0.1.200")
+    assert fast < 0.1 < 0.4 < slow < 3.0
+    # A /24 nothing has answered in yet keeps the configured timeout
+    assert timeouts.timeout_for("10.0.2.1") == 3.0
+    # IPv6 groups by /64
+    timeouts.observe("2001:db8::1", 0.02)
+    assert timeouts.timeout_for("2001:db8::ffff:1") == timeouts.timeout_for("2001:db8::1") < 0.1
+    assert timeouts.timeout_for("2001:db8:0:1::1") == 3.0
+
+
+def test_probe_budget_slots():
+    budget = ProbeBudget(2)
+    assert budget.try_acquire() and budget.try_acquire()
+    assert not budget.try_acquire()
+    budget.release()
+    assert budget.try_acquire()
+    budget.release()
+    budget.release()
+    with pytest.raises(ValueError):
+        # Bounded: a release without an acquire is a bug
+        budget.release()
+
+
+def test_probe_budget_acquire_waits_for_a_release():
+    budget = ProbeBudget(1)
+
+    async def main():
+        await budget.acquire()
+        loop = asyncio.get_running_loop()
+        released = loop.time()
+        loop.call_later(0.05, budget.release)
+        await budget.acquire()
+        return loop.time() - released
+
+    assert asyncio.run(main()) >= 0.05
+    budget.release()
@@ -0,0 +1,186 @@
+"""The reverse DNS cache, its expiry and eviction, shared lookups and lookup deadlines"""
+
+import socket
+import threading
+import time
+
+import pytest
+
+from resolver import UNKNOWN, ReverseResolver
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeResolve:
+    """
+    Answers from `names`: a hostname, None, or an exception to raise.
+    Addresses in `stuck` don't answer until `release` is set.
+    """
+
+    def __init__(self, names, stuck=()):
+        self.names = names
+        self.stuck = set(stuck)
+        self.release = threading.Event()
+        self.calls = []
+
+    def __call__(self, ip):
+        self.calls.append(ip)
+        if ip in self.stuck:
+            self.release.wait(5)
+        answer = self.names.get(ip, socket.herror(1, "Unknown host"))
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def new_resolver(resolve, clock, **options):
+    return ReverseResolver(resolve, workers=options.pop("workers", 4), clock=clock, **options)
+
+
+def test_answers_are_cached(clock):
+    resolve = FakeResolve({"10.0.0.1": "printer.lan"})
+    resolver = new_resolver(resolve, clock)
+    assert resolver.lookup("10.0.0.1") == "printer.lan"
+    assert resolver.lookup("10.0.0.1") == "printer.lan"
+    assert resolve.calls == ["10.0.0.1"]
+    assert resolver.cache.hits == 1
+
+
+def test_no_such_host_is_cached(clock):
+    resolve = FakeResolve({"10.0.0.2": None})
+    resolver = new_resolver(resolve, clock)
+    # No PTR record, and a name that is just the address
+    assert resolver.lookup("10.0.0.1") == UNKNOWN
+    assert resolver.lookup("10.0.0.2") == UNKNOWN
+    assert resolver.lookup("10.0.0.1") == UNKNOWN
+    assert resolver.lookup("10.0.0.2") == UNKNOWN
+    assert resolve.calls == ["10.0.0.1", "10.0.0.2"]
+
+
+def test_other_errors_are_not_cached(clock):
+    resolve = FakeResolve({"10.0.0.1": OSError("resolver unreachable")})
+    resolver = new_resolver(resolve, clock)
+    assert resolver.lookup("10.0.0.1") == UNKNOWN
+    resolve.names["10.0.0.1"] = "printer.lan"
+    assert resolver.lookup("10.0.0.1") == "printer.lan"
+    assert resolve.calls == ["10.0.0.1", "10.0.0.1"]
+
+
+def test_entries_expire(clock):
+    resolve = FakeResolve({"10.0.0.1": "printer.lan"})
+    resolver = new_resolver(resolve, clock, ttl=3600, negative_ttl=600)
+    resolver.lookup("10.0.0.1")
+    resolver.lookup("10.0.0.2")
+    clock.now += 599
+    resolver.lookup("10.0.0.1")
+    resolver.lookup("10.0.0.2")
+    assert len(resolve.calls) == 2
+    # The negative answer runs out first
+    clock.now += 1
+    resolver.lookup("10.0.0.1")
+    resolver.lookup("10.0.0.2")
+    assert resolve.calls == ["10.0.0.1", "10.0.0.2", "10.0.0.2"]
+    clock.now += 3000
+    resolve.names["10.0.0.1"] = "scanner.lan"
+    assert resolver.lookup("10.0.0.1") == "scanner.lan"
+
+
+def test_least_recently_used_is_evicted(clock):
+    resolve = FakeResolve({"10.0.0.1": "a", "10.0.0.2": "b", "10.0.0.3": "c"})
+    resolver = new_resolver(resolve, clock, max_entries=2)
+    resolver.lookup("10.0.0.1")
+    resolver.lookup("10.0.0.2")
+    # A hit makes .1 the most recently used, so .2 goes when .3 comes in
+    resolver.lookup("10.0.0.1")
+    resolver.lookup("10.0.0.3")
+    assert len(resolver.cache) == 2
+    resolve.calls.clear()
+    resolver.lookup("10.0.0.1")
+    resolver.lookup("10.0.0.2")
+    assert resolve.calls == ["10.0.0.2"]
+
+
+def test_lookups_in_flight_are_shared(clock):
+    resolve = FakeResolve({"10.0.0.1": "printer.lan"}, stuck={"10.0.0.1"})
+    resolver = new_resolver(resolve, clock)
+    first = resolver.submit("10.0.0.1")
+    second = resolver.submit("10.0.0.1")
+    assert second.future is first.future
+    resolve.release.set()
+    assert resolver.result(first) == resolver.result(second) == "printer.lan"
+    assert resolve.calls == ["10.0.0.1"]
+    assert resolver.in_flight == {}
+
+
+def test_lookup_past_its_deadline_is_unknown(clock):
+    resolve = FakeResolve({"10.0.0.1": "printer.lan"}, stuck={"10.0.0.1"})
+    resolver = new_resolver(resolve, clock, timeout=2.0)
+    try:
+        lookup = resolver.submit("10.0.0.1")
+        assert not resolver.ready(lookup)
+        clock.now += 2.0
+        assert resolver.ready(lookup)
+        assert resolver.result(lookup) == UNKNOWN
+    finally:
+        resolve.release.set()
+    # The answer that came in late is still cached for next time
+    lookup.future.result(5)
+    assert resolver.lookup("10.0.0.1") == "printer.lan"
+    assert resolve.calls == ["10.0.0.1"]
+
+
+def test_lookup_that_never_started_is_dropped(clock):
+    resolve = FakeResolve({}, stuck={"10.0.0.1"})
+    resolver = new_resolver(resolve, clock, workers=1)
+    try:
+        resolver.submit("10.0.0.1")
+        queued = resolver.submit("10.0.0.2")
+        clock.now += resolver.timeout
+        assert resolver.result(queued) == UNKNOWN
+        assert queued.future.cancelled()
+        assert "10.0.0.2" not in resolver.in_flight
+    finally:
+        resolve.release.set()
+    assert resolve.calls == ["10.0.0.1"]
+
+
+def test_collect_does_not_wait_on_a_slow_lookup(clock):
+    resolve = FakeResolve({"10.0.0.1": "slow.lan", "10.0.0.2": "fast.lan"}, stuck={"10.0.0.1"})
+    resolver = new_resolver(resolve, clock)
+    try:
+        lookups = [resolver.submit("10.0.0.1"), resolver.submit("10.0.0.2")]
+        lookups[1].future.result(5)
+        assert resolver.collect(lookups) == [("10.0.0.2", "fast.lan")]
+        assert [lookup.ip for lookup in lookups] == ["10.0.0.1"]
+        clock.now += resolver.timeout
+        assert resolver.collect(lookups) == [("10.0.0.1", UNKNOWN)]
+        assert lookups == []
+    finally:
+        resolve.release.set()
+
+
+def test_timeouts_run_side_by_side():
+    addresses = [f"10.0.0.{n}" for n in range(1, 9)]
+    resolve = FakeResolve({}, stuck=addresses)
+    resolver = ReverseResolver(resolve, workers=8, timeout=0.2)
+    try:
+        lookups = [resolver.submit(ip) for ip in addresses]
+        started = time.monotonic()
+        results = resolver.collect(lookups, wait=True)
+        elapsed = time.monotonic() - started
+    finally:
+        resolve.release.set()
+    assert sorted(results) == [(ip, UNKNOWN) for ip in addresses]
+    # One timeout for all of them, not one after another
+    assert elapsed < 0.6
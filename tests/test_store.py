@@ -0,0 +1,55 @@
+"""Host filters of the scan store"""
+
+import pytest
+
+from store import ScanStore
+
+HOSTS = [
+    {"ip": "10.0.0.1", "hostname": "gateway.lan", "device_type": "🌐 Router/Gateway", "vendor": "Cisco Systems, Inc"},
+    {"ip": "10.0.0.20", "hostname": "hp-office.lan", "device_type": "🖨️ Printer", "vendor": "Hewlett Packard"},
+    {"ip": "10.0.0.30", "hostname": "desk-7", "device_type": "💻 Windows Computer", "vendor": "Dell Inc."},
+    {"ip": "10.0.0.31", "hostname": "Unknown", "device_type": "💻 Computer/Device", "vendor": "Unknown"},
+    {"ip": "10.0.0.40", "hostname": "cam_1", "device_type": "📹 Security Camera", "vendor": "Hikvision"},
+]
+
+
+@pytest.fixture
+def scan(tmp_path):
+    store = ScanStore(str(tmp_path / "scans.db"))
+    scan_id = store.create_scan("10.0.0.0/24", "2024-01-01 00:00:00")
+    store.add_hosts(scan_id, HOSTS)
+    return store, scan_id
+
+
+def ips(store, scan_id, **filters):
+    return [host["ip"] for host in store.get_hosts(scan_id, filters=filters)]
+
+
+@pytest.mark.parametrize("device_type, expected", [
+    ("Printer,Router", ["10.0.0.1", "10.0.0.20"]),
+    ("printer", ["10.0.0.20"]),
+    (" ROUTER , camera ", ["10.0.0.1", "10.0.0.40"]),
+    ("computer", ["10.0.0.30", "10.0.0.31"]),
+    ("🖨️ Printer", ["10.0.0.20"]),
+    ("Computer/Device", ["10.0.0.31"]),
+    ("toaster", []),
+    (",", ["10.0.0.1", "10.0.0.20", "10.0.0.30", "10.0.0.31", "10.0.0.40"]),
+])
+def test_device_type_filter(scan, device_type, expected):
+    store, scan_id = scan
+    assert ips(store, scan_id, device_type=device_type) == expected
+    assert store.count_hosts(scan_id, {"device_type": device_type}) == len(expected)
+
+
+def test_like_wildcards_are_literal(scan):
+    store, scan_id = scan
+    assert ips(store, scan_id, device_type="%") == []
+    assert ips(store, scan_id, hostname="cam_") == ["10.0.0.40"]
+    assert ips(store, scan_id, hostname="desk_") == []
+
+
+def test_combined_filters(scan):
+    store, scan_id = scan
+    assert ips(store, scan_id, device_type="computer", vendor="dell") == ["10.0.0.30"]
+    assert ips(store, scan_id, device_type="printer,router", ip="10.0.0.0/28") == ["10.0.0.1"]
+    assert ips(store, scan_id, hostname="*.lan") == ["10.0.0.1", "10.0.0.20"]
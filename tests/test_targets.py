@@ -0,0 +1,49 @@
+"""What a scan target means, alone and in a list"""
+
+import ipaddress
+
+import pytest
+
+from netscan import count_hosts, parse_network, parse_targets
+from targets import TargetSet
+
+
+@pytest.mark.parametrize("spec, network", [
+    ("192.168.1.0/24", "192.168.1.0/24"),
+    ("192.168.1.77/24", "192.168.1.0/24"),
+    ("192.168.1", "192.168.1.0/24"),
+    ("192.168.1.7", "192.168.1.7/32"),
+    ("192.168.1.0", "192.168.1.0/32"),
+    ("fd00::7", "fd00::7/128"),
+    ("fd00::/120", "fd00::/120"),
+])
+def test_parse_network(spec, network):
+    assert parse_network(spec) == ipaddress.ip_network(network)
+
+
+@pytest.mark.parametrize("spec", ["192.168", "192.168.1.300", "printer", "10.0.0.0/33"])
+def test_parse_network_rejects(spec):
+    with pytest.raises(ValueError):
+        parse_network(spec)
+
+
+def test_bare_address_is_one_host_alone_or_in_a_list():
+    alone = parse_targets(["10.0.0.7"])
+    assert list(alone.hosts()) == [ipaddress.ip_address("10.0.0.7")]
+    assert count_hosts(alone) == 1
+    listed = parse_targets(["10.0.0.7", "10.0.9.1"])
+    assert isinstance(listed, TargetSet)
+    assert [str(ip) for ip in listed.hosts()] == ["10.0.0.7", "10.0.9.1"]
+
+
+def test_single_network_stays_a_network():
+    assert parse_targets(["10.0.0.0/24"]) == ipaddress.ip_network("10.0.0.0/24")
+    assert count_hosts(parse_targets(["10.0.0"])) == 254
+
+
+def test_lists_merge_and_exclude():
+    targets = parse_targets(["10.0.0.0/30", "10.0.0.2-10.0.0.9", "10.0.0.5"], ["10.0.0.4-6"])
+    assert str(targets) == "10.0.0.1-10.0.0.3, 10.0.0.7-10.0.0.9"
+    assert count_hosts(targets) == 6
+    with pytest.raises(ValueError):
+        parse_targets(["10.0.0.7"], ["10.0.0.0/24"])
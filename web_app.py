@@ -4,32 +4,58 @@ NetScan Web Interface
 A Flask web application for the network scanner
 """
 
-from flask import Flask, render_template, request, jsonify
-import json
+from flask import Flask, render_template, request, jsonify, Response
 from datetime import datetime
-import threading
 import time
 import os
 
 # Import our existing scanner functions
-from netscan import scan_network, parse_network, get_local_ip_and_mask
-import socket
-import subprocess
-import re
+from netscan import scan_network, parse_targets, count_hosts
+from targets import TargetSet, split_specs
+from permute import new_seed
+from interfaces import inventory
+from neighbors import NeighborCache
+from resolver import ReverseResolver
+from oui import load_vendor_index
+from classifier import classify, classify_hosts
+from portscan import parse_ports, scan_ports
+from store import ScanStore, HOST_FILTERS
+from export import EXPORTERS, FORMATS
+from incremental import IncrementalScan
+from events import EventHub, coalesced_stream
+from jobs import JobScheduler
+from progress import ScanProgress
+import metrics
 
 app = Flask(__name__)
 
-# Store scan results and status
-scan_results = []
-scan_status = {
+# Scan history lives in SQLite; only the live status is kept in memory
+result_store = ScanStore()
+HOST_WRITE_BATCH = 256
+# Status reported when no scan has been submitted yet
+idle_status = {
     "running": False, 
-    "progress": 0, 
     "current_scan": None,
-    "total_hosts": 0,
-    "scanned_hosts": 0,
-    "found_hosts": 0
+    **ScanProgress().snapshot()
 }
 
+# One snapshot of the ARP table per scan instead of an `arp` call per host
+neighbor_cache = NeighborCache()
+
+# Reverse DNS runs on its own pool and its cache is shared across scans
+hostname_resolver = ReverseResolver()
+
+# IEEE vendor registry, compiled once at startup
+vendor_index = load_vendor_index()
+
+# Per-stage timings of the scan pipeline, served at /metrics
+DISCOVERY_SECONDS = metrics.stage_seconds("discovery")
+PORTS_SECONDS = metrics.stage_seconds("ports")
+STORE_SECONDS = metrics.stage_seconds("store")
+SCAN_SECONDS = metrics.stage_seconds("scan")
+HOSTNAME_SECONDS = metrics.stage_seconds("hostname")
+MAC_LOOKUP_SECONDS = metrics.stage_seconds("mac_lookup")
+
 @app.route('/test')
 def test():
     """Test page with simple interface"""
@@ -37,11 +63,13 @@ def test():
 
 @app.route('/')
 def index():
-    """Main dashboard page"""
+    """Main dashboard page (?interface=<name> picks the interface to suggest)"""
     try:
-        local_ip, local_mask = get_local_ip_and_mask()
-        network = parse_network()
-        suggested_network = str(network)
+        # Cached inventory: no commands run on page loads
+        address = inventory.primary(request.args.get('interface')).interface
+        local_ip = str(address.ip)
+        local_mask = str(address.netmask)
+        suggested_network = str(address.network)
     except:
         local_ip = "Unknown"
         local_mask = "Unknown"
@@ -51,39 +79,120 @@ def index():
                          local_ip=local_ip, 
                          local_mask=local_mask,
                          suggested_network=suggested_network,
-                         scan_status=scan_status,
-                         recent_scans=scan_results[-5:])
+                         scan_status=current_status(),
+                         recent_scans=result_store.list_scans(5))
+
+@app.route('/api/interfaces')
+def list_interfaces():
+    """List the local interfaces and their addresses"""
+    return jsonify([{
+        "name": a.name,
+        "index": a.index,
+        "mac_address": a.mac,
+        "up": a.up,
+        "loopback": a.loopback,
+        "address": str(a.interface.ip),
+        "prefix": a.interface.network.prefixlen,
+        "network": str(a.interface.network),
+    } for a in inventory.all()])
 
 @app.route('/api/scan', methods=['POST'])
 def start_scan():
-    """Start a network scan"""
-    if scan_status["running"]:
-        return jsonify({"error": "Scan already in progress"}), 400
-    
+    """Queue a network scan; it starts right away if a job slot is free"""
     data = request.get_json()
-    network_input = data.get('network', '').strip()
+    # `targets` (or `network`) is one target or a list of networks, ranges and addresses
+    targets = data.get('targets', data.get('network')) or []
+    exclude = data.get('exclude') or []
+    if isinstance(targets, str):
+        targets = list(split_specs([targets]))
+    if isinstance(exclude, str):
+        exclude = list(split_specs([exclude]))
+    if not isinstance(targets, list) or not isinstance(exclude, list) or \
+            not all(isinstance(spec, str) for spec in targets + exclude):
+        return jsonify({"error": "targets and exclude must be strings or lists of strings"}), 400
+    backend = data.get('backend', 'auto')
+    if backend not in ('auto', 'icmp', 'ping', 'multi', 'arp'):
+        return jsonify({"error": f"Unknown probe backend: {backend}"}), 400
+    workers = data.get('workers', 1)
+    if not isinstance(workers, int) or workers < 1:
+        return jsonify({"error": "workers must be a positive integer"}), 400
+    mode = data.get('mode', 'full')
+    if mode not in ('full', 'incremental'):
+        return jsonify({"error": f"Unknown scan mode: {mode}"}), 400
+    if mode == 'incremental' and backend == 'arp':
+        return jsonify({"error": "Incremental scans don't support the arp backend"}), 400
+    if mode == 'incremental' and workers > 1:
+        return jsonify({"error": "Incremental scans run in one process and don't take workers"}), 400
+    rate = data.get('rate')
+    if rate is not None and (not isinstance(rate, (int, float)) or rate <= 0):
+        return jsonify({"error": "rate must be a positive number of probes per second"}), 400
+    ports = data.get('ports')
+    if ports:
+        try:
+            ports = parse_ports(ports)
+        except (ValueError, TypeError) as e:
+            return jsonify({"error": str(e)}), 400
+    priority = data.get('priority', 0)
+    if not isinstance(priority, int):
+        return jsonify({"error": "priority must be an integer"}), 400
+    # Probes go out in a seeded random order unless asked for ascending order;
+    # the seed is returned so the same order can be asked for again
+    order = data.get('order', 'random')
+    if order not in ('random', 'sequential'):
+        return jsonify({"error": f"Unknown probe order: {order}"}), 400
+    seed = data.get('seed')
+    if seed is not None and (not isinstance(seed, int) or seed < 0 or order != 'random'):
+        return jsonify({"error": "seed must be a non-negative integer, with random order"}), 400
+    if seed is not None and mode == 'incremental':
+        return jsonify({"error": "Incremental scans probe last run's hosts first and don't take a seed"}), 400
+    if order == 'random' and seed is None and mode == 'full':
+        seed = new_seed()
     
     try:
-        # Parse the network
-        if not network_input:
-            network = parse_network()
-        else:
-            network = parse_network(network_input)
+        # A single network as before, or a TargetSet of merged targets minus exclusions
+        network = parse_targets(targets, exclude, data.get('interface'))
+        if isinstance(network, TargetSet) and (mode == 'incremental' or backend == 'arp'):
+            return jsonify({"error": "Incremental and arp scans take a single network"}), 400
         
-        # Start scan in background thread
-        scan_thread = threading.Thread(target=run_scan, args=(network,))
-        scan_thread.daemon = True
-        scan_thread.start()
+        job = scan_jobs.submit(network, {"backend": backend, "workers": workers, "mode": mode, "rate": rate,
+                                       "ports": ports or None, "seed": seed}, priority)
         
         return jsonify({
             "success": True,
-            "message": f"Scan started for {network}", 
-            "network": str(network)
+            "message": f"Scan {job.state} for {network}", 
+            "network": str(network),
+            "job_id": job.id,
+            "state": job.state,
+            "seed": seed
         })
     
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+@app.route('/api/scan/<int:job_id>')
+def get_scan_job(job_id):
+    """Get the status of one scan job"""
+    job = scan_jobs.get(job_id)
+    if job:
+        return jsonify(job.snapshot())
+    return jsonify({"error": "Job not found"}), 404
+
+@app.route('/api/scan/<int:job_id>', methods=['DELETE'])
+def cancel_scan_job(job_id):
+    """Cancel a queued or running scan job"""
+    job = scan_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if not job.status["running"]:
+        return jsonify({"error": f"Job already {job.state}"}), 400
+    scan_jobs.cancel(job_id)
+    return jsonify({"success": True, "message": f"Cancelling scan of {job.network}", "job_id": job_id})
+
+@app.route('/api/jobs')
+def list_scan_jobs():
+    """List queued, running and recently finished scan jobs"""
+    return jsonify(scan_jobs.list())
+
 def get_device_info(ip):
     """
     Get device information including hostname, MAC address, and device type
@@ -97,11 +206,7 @@ def get_device_info(ip):
     
     try:
         # Get hostname
-        try:
-            hostname = socket.gethostbyaddr(ip)[0]
-            device_info['hostname'] = hostname
-        except:
-            device_info['hostname'] = 'Unknown'
+        device_info['hostname'] = get_hostname(ip)
         
         # Get MAC address and vendor info
         mac_info = get_mac_address(ip)
@@ -121,524 +226,350 @@ def get_mac_address(ip):
     """
     Get MAC address using ARP table
     """
-    try:
-        import platform
-        system = platform.system().lower()
-        
-        if system == "windows":
-            # Use arp command on Windows
-            result = subprocess.run(['arp', '-a', ip], capture_output=True, text=True, timeout=5)
-            if result.returncode == 0:
-                # Parse Windows ARP output
-                lines = result.stdout.split('\n')
-                for line in lines:
-                    if ip in line:
-                        # Extract MAC address (format: xx-xx-xx-xx-xx-xx)
-                        mac_match = re.search(r'([0-9a-fA-F]{2}[-:]){5}[0-9a-fA-F]{2}', line)
-                        if mac_match:
-                            mac = mac_match.group(0).replace('-', ':').upper()
-                            vendor = get_vendor_from_mac(mac)
-                            return {'mac': mac, 'vendor': vendor}
-        else:
-            # Use arp command on Unix/Linux
-            result = subprocess.run(['arp', '-n', ip], capture_output=True, text=True, timeout=5)
-            if result.returncode == 0:
-                # Parse Unix ARP output
-                lines = result.stdout.split('\n')
-                for line in lines:
-                    if ip in line:
-                        # Extract MAC address
-                        mac_match = re.search(r'([0-9a-fA-F]{2}[:-]){5}[0-9a-fA-F]{2}', line)
-                        if mac_match:
-                            mac = mac_match.group(0).replace('-', ':').upper()
-                            vendor = get_vendor_from_mac(mac)
-                            return {'mac': mac, 'vendor': vendor}
-    except Exception as e:
-        print(f"Error getting MAC for {ip}: {e}")
+    mac = neighbor_cache.lookup(ip)
+    if mac:
+        return {'mac': mac, 'vendor': get_vendor_from_mac(mac)}
     
     return None
 
 def get_vendor_from_mac(mac):
     """
-    Get vendor information from MAC address OUI (first 3 octets)
+    Get vendor information from MAC address OUI (24, 28 or 36 bit prefix)
     """
-    # Common vendor OUI mappings (first 6 characters of MAC)
-    vendor_map = {
-        '00:50:56': 'VMware',
-        '08:00:27': 'VirtualBox',
-        '52:54:00': 'QEMU/KVM',
-        '00:0C:29': 'VMware',
-        '00:1C:42': 'Parallels',
-        '00:03:FF': 'Microsoft',
-        '00:15:5D': 'Microsoft Hyper-V',
-        '28:CD:C1': 'Apple',
-        '3C:07:54': 'Apple',
-        '88:E9:FE': 'Apple',
-        'DC:A6:32': 'Raspberry Pi',
-        'B8:27:EB': 'Raspberry Pi',
-        'E4:5F:01': 'Raspberry Pi',
-        '00:16:3E': 'Xen',
-        '00:1B:21': 'Intel',
-        '00:1F:16': 'Dell',
-        '00:14:22': 'Dell',
-        '70:B3:D5': 'TP-Link',
-        'EC:08:6B': 'TP-Link',
-        '50:C7:BF': 'TP-Link',
-        '00:1D:7E': 'Netgear',
-        '28:C6:8E': 'Netgear',
-        'A0:04:60': 'Netgear',
-        '00:26:F2': 'Netgear',
-        '00:90:A9': 'Western Digital',
-        '00:11:32': 'Synology',
-        '00:0D:B9': 'Netgear',
-        '20:4E:7F': 'Netgear',
-        '84:16:F9': 'TP-Link',
-        'C4:E9:84': 'TP-Link',
-        '98:DA:C4': 'TP-Link',
-        '00:23:CD': 'TP-Link',
-        '14:CC:20': 'TP-Link',
-        '50:D4:F7': 'TP-Link',
-        '74:DA:38': 'TP-Link',
-        '10:FE:ED': 'TP-Link',
-        '00:1E:58': 'WD My Book',
-        '00:90:A9': 'Western Digital',
-        '00:04:ED': 'Linksys',
-        '68:7F:74': 'Linksys',
-        '20:AA:4B': 'Linksys',
-        '48:F8:B3': 'Linksys',
-        '00:18:39': 'Cisco',
-        '00:1B:0D': 'Cisco',
-        '00:1C:58': 'Cisco',
-        '00:21:A0': 'Cisco',
-        '00:23:04': 'Cisco',
-        '00:25:45': 'Cisco',
-        '00:26:98': 'Cisco',
-        '00:30:F2': 'Cisco',
-        '00:40:96': 'Cisco',
-        '00:50:0F': 'Cisco',
-        '00:50:73': 'Cisco',
-        '00:60:2F': 'Cisco',
-        '00:60:3E': 'Cisco',
-        '00:60:47': 'Cisco',
-        '00:60:5C': 'Cisco',
-        '00:60:70': 'Cisco',
-        '00:60:83': 'Cisco',
-        '00:90:0C': 'Cisco',
-        '00:90:21': 'Cisco',
-        '00:90:2B': 'Cisco',
-        '00:90:86': 'Cisco',
-        '00:90:92': 'Cisco',
-        '00:90:AB': 'Cisco',
-        '00:90:B1': 'Cisco',
-        '00:90:F2': 'Cisco',
-        '00:A0:C9': 'Cisco',
-        '00:B0:64': 'Cisco',
-        '00:C0:1D': 'Cisco',
-        '00:D0:06': 'Cisco',
-        '00:D0:58': 'Cisco',
-        '00:D0:79': 'Cisco',
-        '00:D0:90': 'Cisco',
-        '00:D0:97': 'Cisco',
-        '00:D0:BA': 'Cisco',
-        '00:D0:BB': 'Cisco',
-        '00:D0:BC': 'Cisco',
-        '00:D0:C0': 'Cisco',
-        '00:D0:D3': 'Cisco',
-        '00:D0:E4': 'Cisco',
-        '00:D0:FF': 'Cisco',
-        '00:E0:14': 'Cisco',
-        '00:E0:1E': 'Cisco',
-        '00:E0:34': 'Cisco',
-        '00:E0:4F': 'Cisco',
-        '00:E0:A3': 'Cisco',
-        '00:E0:B0': 'Cisco',
-        '00:E0:F7': 'Cisco',
-        '00:E0:F9': 'Cisco',
-        '00:E0:FE': 'Cisco',
-        '08:CC:68': 'Cisco',
-        '10:8C:CF': 'Cisco',
-        '18:8B:45': 'Cisco',
-        '1C:DF:0F': 'Cisco',
-        '20:37:06': 'Cisco',
-        '28:C7:CE': 'Cisco',
-        '2C:36:F8': 'Cisco',
-        '34:A8:4E': 'Cisco',
-        '34:BD:C8': 'Cisco',
-        '38:ED:18': 'Cisco',
-        '3C:CE:73': 'Cisco',
-        '40:55:39': 'Cisco',
-        '44:AD:D9': 'Cisco',
-        '48:44:F7': 'Cisco',
-        '4C:4E:35': 'Cisco',
-        '50:06:04': 'Cisco',
-        '50:17:FF': 'Cisco',
-        '50:3D:E5': 'Cisco',
-        '54:78:1A': 'Cisco',
-        '58:97:1E': 'Cisco',
-        '5C:50:15': 'Cisco',
-        '60:73:5C': 'Cisco',
-        '64:00:F1': 'Cisco',
-        '64:16:8D': 'Cisco',
-        '64:A0:E7': 'Cisco',
-        '68:BC:0C': 'Cisco',
-        '6C:20:56': 'Cisco',
-        '6C:41:6A': 'Cisco',
-        '6C:9C:ED': 'Cisco',
-        '70:CA:9B': 'Cisco',
-        '74:26:AC': 'Cisco',
-        '78:BA:F9': 'Cisco',
-        '7C:95:F3': 'Cisco',
-        '80:E0:1D': 'Cisco',
-        '84:78:AC': 'Cisco',
-        '88:43:E1': 'Cisco',
-        '88:F0:31': 'Cisco',
-        '8C:60:4F': 'Cisco',
-        '90:E2:BA': 'Cisco',
-        '94:F4:3E': 'Cisco',
-        '98:FC:11': 'Cisco',
-        '9C:AF:CA': 'Cisco',
-        'A0:E0:AF': 'Cisco',
-        'A0:F8:49': 'Cisco',
-        'A4:0C:C3': 'Cisco',
-        'A4:6C:2A': 'Cisco',
-        'A4:93:4C': 'Cisco',
-        'A8:9D:21': 'Cisco',
-        'AC:A0:16': 'Cisco',
-        'B0:7D:47': 'Cisco',
-        'B4:14:89': 'Cisco',
-        'B8:38:61': 'Cisco',
-        'B8:BE:BF': 'Cisco',
-        'BC:16:65': 'Cisco',
-        'BC:67:1C': 'Cisco',
-        'C0:62:6B': 'Cisco',
-        'C4:0A:CB': 'Cisco',
-        'C4:64:13': 'Cisco',
-        'C8:00:84': 'Cisco',
-        'C8:9C:1D': 'Cisco',
-        'CC:EF:48': 'Cisco',
-        'D0:57:4C': 'Cisco',
-        'D4:8C:B5': 'Cisco',
-        'D4:A0:2A': 'Cisco',
-        'D8:B1:90': 'Cisco',
-        'DC:7B:94': 'Cisco',
-        'E0:2F:6D': 'Cisco',
-        'E4:AA:5D': 'Cisco',
-        'E8:04:0B': 'Cisco',
-        'E8:B7:48': 'Cisco',
-        'EC:44:76': 'Cisco',
-        'F0:25:72': 'Cisco',
-        'F0:29:29': 'Cisco',
-        'F4:4E:05': 'Cisco',
-        'F8:C2:88': 'Cisco',
-        'FC:99:47': 'Cisco'
-    }
-    
-    if mac and len(mac) >= 8:
-        oui = mac[:8]  # First 3 octets (XX:XX:XX)
-        return vendor_map.get(oui, 'Unknown Vendor')
-    
-    return 'Unknown Vendor'
+    return vendor_index.lookup(mac)
 
-def determine_device_type(ip, hostname, vendor):
+def determine_device_type(ip, hostname, vendor, open_ports=()):
     """
-    Determine device type based on IP, hostname, and vendor information
+    Determine device type based on IP, hostname, vendor and open ports
     """
-    hostname_lower = hostname.lower() if hostname != 'Unknown' else ''
-    vendor_lower = vendor.lower() if vendor != 'Unknown Vendor' else ''
-    
-    # Check if it's likely a router/gateway (usually .1 or .254)
-    ip_parts = ip.split('.')
-    last_octet = int(ip_parts[-1]) if ip_parts[-1].isdigit() else 0
-    
-    if last_octet in [1, 254]:
-        return '🌐 Router/Gateway'
-    
-    # Check by vendor
-    if any(x in vendor_lower for x in ['cisco', 'netgear', 'tp-link', 'linksys', 'd-link', 'asus']):
-        return '📡 Network Equipment'
-    
-    if any(x in vendor_lower for x in ['apple']):
-        if any(x in hostname_lower for x in ['iphone', 'ipad', 'ipod']):
-            return '📱 Mobile Device (iOS)'
-        elif any(x in hostname_lower for x in ['macbook', 'imac', 'mac']):
-            return '💻 Computer (Mac)'
-        else:
-            return '🍎 Apple Device'
-    
-    if any(x in vendor_lower for x in ['raspberry', 'pi']):
-        return '🥧 Raspberry Pi'
-    
-    if any(x in vendor_lower for x in ['vmware', 'virtualbox', 'qemu', 'parallels', 'hyper-v']):
-        return '🖥️ Virtual Machine'
-    
-    if any(x in vendor_lower for x in ['western digital', 'wd', 'synology', 'qnap']):
-        return '💾 Network Storage'
-    
-    # Check by hostname patterns
-    if any(x in hostname_lower for x in ['router', 'gateway', 'modem']):
-        return '🌐 Router/Gateway'
-    
-    if any(x in hostname_lower for x in ['printer', 'print', 'hp-', 'canon-', 'epson-']):
-        return '🖨️ Printer'
-    
-    if any(x in hostname_lower for x in ['camera', 'cam', 'security', 'nvr', 'dvr']):
-        return '📹 Security Camera'
-    
-    if any(x in hostname_lower for x in ['tv', 'roku', 'chromecast', 'firestick', 'appletv']):
-        return '📺 Smart TV/Streaming'
-    
-    if any(x in hostname_lower for x in ['phone', 'mobile', 'android', 'iphone', 'samsung']):
-        return '📱 Mobile Device'
-    
-    if any(x in hostname_lower for x in ['laptop', 'desktop', 'pc', 'computer', 'workstation']):
-        return '💻 Computer'
-    
-    if any(x in hostname_lower for x in ['server', 'srv', 'nas', 'storage']):
-        return '🖥️ Server'
-    
-    if any(x in hostname_lower for x in ['switch', 'hub', 'access-point', 'ap-']):
-        return '📡 Network Equipment'
-    
-    if any(x in hostname_lower for x in ['iot', 'smart', 'alexa', 'google-home', 'nest']):
-        return '🏠 Smart Home Device'
-    
-    # Default based on common IP ranges
-    if last_octet < 50:
-        return '🌐 Network Infrastructure'
-    elif last_octet > 200:
-        return '📱 Mobile/Temporary Device'
+    return classify(ip, hostname, vendor, open_ports)
+
+def scan_chunks(network, backend="auto", workers=1, incremental=None, concurrency=None, cancel=None, rate=None,
+                macs=None, methods=None, seed=None, budget=None):
+    """
+    Yield (addresses scanned, online IPs) as the scan progresses.
+    With more than one worker the network is sharded across processes and
+    each chunk is a whole shard; otherwise each chunk is a batch of probes
+    that finished together. Incremental scans always run in this process,
+    one probe per chunk.
+    concurrency is the most probes the scan may have in flight and rate its
+    probes per second, both split between workers; every probe also holds
+    a slot of `budget`, the ProbeBudget shared by all running jobs.
+    The arp backend always runs in this process and puts the MAC address
+    of every host it finds into `macs`. The liveness method that found each
+    host, when known, goes into `methods`.
+    With a seed, full scans probe in that seeded random order.
+    """
+    from netscan import DEFAULT_CONCURRENCY
+    concurrency = concurrency or DEFAULT_CONCURRENCY
+    if backend == "arp":
+        from arp_sweep import iter_arp_sweep, ARP_RATE
+        for sent, found in iter_arp_sweep(network, rate=rate or ARP_RATE, cancel=cancel):
+            macs.update(found)
+            methods.update((ip, "arp") for ip, _ in found)
+            yield sent, [ip for ip, _ in found]
+    elif incremental:
+        for ip, is_online in incremental.probe(backend, concurrency=concurrency, cancel=cancel, rate=rate,
+                                               budget=budget):
+            if isinstance(is_online, str):
+                methods[ip] = is_online
+            yield 1, ([ip] if is_online else [])
+    elif workers > 1:
+        from netscan import iter_shard_results
+        for scanned, online, found_by in iter_shard_results(network, workers, backend, max(1, concurrency // workers),
+                                                            cancel, rate, seed, budget):
+            methods.update(found_by)
+            yield scanned, online
     else:
-        return '💻 Computer/Device'
-
-def run_scan(network):
-    """Run the actual scan in background with progress tracking and hostname resolution"""
-    scan_status["running"] = True
-    scan_status["current_scan"] = str(network)
-    scan_status["progress"] = 0
-    scan_status["scanned_hosts"] = 0
-    scan_status["found_hosts"] = 0
-    
-    # Calculate total hosts
-    total_hosts = network.num_addresses - 2  # Exclude network and broadcast
-    scan_status["total_hosts"] = total_hosts
+        from netscan import probe_host_batches, scan_addresses
+        for batch in probe_host_batches(scan_addresses(network, seed), backend, concurrency, cancel=cancel,
+                                        rate=rate, budget=budget):
+            online = [ip for ip, is_online in batch if is_online]
+            if backend == "multi":
+                methods.update((ip, is_online) for ip, is_online in batch if is_online)
+            yield len(batch), online
+
+def build_host_record(ip, hostname, mac_address=None, liveness=None):
+    """
+    Look up MAC (unless the sweep already found it) and device type for an online host.
+    liveness is the probe method that found the host, if known.
+    """
+    # Get MAC address
+    mac_address = mac_address or get_mac_address_simple(ip)
+    
+    # Get vendor from the MAC prefix
+    vendor = get_vendor_from_mac(mac_address) if mac_address != 'Unknown' else 'Unknown'
+    
+    # Get device type from everything we know about the host
+    device_type = determine_device_type(ip, hostname, vendor)
+    
+    return {
+        'ip': ip,
+        'hostname': hostname,
+        'mac_address': mac_address,
+        'device_type': device_type,
+        'vendor': vendor,
+        'liveness': liveness
+    }
+
+def run_scan(job):
+    """
+    Run one scan job with progress tracking and hostname resolution.
+    Called on the job's own thread by the scheduler.
+    """
+    network = job.network
+    backend = job.options.get("backend", "auto")
+    workers = job.options.get("workers", 1)
+    mode = job.options.get("mode", "full")
+    ports = job.options.get("ports")
+    progress = job.progress
+    neighbor_cache.invalidate()
     
     start_time = datetime.now()
+    scan_id = None
     
     try:
-        # Scan with hostname resolution
-        online_hosts = []
+        incremental = IncrementalScan(result_store, network) if mode == 'incremental' else None
         
-        import concurrent.futures
-        from netscan import ping
+        # Calculate total hosts
+        if incremental:
+            total_hosts = incremental.planned()  # Backed-off dead addresses are left out
+        else:
+            total_hosts = count_hosts(network)
+        progress.start(total_hosts)
         
-        with concurrent.futures.ThreadPoolExecutor(max_workers=50) as executor:
-            futures = {executor.submit(ping, ip): ip for ip in network.hosts()}
-            
-            for future in concurrent.futures.as_completed(futures):
+        scan_id = result_store.create_scan(str(network), start_time.strftime("%Y-%m-%d %H:%M:%S"), mode)
+        job.status["scan_id"] = scan_id
+        job.status["stage"] = "discovery"
+        
+        # Host records are written to the store in batches as the scan goes
+        pending_writes = []
+        total_found = 0
+        
+        # Hostname lookups run concurrently while the sweep goes on
+        resolving = []
+        # MACs found by the sweep itself (arp backend), and how each host was found
+        macs = {}
+        methods = {}
+        
+        def add_resolved_hosts(wait=False):
+            nonlocal total_found
+            # Hosts go out as their lookups finish or time out, whatever order they were found in
+            for ip, hostname in hostname_resolver.collect(resolving, wait):
                 try:
-                    result = future.result()
-                    scan_status["scanned_hosts"] += 1
-                    scan_status["progress"] = int((scan_status["scanned_hosts"] / total_hosts) * 100)
-                    
-                    if result:
-                        # Get hostname for the IP
-                        hostname = get_hostname(result)
-                        
-                        # Get MAC address
-                        mac_address = get_mac_address_simple(result)
-                        
-                        # Get basic device info
-                        device_type = determine_basic_device_type(result, hostname)
-                        
-                        host_data = {
-                            'ip': result,
-                            'hostname': hostname,
-                            'mac_address': mac_address,
-                            'device_type': device_type,
-                            'vendor': 'Unknown'
-                        }
-                        online_hosts.append(host_data)
-                        scan_status["found_hosts"] += 1
-                        print(f"Found device: {result} ({hostname}) - {device_type}")
-                        
+                    host_data = build_host_record(ip, hostname, macs.get(ip), methods.get(ip))
+                    pending_writes.append(host_data)
+                    total_found += 1
+                    job.events.publish("host", host_data)
+                    print(f"Found device: {ip} ({host_data['hostname']}) - {host_data['device_type']}")
                 except Exception as e:
                     print(f"Error scanning host: {e}")
-                    scan_status["scanned_hosts"] += 1
-                    scan_status["progress"] = int((scan_status["scanned_hosts"] / total_hosts) * 100)
-                    continue
+            if pending_writes and (wait or len(pending_writes) >= HOST_WRITE_BATCH):
+                with STORE_SECONDS.time():
+                    result_store.add_hosts(scan_id, pending_writes)
+                pending_writes.clear()
+        
+        with DISCOVERY_SECONDS.time():
+            for scanned, online in scan_chunks(network, backend, workers, incremental, job.concurrency,
+                                               job.cancel_event, job.options.get("rate"), macs, methods,
+                                               job.options.get("seed"), job.budget):
+                progress.add(scanned, len(online))
+                resolving.extend(hostname_resolver.submit(ip) for ip in online)
+                add_resolved_hosts()
+            
+            add_resolved_hosts(wait=True)
+        
+        if ports and not job.cancelled:
+            # Port scan the hosts that answered, then classify them again with their open ports
+            job.status["stage"] = "ports"
+            with PORTS_SECONDS.time():
+                hosts = result_store.get_host_table(scan_id)
+                open_ports = scan_ports(hosts.ip_strings(), ports, job.concurrency, cancel=job.cancel_event,
+                                        budget=job.budget)
+                for host in hosts:
+                    host['open_ports'] = open_ports.get(host.ip, [])
+                result_store.set_open_ports(scan_id, classify_hosts(hosts))
+            print(f"Port scan: {sum(map(len, open_ports.values()))} open ports on {len(open_ports)} hosts")
+        
+        if job.cancelled:
+            metrics.scans_finished("cancelled").inc()
+            result_store.fail_scan(scan_id, "Scan cancelled")
+            print(f"Scan cancelled: {total_found} hosts found before cancelling")
+            return
         
         # Store results
         end_time = datetime.now()
         duration = (end_time - start_time).total_seconds()
         
-        # Sort by IP address
-        online_hosts.sort(key=lambda x: tuple(map(int, x['ip'].split('.'))))
+        result_store.finish_scan(scan_id, f"{duration:.1f}s", total_found, total_hosts)
+        metrics.scans_finished("completed").inc()
         
-        scan_result = {
-            "id": len(scan_results) + 1,
-            "network": str(network),
-            "timestamp": start_time.strftime("%Y-%m-%d %H:%M:%S"),
-            "duration": f"{duration:.1f}s",
-            "hosts": online_hosts,
-            "total_found": len(online_hosts),
-            "total_scanned": total_hosts
-        }
-        
-        scan_results.append(scan_result)
-        print(f"Scan completed: {len(online_hosts)} hosts found")
+        if incremental:
+            incremental.commit()
+            diff = incremental.diff(result_store.get_host_table(scan_id))
+            result_store.set_diff(scan_id, diff)
+            print(f"Changes: {len(diff['new'])} new, {len(diff['gone'])} gone, {len(diff['changed'])} changed")
+        print(f"Scan completed: {total_found} hosts found")
         
     except Exception as e:
         print(f"Scan error: {e}")
-        error_result = {
-            "id": len(scan_results) + 1,
-            "error": str(e),
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "network": str(network)
-        }
-        scan_results.append(error_result)
+        metrics.scans_finished("failed").inc()
+        if scan_id is None:
+            scan_id = result_store.create_scan(str(network), datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        result_store.fail_scan(scan_id, str(e))
+        raise  # The scheduler marks the job failed
     
     finally:
-        scan_status["running"] = False
-        scan_status["current_scan"] = None
-        scan_status["progress"] = 100
+        progress.finish()
+        SCAN_SECONDS.observe((datetime.now() - start_time).total_seconds())
+
+# Scans run as jobs: several at once, sharing one probe budget, the rest queued
+scan_jobs = JobScheduler(run_scan)
+metrics.registry.gauge("netscan_jobs", "Scan jobs by state", lambda: len(scan_jobs.running), state="running")
+metrics.registry.gauge("netscan_jobs", "Scan jobs by state", lambda: len(scan_jobs.waiting), state="queued")
+metrics.registry.gauge("netscan_dns_cache_entries", "Reverse DNS answers cached", lambda: len(hostname_resolver.cache))
+
+def current_status(job_id=None):
+    """Status of the given job, or of the most recent one"""
+    job = scan_jobs.get(job_id) if job_id else scan_jobs.latest()
+    return job.snapshot() if job else dict(idle_status)
 
+@MAC_LOOKUP_SECONDS.time()
 def get_mac_address_simple(ip):
     """Get MAC address using ARP table - simplified version"""
-    try:
-        import platform
-        system = platform.system().lower()
-        
-        if system == "windows":
-            # Use arp command on Windows
-            result = subprocess.run(['arp', '-a', ip], capture_output=True, text=True, timeout=3)
-            if result.returncode == 0:
-                # Parse Windows ARP output
-                lines = result.stdout.split('\n')
-                for line in lines:
-                    if ip in line:
-                        # Extract MAC address (format: xx-xx-xx-xx-xx-xx)
-                        mac_match = re.search(r'([0-9a-fA-F]{2}[-:]){5}[0-9a-fA-F]{2}', line)
-                        if mac_match:
-                            return mac_match.group(0).replace('-', ':').upper()
-        else:
-            # Use arp command on Unix/Linux
-            result = subprocess.run(['arp', '-n', ip], capture_output=True, text=True, timeout=3)
-            if result.returncode == 0:
-                # Parse Unix ARP output
-                lines = result.stdout.split('\n')
-                for line in lines:
-                    if ip in line:
-                        # Extract MAC address
-                        mac_match = re.search(r'([0-9a-fA-F]{2}[:-]){5}[0-9a-fA-F]{2}', line)
-                        if mac_match:
-                            return mac_match.group(0).replace('-', ':').upper()
-    except Exception as e:
-        print(f"Error getting MAC for {ip}: {e}")
-    
-    return 'Unknown'
+    return neighbor_cache.lookup(ip) or 'Unknown'
 
+@HOSTNAME_SECONDS.time()
 def get_hostname(ip):
     """Get hostname for an IP address"""
-    try:
-        hostname = socket.gethostbyaddr(ip)[0]
-        return hostname if hostname != ip else 'Unknown'
-    except:
-        return 'Unknown'
+    return hostname_resolver.lookup(ip)
 
 def determine_basic_device_type(ip, hostname):
     """Determine basic device type based on IP and hostname"""
-    hostname_lower = hostname.lower() if hostname != 'Unknown' else ''
-    
-    # Check if it's likely a router/gateway (usually .1 or .254)
-    ip_parts = ip.split('.')
-    last_octet = int(ip_parts[-1]) if ip_parts[-1].isdigit() else 0
-    
-    if last_octet in [1, 254]:
-        return '🌐 Router/Gateway'
-    
-    # Check by hostname patterns
-    if any(x in hostname_lower for x in ['router', 'gateway', 'modem']):
-        return '🌐 Router/Gateway'
-    
-    if any(x in hostname_lower for x in ['printer', 'print', 'hp-', 'canon-', 'epson-']):
-        return '🖨️ Printer'
-    
-    if any(x in hostname_lower for x in ['camera', 'cam', 'security', 'nvr', 'dvr']):
-        return '📹 Security Camera'
-    
-    if any(x in hostname_lower for x in ['tv', 'roku', 'chromecast', 'firestick', 'appletv']):
-        return '📺 Smart TV/Streaming'
-    
-    if any(x in hostname_lower for x in ['phone', 'mobile', 'android', 'iphone', 'samsung']):
-        return '📱 Mobile Device'
-    
-    if any(x in hostname_lower for x in ['laptop', 'desktop', 'pc', 'computer', 'workstation']):
-        return '💻 Computer'
-    
-    if any(x in hostname_lower for x in ['server', 'srv', 'nas', 'storage']):
-        return '🖥️ Server'
-    
-    if any(x in hostname_lower for x in ['switch', 'hub', 'access-point', 'ap-']):
-        return '📡 Network Equipment'
-    
-    if any(x in hostname_lower for x in ['iot', 'smart', 'alexa', 'google-home', 'nest']):
-        return '🏠 Smart Home Device'
-    
-    # Check for common hostname patterns
-    if 'win' in hostname_lower or 'windows' in hostname_lower:
-        return '💻 Windows Computer'
-    
-    if 'mac' in hostname_lower or 'apple' in hostname_lower:
-        return '💻 Mac Computer'
-    
-    if 'ubuntu' in hostname_lower or 'linux' in hostname_lower:
-        return '💻 Linux Computer'
-    
-    # Default based on common IP ranges
-    if last_octet < 50:
-        return '🌐 Network Infrastructure'
-    elif last_octet > 200:
-        return '📱 Mobile/Temporary Device'
-    else:
-        return '💻 Computer/Device'
+    return classify(ip, hostname)
 
 @app.route('/api/status')
 def get_status():
-    """Get current scan status"""
-    return jsonify(scan_status)
+    """Get the status of one scan job (?job=<id>), or of the most recent one"""
+    job_id = request.args.get('job', type=int)
+    if job_id and not scan_jobs.get(job_id):
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(current_status(job_id))
+
+@app.route('/api/stream')
+def stream_status():
+    """Push a job's progress and newly found hosts as Server-Sent Events (?job=<id>, default latest)"""
+    job_id = request.args.get('job', type=int)
+    job = scan_jobs.get(job_id) if job_id else scan_jobs.latest()
+    if job is None:
+        if job_id:
+            return jsonify({"error": "Job not found"}), 404
+        return Response(
+            coalesced_stream(EventHub(), lambda: dict(idle_status)),
+            mimetype='text/event-stream'
+        )
+    return Response(
+        coalesced_stream(job.events, job.snapshot),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def page_args(default_limit=10, max_limit=500):
+    """Read limit/offset query parameters for paginated routes"""
+    limit = min(max(request.args.get('limit', default_limit, type=int), 1), max_limit)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    return limit, offset
+
+def host_filters():
+    """Read the host filter query parameters (device_type, vendor, ip, hostname)"""
+    return {key: request.args[key] for key in HOST_FILTERS if request.args.get(key)}
+
+def wants_summary():
+    return request.args.get('summary', '').lower() in ('1', 'true', 'yes')
 
 @app.route('/api/results')
 def get_results():
-    """Get all scan results"""
-    return jsonify(scan_results)
+    """
+    Get a page of scan results (newest page by default, oldest first within it).
+    ?before=<scan id> continues from the X-Next-Cursor of the previous page;
+    ?summary=1 leaves out the hosts.
+    """
+    limit, offset = page_args()
+    before = request.args.get('before', type=int)
+    scans = result_store.list_scans(limit, offset, include_hosts=not wants_summary(), before=before)
+    response = jsonify(list(reversed(scans)))
+    response.headers['X-Total-Count'] = str(result_store.count_scans())
+    if len(scans) == limit:
+        response.headers['X-Next-Cursor'] = str(scans[-1]['id'])
+    return response
 
 @app.route('/api/results/<int:scan_id>')
 def get_scan_result(scan_id):
-    """Get specific scan result"""
-    for result in scan_results:
-        if result.get('id') == scan_id:
-            return jsonify(result)
+    """Get specific scan result, its hosts narrowed by any host filters (?summary=1 for none)"""
+    try:
+        result = result_store.get_scan(scan_id, include_hosts=not wants_summary(), filters=host_filters())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if result:
+        return jsonify(result)
     return jsonify({"error": "Scan not found"}), 404
 
+@app.route('/api/results/<int:scan_id>/hosts')
+def get_scan_hosts(scan_id):
+    """
+    Get a page of hosts from one scan, in IP order.
+    ?after=<ip> continues from the X-Next-Cursor of the previous page;
+    device_type, vendor, ip (CIDR or first-last) and hostname (glob) filter them.
+    """
+    if not result_store.get_scan(scan_id, include_hosts=False):
+        return jsonify({"error": "Scan not found"}), 404
+    limit, offset = page_args(default_limit=100, max_limit=5000)
+    filters = host_filters()
+    try:
+        hosts = result_store.get_hosts(scan_id, limit, offset, request.args.get('after'), filters)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    response = jsonify(hosts)
+    response.headers['X-Total-Count'] = str(result_store.count_hosts(scan_id, filters))
+    if len(hosts) == limit:
+        response.headers['X-Next-Cursor'] = hosts[-1]['ip']
+    return response
+
 @app.route('/api/clear', methods=['POST'])
 def clear_results():
     """Clear all scan results"""
-    global scan_results
-    scan_results = []
+    result_store.clear()
     return jsonify({"success": True, "message": "Results cleared"})
 
 @app.route('/api/export/<int:scan_id>')
 def export_result(scan_id):
-    """Export scan result as JSON"""
-    for result in scan_results:
-        if result.get('id') == scan_id:
-            from flask import Response
-            return Response(
-                json.dumps(result, indent=2),
-                mimetype='application/json',
-                headers={'Content-Disposition': f'attachment; filename=netscan_{scan_id}.json'}
-            )
-    return jsonify({"error": "Scan not found"}), 404
+    """
+    Export a scan as ?format=json (default), ndjson or csv, optionally
+    narrowed by host filters. The file is streamed a chunk of hosts at a time.
+    """
+    export_format = request.args.get('format', 'json')
+    if export_format not in EXPORTERS:
+        return jsonify({"error": f"format must be one of {', '.join(EXPORTERS)}"}), 400
+    result = result_store.get_scan(scan_id, include_hosts=False)
+    if not result:
+        return jsonify({"error": "Scan not found"}), 404
+    filters = host_filters()
+    try:
+        result_store.count_hosts(scan_id, filters)  # Reject a bad filter before streaming starts
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    hosts = None if 'error' in result else result_store.iter_hosts(scan_id, filters)
+    mimetype, extension = FORMATS[export_format]
+    return Response(
+        EXPORTERS[export_format](result, hosts),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=netscan_{scan_id}.{extension}'}
+    )
+
+@app.route('/metrics')
+def get_metrics():
+    """Probe counters and stage timings in the Prometheus text format"""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     # Create templates and static directories if they don't exist